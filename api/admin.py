@@ -7,3 +7,15 @@ from .models import TourPackage, TourBooking
 
 admin.site.register(TourPackage)
 admin.site.register(TourBooking)
+from .models import SeatHold
+
+admin.site.register(SeatHold)
+from .models import BookingSummary
+
+admin.site.register(BookingSummary)
+from .models import UploadSession
+
+admin.site.register(UploadSession)
+from .models import MediaBlob
+
+admin.site.register(MediaBlob)
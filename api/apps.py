@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
-    label = 'custom_api' 
\ No newline at end of file
+    label = 'custom_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,169 @@
+"""
+Async implementations of the read-heavy endpoints for ASGI deployments.
+
+Each view serves GET with the async ORM and hands every other method to the
+synchronous DRF view it replaces, so writes, OPTIONS and validation keep
+their existing behaviour. They are routed in front of the synchronous views
+when ``settings.ASYNC_READ_VIEWS`` is enabled.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import RequestScopedJWTAuthentication
+from .catalog_cache import cached_page, store_page
+from .conditional import (ahotel_catalog_validators, atour_catalog_validators, atour_validators, not_modified,
+                          set_validators)
+from .fieldsets import get_fieldset, keyset_columns, required_columns, sparse_queryset
+from .models import Hotel, TourPackage
+from .pagination import AsyncCatalogPagination
+from .serializers import HotelSerializer, TourDetailSerializer, tour_detail_projection
+from .views import HotelViewSet, TourDetailViewSet, tour_detail_user
+
+jwt_auth = RequestScopedJWTAuthentication()
+json_renderer = JSONRenderer()
+
+
+def render_json(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(
+        json_renderer.render(data),
+        content_type=json_renderer.media_type,
+        status=status_code,
+        headers=headers,
+    )
+
+
+def error_response(exc):
+    """Render an APIException the way DRF's exception handler does"""
+    headers = {}
+    status_code = exc.status_code
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        headers['WWW-Authenticate'] = jwt_auth.authenticate_header(None)
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return render_json(data, status_code, headers)
+
+
+async def arequire_user(request):
+    """Return the JWT user for the request or raise NotAuthenticated"""
+    result = await jwt_auth.aauthenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    request.jwt_auth = result
+    return result[0]
+
+
+def delegate_writes(sync_view):
+    """Serve GET natively and hand every other method to ``sync_view``"""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            try:
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                return error_response(exc)
+        return wrapper
+    return decorator
+
+
+def tour_detail_queryset():
+    """Tour packages with their booked seats computed in the main query"""
+    return TourPackage.objects.with_availability()
+
+
+async def aget_tour(tracking_id):
+    try:
+        return await tour_detail_queryset().aget(tracking_id=tracking_id)
+    except (TourPackage.DoesNotExist, ValidationError, ValueError):
+        return None
+
+
+@delegate_writes(TourDetailViewSet.as_view({'get': 'list'}))
+async def tour_detail_list(request):
+    """Async TourDetailViewSet.list"""
+    response = cached_page(request)
+    if response is not None:
+        return response
+    validators = await atour_catalog_validators(request)
+    response = not_modified(request, validators)
+    if response is None:
+        fields = get_fieldset(request, TourDetailSerializer, TourDetailViewSet.lean_fields)
+        context = {'request': request, 'fields': fields}
+        paginator = AsyncCatalogPagination()
+        if settings.FAST_LIST_SERIALIZERS:
+            rows = await paginator.apaginate_queryset(
+                tour_detail_projection.values(tour_detail_queryset(), fields, extra=keyset_columns(TourDetailViewSet)),
+                request, TourDetailViewSet,
+            )
+            data = tour_detail_projection.serialize(rows, context)
+        else:
+            queryset = sparse_queryset(
+                tour_detail_queryset(), TourDetailSerializer, fields, required_columns(TourDetailViewSet)
+            )
+            tours = await paginator.apaginate_queryset(queryset, request, TourDetailViewSet)
+            data = TourDetailSerializer(tours, many=True, context=context).data
+        response = set_validators(render_json(paginator.get_paginated_data(data)), validators)
+    return store_page(request, response)
+
+
+@delegate_writes(TourDetailViewSet.as_view({'get': 'retrieve'}))
+async def tour_detail_retrieve(request, tracking_id):
+    """Async TourDetailViewSet.retrieve"""
+    validators = await atour_validators(request, tracking_id)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    tour = await aget_tour(tracking_id)
+    if tour is None:
+        raise NotFound('No TourPackage matches the given query.')
+    serializer = TourDetailSerializer(tour, context={'request': request})
+    return set_validators(render_json(serializer.data), validators)
+
+
+@delegate_writes(tour_detail_user)
+async def tour_detail_user_async(request, tracking_id):
+    """Async tour_detail_user"""
+    await arequire_user(request)
+    validators = await atour_validators(request, tracking_id)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    tour = await aget_tour(tracking_id)
+    if tour is None:
+        return render_json({'error': 'Tour package not found'}, status.HTTP_404_NOT_FOUND)
+    serializer = TourDetailSerializer(tour)
+    return set_validators(render_json(serializer.data), validators)
+
+
+@delegate_writes(HotelViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def hotel_list(request):
+    """Async HotelViewSet.list"""
+    await arequire_user(request)
+    queryset = Hotel.objects.all()
+    country = request.GET.get('country')
+    name = request.GET.get('name')
+
+    if country:
+        queryset = queryset.filter(hotel_country__icontains=country)
+    if name:
+        queryset = queryset.filter(hotel_name__icontains=name)
+
+    validators = await ahotel_catalog_validators(request, queryset)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    fields = get_fieldset(request, HotelSerializer, HotelViewSet.lean_fields)
+    queryset = sparse_queryset(queryset, HotelSerializer, fields, required_columns(HotelViewSet))
+    paginator = AsyncCatalogPagination()
+    hotels = await paginator.apaginate_queryset(queryset, request, HotelViewSet)
+    serializer = HotelSerializer(hotels, many=True, context={'request': request, 'fields': fields})
+    return set_validators(render_json(paginator.get_paginated_data(serializer.data)), validators)
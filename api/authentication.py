@@ -0,0 +1,84 @@
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .revocation import get_revocation_index
+
+
+class RevokedToken(InvalidToken):
+    default_detail = _("Token has been revoked")
+    default_code = "token_revoked"
+
+
+class RequestScopedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that reuses the result of PointDeductionMiddleware.
+
+    The middleware already validates the Bearer token and loads the user, and
+    stores both on the request as ``jwt_auth``. Reusing them saves a second
+    signature check and a second user lookup per request. Requests the
+    middleware did not authenticate fall back to the normal JWT flow.
+    """
+    def authenticate(self, request):
+        cached = getattr(request._request, 'jwt_auth', None)
+        if cached is not None:
+            return cached
+        get_revocation_index().refresh_if_due()
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        """
+        Validate the token and reject it if it has been revoked. Only the
+        in-memory revocation index is consulted here; callers refresh it.
+        """
+        validated_token = super().get_validated_token(raw_token)
+        if get_revocation_index().is_revoked(validated_token):
+            raise RevokedToken()
+        return validated_token
+
+    async def aauthenticate(self, request):
+        """
+        Async version of authenticate for plain Django async views, which
+        receive an HttpRequest rather than a DRF Request.
+        """
+        cached = getattr(request, 'jwt_auth', None)
+        if cached is not None:
+            return cached
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        index = get_revocation_index()
+        if index.refresh_due():
+            await sync_to_async(index.refresh)()
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """Async version of get_user using the async ORM"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
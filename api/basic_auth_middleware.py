@@ -1,33 +1,59 @@
 import base64
-from django.contrib.auth import authenticate, get_user_model
-from django.http import HttpResponse
-from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .credential_cache import aauthenticate_basic, authenticate_basic
 
 class BasicAuthenticationMiddleware:
     """
     Middleware to authenticate requests using HTTP Basic Authentication.
+    Runs natively under both WSGI and ASGI.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def get_credentials(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION')
-
         if auth_header and auth_header.startswith('Basic '):
-            try:
-                auth_decoded = base64.b64decode(auth_header[6:]).decode('utf-8')
-                username, password = auth_decoded.split(':', 1)
-                user = authenticate(request, username=username, password=password)
-
-                user = authenticate(request, username=username, password=password)
-
-                if user is not None and user.is_superuser:
-                    request.user = user
-                else:
-                    request.user = None  # Set user to None if authentication fails
-                    return self.get_response(request)
-            except Exception:
-                request.user = None # Set user to None if authentication fails
-                return self.get_response(request)
+            auth_decoded = base64.b64decode(auth_header[6:]).decode('utf-8')
+            return auth_decoded.split(':', 1)
+        return None
+
+    def set_user(self, request, user):
+        # Keep the result so views never authenticate the credentials again
+        request.basic_auth_user = user
+
+        if user is not None and user.is_superuser:
+            request.user = user
+        else:
+            request.user = None  # Set user to None if authentication fails
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        try:
+            credentials = self.get_credentials(request)
+            if credentials:
+                username, password = credentials
+                user = authenticate_basic(request, username=username, password=password)
+                self.set_user(request, user)
+        except Exception:
+            request.user = None # Set user to None if authentication fails
 
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        try:
+            credentials = self.get_credentials(request)
+            if credentials:
+                username, password = credentials
+                user = await aauthenticate_basic(request, username=username, password=password)
+                self.set_user(request, user)
+        except Exception:
+            request.user = None # Set user to None if authentication fails
+
+        return await self.get_response(request)
@@ -0,0 +1,178 @@
+"""
+Content-addressed media storage.
+
+``ContentAddressedStorage`` stores every file under the SHA-256 of its bytes
+(``blobs/ab/ab12...ef.jpg``) whatever name it was uploaded with, so the same
+image uploaded for many hotels or tours is kept once. Each ``save()`` adds a
+reference to the blob and each ``delete()`` drops one; files are only
+removed by ``collect_garbage`` once nothing has referenced them for
+MEDIA_BLOB_GC_GRACE seconds. A blob's URL changes whenever its bytes do, so
+media_views.serve_blob can let clients cache it forever.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MediaBlob
+
+BLOB_DIR = 'blobs'
+BLOB_NAME = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(\.[a-z0-9]{{1,10}})?$')
+
+
+def blob_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', ext):
+        ext = ''
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def blob_digest(name):
+    """The SHA-256 a blob name carries, or None for any other name"""
+    match = BLOB_NAME.match(name or '')
+    return match['digest'] if match else None
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by content hash and reference counts
+    them in MediaBlob. Names outside ``blobs/`` (files stored before the
+    switch) are still opened, served and deleted as plain files.
+    """
+    def get_available_name(self, name, max_length=None):
+        # _save picks the name from the content; identical content shares it
+        return name
+
+    def _save(self, name, content):
+        digest, size = content_digest(content)
+        name = blob_name(digest, name)
+        with transaction.atomic():
+            # Within one transaction with the row so a concurrent collect_garbage
+            # either sees the new reference or has already removed the file
+            blob, _ = MediaBlob.objects.get_or_create(digest=digest, defaults={'name': name, 'size': size})
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+            if not self.exists(blob.name):
+                self._write_blob(blob.name, content)
+        return blob.name
+
+    def _write_blob(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            # Written aside and renamed, so a reader never sees half a blob
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as temp:
+                    for chunk in content.chunks():
+                        temp.write(chunk)
+                os.replace(temp_path, full_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def delete(self, name):
+        """Drop one reference to a blob; the file stays until collect_garbage"""
+        digest = blob_digest(name)
+        if digest is None:
+            return super().delete(name)
+        MediaBlob.objects.filter(digest=digest, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now()
+        )
+
+
+def referenced_blobs():
+    """``Counter`` of the blob names the image fields and their variant maps hold"""
+    from .images import IMAGE_FIELDS, variant_files
+
+    counts = Counter()
+    for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+        for name, variants in model.objects.values_list(image_field, variants_field).iterator():
+            counts.update(n for n in (name, *variant_files(variants)) if blob_digest(n))
+    return counts
+
+
+def recount_references():
+    """
+    Reset every refcount to the references actually held in the database,
+    repairing drift from files assigned by name or lost deletes. Returns the
+    number of blobs whose count changed.
+    """
+    counts = referenced_blobs()
+    changed = 0
+    for blob in MediaBlob.objects.only('pk', 'name', 'refcount').iterator():
+        if blob.refcount != counts[blob.name]:
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=counts[blob.name], updated_at=timezone.now())
+            changed += 1
+    return changed
+
+
+def collect_garbage(storage, grace=None, dry_run=False):
+    """
+    Remove blobs nobody has referenced for ``grace`` seconds, and blob files
+    with no MediaBlob row (left by rolled-back saves) as old as that.
+    Returns ``(files removed, bytes freed)``.
+    """
+    grace = settings.MEDIA_BLOB_GC_GRACE if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    referenced = referenced_blobs()
+    removed = freed = 0
+
+    for blob in MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).iterator():
+        if referenced[blob.name]:
+            continue  # a name assigned without save(); recount_references fixes its count
+        if dry_run:
+            removed, freed = removed + 1, freed + blob.size
+            continue
+        with transaction.atomic():
+            deleted, _ = MediaBlob.objects.filter(pk=blob.pk, refcount__lte=0, updated_at__lt=cutoff).delete()
+            if deleted:
+                remove_file(storage.path(blob.name))
+        if deleted:
+            removed, freed = removed + 1, freed + blob.size
+
+    root = storage.path(BLOB_DIR)
+    known = set(MediaBlob.objects.values_list('digest', flat=True))
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            digest = blob_digest(name)
+            if digest in known or referenced[name] or os.path.getmtime(path) >= cutoff.timestamp():
+                continue
+            removed, freed = removed + 1, freed + os.path.getsize(path)
+            if not dry_run:
+                remove_file(path)
+    return removed, freed
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,365 @@
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import (Case, Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery,
+                              Sum, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework import status
+
+from .catalog_cache import catalog_changed
+from .models import BookingSummary, SeatHold, TourBooking, TourPackage
+
+User = get_user_model()
+
+
+class BookingError(Exception):
+    """Raised when a booking cannot be made; carries the API error message"""
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class BookingFailed(BookingError):
+    """Raised when an all-or-nothing batch booking fails; carries per-item results"""
+    def __init__(self, results):
+        super().__init__('No bookings were made because at least one item failed.')
+        self.results = results
+
+
+def bookings_changed():
+    """
+    Update kwargs recording a change to a package's bookings or seats. The
+    version and timestamp feed the conditional GET validators.
+    """
+    return {'booking_version': F('booking_version') + 1, 'bookings_updated_at': timezone.now()}
+
+
+def claim_seats(package_id, num_travelers):
+    """
+    Atomically take seats on a package. The update only matches while
+    ``booked_seats + num_travelers <= capacity``, so concurrent bookings
+    can never oversell. Returns whether the seats were taken.
+    """
+    claimed = TourPackage.objects.filter(
+        pk=package_id, capacity__gte=F('booked_seats') + num_travelers
+    ).update(booked_seats=F('booked_seats') + num_travelers, **bookings_changed()) == 1
+    if claimed:
+        catalog_changed()
+    return claimed
+
+
+def release_seats(package_id, num_travelers):
+    """Give seats back to a package, e.g. when a booking is cancelled"""
+    released = TourPackage.objects.filter(
+        pk=package_id, booked_seats__gte=num_travelers
+    ).update(booked_seats=F('booked_seats') - num_travelers, **bookings_changed())
+    if not released:
+        # The counter has drifted below the bookings it should cover
+        TourPackage.objects.filter(pk=package_id).update(booked_seats=0, **bookings_changed())
+    catalog_changed()
+
+
+def charge_points(user_id, amount):
+    """Atomically take points from a user if the balance covers them"""
+    return User.objects.filter(pk=user_id, point__gte=amount).update(point=F('point') - amount) == 1
+
+
+def booking_totals(user_id):
+    """Summary counters of a user computed from their bookings"""
+    cancelled = Q(status='Cancelled')
+    return TourBooking.objects.filter(user_id=user_id).aggregate(
+        success_count=Count('pk', filter=~cancelled),
+        cancel_count=Count('pk', filter=cancelled),
+        spent_total=Coalesce(Sum('total_cost', filter=~cancelled), 0, output_field=DecimalField()),
+        refunded_total=Coalesce(Sum('total_cost', filter=cancelled), 0, output_field=DecimalField()),
+    )
+
+
+def _update_summary(user_id, booked=0, cancelled=0, cost=Decimal(0)):
+    """
+    Apply booking deltas to a user's BookingSummary with one ``F()``
+    update. Must run inside the transaction that wrote the bookings: a
+    user without a summary row gets one counted from their bookings, which
+    then already include the change.
+    """
+    # Clamped at zero in case the row has drifted below the bookings it covers
+    fields = dict(
+        success_count=Greatest(F('success_count') + booked - cancelled, 0),
+        cancel_count=F('cancel_count') + cancelled,
+        spent_total=Greatest(F('spent_total') + (cost if booked else -cost), 0),
+        refunded_total=F('refunded_total') + (cost if cancelled else 0),
+    )
+    if BookingSummary.objects.filter(pk=user_id).update(**fields):
+        return
+    try:
+        with transaction.atomic():
+            BookingSummary.objects.create(user_id=user_id, **booking_totals(user_id))
+    except IntegrityError:
+        # Created concurrently by a transaction that could not see our bookings
+        BookingSummary.objects.filter(pk=user_id).update(**fields)
+
+
+def record_bookings(user_id, count, cost):
+    """Add new bookings costing ``cost`` in total to the user's summary"""
+    _update_summary(user_id, booked=count, cost=Decimal(cost))
+
+
+def record_cancellations(user_id, count, cost):
+    """Move cancelled bookings costing ``cost`` in total from spent to refunded"""
+    _update_summary(user_id, cancelled=count, cost=Decimal(cost))
+
+
+def check_booking_open(package, now):
+    if package.last_booking_date and now.date() > package.last_booking_date.date():
+        raise BookingError('Booking for this tour package is closed.')
+
+
+def package_refund_percentage(package, now):
+    """Refund tier of a cancellation made more than a day after booking"""
+    if (package.start_date - now.date()).days > 5:
+        return 0.7
+    if now.date() == package.start_date:
+        return 0.4
+    return 0
+
+
+def refund_percentage(booking, now):
+    """Share of the booking cost refunded when it is cancelled at ``now``"""
+    time_difference = booking.booking_date - now
+    if time_difference <= timezone.timedelta(minutes=20):
+        return 1.0
+    if time_difference <= timezone.timedelta(days=1):
+        return 0.9
+    return package_refund_percentage(booking.package, now)
+
+
+def refund_percentage_expression(package, now):
+    """
+    The tiers of ``refund_percentage`` as a CASE expression over the
+    bookings of one package, so refunds are computed in the database.
+    """
+    return Case(
+        When(booking_date__lte=now + timezone.timedelta(minutes=20), then=Value(1.0)),
+        When(booking_date__lte=now + timezone.timedelta(days=1), then=Value(0.9)),
+        default=Value(float(package_refund_percentage(package, now))),
+        output_field=FloatField(),
+    )
+
+
+def cancel_package_bookings(package, now=None):
+    """
+    Cancel every active booking of a package in one transaction. Refunds
+    are summed per user by one aggregate query, each user is credited with
+    one ``F()`` update, all statuses are flipped by one UPDATE and the seats
+    are released in one go. Returns the number of bookings cancelled and
+    the refund per user id.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        bookings = TourBooking.objects.filter(package=package).exclude(status='Cancelled')
+        # Lock the rows so a concurrent cancel_booking cannot refund one of them twice
+        if not list(bookings.select_for_update().values_list('pk', flat=True)):
+            return 0, {}
+
+        refund = ExpressionWrapper(
+            F('total_cost') * refund_percentage_expression(package, now), output_field=FloatField()
+        )
+        per_user = list(
+            bookings.values('user_id')
+            .annotate(refund=Sum(refund), seats=Sum('num_travelers'), count=Count('pk'), cost=Sum('total_cost'))
+            .order_by('user_id')
+        )
+
+        for row in per_user:
+            if row['refund']:
+                User.objects.filter(pk=row['user_id']).update(point=F('point') + row['refund'])
+        cancelled = bookings.update(status='Cancelled')
+        release_seats(package.pk, sum(row['seats'] for row in per_user))
+        for row in per_user:
+            record_cancellations(row['user_id'], row['count'], row['cost'])
+
+    package.refresh_from_db(fields=['booked_seats'])
+    return cancelled, {row['user_id']: row['refund'] or 0 for row in per_user}
+
+
+def book_package(user, package, num_travelers):
+    """
+    Book seats on a package for a user in one transaction: charge the
+    points, claim the seats and insert the booking. Raises BookingError
+    and leaves nothing behind if any step fails.
+    """
+    total_cost = float(package.price) * num_travelers
+
+    with transaction.atomic():
+        if not charge_points(user.pk, total_cost):
+            raise BookingError('Insufficient points to book this tour')
+        if not claim_seats(package.pk, num_travelers):
+            raise BookingError('This tour is fully booked. Please select another tour.')
+        booking = TourBooking.objects.create(
+            user=user, package=package, num_travelers=num_travelers, total_cost=total_cost
+        )
+        record_bookings(user.pk, 1, booking.total_cost)
+
+    user.refresh_from_db(fields=['point'])
+    package.refresh_from_db(fields=['booked_seats'])
+    return booking
+
+
+def booked_seats_drift():
+    """
+    Return the packages whose ``booked_seats`` counter disagrees with their
+    bookings and active seat holds, annotated with the ``actual_booked``
+    seat count.
+    """
+    booked = (
+        TourBooking.objects.filter(package=OuterRef('pk'))
+        .exclude(status='Cancelled')
+        .values('package')
+        .annotate(total=Sum('num_travelers'))
+        .values('total')
+    )
+    held = (
+        SeatHold.objects.filter(package=OuterRef('pk'), status='Active')
+        .values('package')
+        .annotate(total=Sum('num_seats'))
+        .values('total')
+    )
+    return (
+        TourPackage.objects
+        .annotate(actual_booked=Coalesce(Subquery(booked), 0) + Coalesce(Subquery(held), 0))
+        .exclude(booked_seats=F('actual_booked'))
+    )
+
+
+def reconcile_booked_seats():
+    """Reset drifted counters to the seat count of their bookings"""
+    fixed = []
+    with transaction.atomic():
+        for package in booked_seats_drift().select_for_update():
+            fixed.append((package, package.booked_seats, package.actual_booked))
+            TourPackage.objects.filter(pk=package.pk).update(
+                booked_seats=package.actual_booked, **bookings_changed()
+            )
+    if fixed:
+        catalog_changed()
+    return fixed
+
+
+def resolve_packages(tracking_ids):
+    """Load the packages for a set of tracking IDs in one query"""
+    ids = set()
+    for tracking_id in tracking_ids:
+        try:
+            ids.add(uuid.UUID(str(tracking_id)))
+        except ValueError:
+            pass
+    return {package.tracking_id: package for package in TourPackage.objects.filter(tracking_id__in=ids)}
+
+
+def _find_package(packages, tracking_id):
+    try:
+        return packages.get(uuid.UUID(str(tracking_id)))
+    except ValueError:
+        return None
+
+
+def book_packages(user, items, atomic=True, now=None):
+    """
+    Book several packages for a user in one transaction.
+
+    ``items`` is a list of ``{'package_tracking_id', 'num_travelers'}``
+    dicts. All packages are loaded with one query and all bookings are
+    inserted with one ``bulk_create``. With ``atomic=True`` either every
+    item is booked or none is and BookingError is raised; otherwise each
+    item succeeds or fails on its own. Returns one result dict per item,
+    in order.
+    """
+    now = now or timezone.now()
+    packages = resolve_packages(item['package_tracking_id'] for item in items)
+    results = []
+    planned = []
+
+    for index, item in enumerate(items):
+        result = {'index': index, 'package_tracking_id': str(item['package_tracking_id'])}
+        results.append(result)
+        package = _find_package(packages, item['package_tracking_id'])
+        if package is None:
+            result['error'] = 'Tour package not found with the provided tracking ID.'
+            continue
+        try:
+            check_booking_open(package, now)
+        except BookingError as e:
+            result['error'] = e.message
+            continue
+        result['total_cost'] = float(package.price) * item['num_travelers']
+        planned.append((result, package, item['num_travelers']))
+
+    try:
+        with transaction.atomic():
+            if atomic:
+                if any('error' in result for result in results):
+                    raise BookingFailed(results)
+                _book_all_or_nothing(user, planned, results)
+            else:
+                _book_each(user, planned)
+
+            booked = [
+                (result, TourBooking(
+                    user=user, package=package, num_travelers=num_travelers,
+                    total_cost=package.price * num_travelers, tracking_id=uuid.uuid4(),
+                ))
+                for result, package, num_travelers in planned if 'error' not in result
+            ]
+            TourBooking.objects.bulk_create([booking for _, booking in booked])
+            if booked:
+                record_bookings(user.pk, len(booked), sum(booking.total_cost for _, booking in booked))
+    except BookingFailed:
+        for result in results:
+            result['status'] = 'failed' if 'error' in result else 'not_booked'
+            result.pop('total_cost', None)
+        raise
+
+    for result, booking in booked:
+        result['tour_booking_tracking_id'] = str(booking.tracking_id)
+    for result in results:
+        result['status'] = 'failed' if 'error' in result else 'booked'
+        if 'error' in result:
+            result.pop('total_cost', None)
+    user.refresh_from_db(fields=['point'])
+    return results
+
+
+def _book_all_or_nothing(user, planned, results):
+    total_cost = sum(result['total_cost'] for result, _, _ in planned)
+    if not charge_points(user.pk, total_cost):
+        for result, _, _ in planned:
+            result['error'] = 'Insufficient points to book this tour'
+        raise BookingFailed(results)
+
+    seats = {}
+    for result, package, num_travelers in planned:
+        seats.setdefault(package.pk, [0, []])
+        seats[package.pk][0] += num_travelers
+        seats[package.pk][1].append(result)
+    for package_id, (num_travelers, package_results) in seats.items():
+        if not claim_seats(package_id, num_travelers):
+            for result in package_results:
+                result['error'] = 'This tour is fully booked. Please select another tour.'
+    if any('error' in result for result in results):
+        raise BookingFailed(results)
+
+
+def _book_each(user, planned):
+    for result, package, num_travelers in planned:
+        try:
+            with transaction.atomic():
+                if not charge_points(user.pk, result['total_cost']):
+                    raise BookingError('Insufficient points to book this tour')
+                if not claim_seats(package.pk, num_travelers):
+                    raise BookingError('This tour is fully booked. Please select another tour.')
+        except BookingError as e:
+            result['error'] = e.message
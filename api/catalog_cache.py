@@ -0,0 +1,121 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import parse_http_date_safe
+
+from .conditional import Validators, not_modified, set_validators
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+CACHE_HEADER = 'X-Catalog-Cache'
+
+
+def get_catalog_cache():
+    """The cache holding rendered catalog pages, or None when caching is off"""
+    if not settings.CATALOG_RESPONSE_CACHE:
+        return None
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _incr(cache, key):
+    # add() is a no-op when the key exists, so the first increment cannot race a reset
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def catalog_version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog page by moving to a new version"""
+    cache = get_catalog_cache()
+    if cache is not None:
+        _incr(cache, VERSION_KEY)
+
+
+def catalog_changed():
+    """
+    Bump the catalog version once the current transaction commits, so a page
+    rendered from the old rows can never be stored under the new version
+    """
+    if settings.CATALOG_RESPONSE_CACHE:
+        transaction.on_commit(bump_catalog_version)
+
+
+def page_key(request, version):
+    # The day is part of the key because is_active flips at midnight
+    identity = f'{request.build_absolute_uri()}|{timezone.now().date()}'
+    return f'catalog:page:{version}:{hashlib.md5(identity.encode()).hexdigest()}'
+
+
+def cached_page(request):
+    """
+    Serve a catalog page straight from the cache, answering conditional
+    GETs from the stored validators. Returns None on a miss and remembers
+    the key the rendered page should be stored under.
+    """
+    cache = get_catalog_cache()
+    if cache is None or request.method != 'GET':
+        return None
+    key = page_key(request, catalog_version(cache))
+    entry = cache.get(key)
+    if entry is None:
+        _incr(cache, MISSES_KEY)
+        request.catalog_cache_key = key
+        return None
+
+    _incr(cache, HITS_KEY)
+    validators = Validators(*entry['validators']) if entry['validators'] else None
+    response = not_modified(request, validators)
+    if response is None:
+        response = set_validators(
+            HttpResponse(entry['content'], content_type=entry['content_type']), validators
+        )
+    response[CACHE_HEADER] = 'HIT'
+    return response
+
+
+def store_page(request, response):
+    """Keep the rendered bytes of a successful JSON catalog page"""
+    key = getattr(request, 'catalog_cache_key', None)
+    if key is None:
+        return response
+    response[CACHE_HEADER] = 'MISS'
+    if response.status_code != 200 or not response['Content-Type'].startswith('application/json'):
+        return response
+    validators = None
+    if response.has_header('ETag'):
+        validators = (response['ETag'], parse_http_date_safe(response.get('Last-Modified')))
+    get_catalog_cache().set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'validators': validators,
+    }, settings.CATALOG_CACHE_TIMEOUT)
+    return response
+
+
+def cache_stats():
+    cache = get_catalog_cache()
+    if cache is None:
+        return {'enabled': False, 'hits': 0, 'misses': 0, 'version': None}
+    return {
+        'enabled': True,
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'version': catalog_version(cache),
+    }
@@ -0,0 +1,148 @@
+import hashlib
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Hotel, TourPackage
+
+Validators = namedtuple('Validators', ['etag', 'last_modified'])
+
+
+def make_validators(parts, timestamps):
+    """
+    ETag hashed from ``parts`` and Last-Modified from the newest of
+    ``timestamps``, ignoring empty ones
+    """
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    timestamps = [ts for ts in timestamps if ts is not None]
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    return Validators(quote_etag(digest), last_modified)
+
+
+def start_of_today():
+    """
+    Tour representations carry ``is_active``, which can flip at midnight, so
+    they are never older than the start of the current day
+    """
+    return timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+TOUR_CATALOG_STATE = {
+    'count': Count('pk'), 'updated': Max('updated_at'),
+    'versions': Sum('booking_version'), 'bookings_updated': Max('bookings_updated_at'),
+}
+TOUR_STATE_FIELDS = ('pk', 'updated_at', 'booking_version', 'bookings_updated_at')
+HOTEL_CATALOG_STATE = {'count': Count('pk'), 'updated': Max('updated_at')}
+
+
+def _tour_catalog_validators(request, state):
+    today = start_of_today()
+    return make_validators(
+        (request.build_absolute_uri(), today.date(), *state.values()),
+        (state['updated'], state['bookings_updated'], today),
+    )
+
+
+def tour_catalog_validators(request, queryset=None):
+    """Validators of a tour list page from one aggregate over the packages"""
+    queryset = TourPackage.objects.all() if queryset is None else queryset
+    return _tour_catalog_validators(request, queryset.aggregate(**TOUR_CATALOG_STATE))
+
+
+async def atour_catalog_validators(request, queryset=None):
+    queryset = TourPackage.objects.all() if queryset is None else queryset
+    return _tour_catalog_validators(request, await queryset.aaggregate(**TOUR_CATALOG_STATE))
+
+
+def _tour_validators(request, state):
+    if state is None:
+        return None
+    today = start_of_today()
+    return make_validators((request.build_absolute_uri(), today.date(), *state), (state[1], state[3], today))
+
+
+def tour_validators(request, tracking_id):
+    """Validators of one tour package, or None when it does not exist"""
+    try:
+        state = TourPackage.objects.filter(tracking_id=tracking_id).values_list(*TOUR_STATE_FIELDS).first()
+    except (ValidationError, ValueError):
+        return None
+    return _tour_validators(request, state)
+
+
+async def atour_validators(request, tracking_id):
+    try:
+        state = await TourPackage.objects.filter(tracking_id=tracking_id).values_list(*TOUR_STATE_FIELDS).afirst()
+    except (ValidationError, ValueError):
+        return None
+    return _tour_validators(request, state)
+
+
+def _hotel_catalog_validators(request, state):
+    return make_validators((request.build_absolute_uri(), *state.values()), (state['updated'],))
+
+
+def hotel_catalog_validators(request, queryset):
+    """Validators of a hotel list page from one aggregate over the filtered hotels"""
+    return _hotel_catalog_validators(request, queryset.aggregate(**HOTEL_CATALOG_STATE))
+
+
+async def ahotel_catalog_validators(request, queryset):
+    return _hotel_catalog_validators(request, await queryset.aaggregate(**HOTEL_CATALOG_STATE))
+
+
+def hotel_validators(request, pk):
+    """Validators of one hotel, or None when it does not exist"""
+    try:
+        updated_at = Hotel.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (ValidationError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    return make_validators((request.build_absolute_uri(), updated_at), (updated_at,))
+
+
+def set_validators(response, validators):
+    if validators is not None:
+        response['ETag'] = validators.etag
+        if validators.last_modified is not None:
+            response['Last-Modified'] = http_date(validators.last_modified)
+    return response
+
+
+def not_modified(request, validators):
+    """
+    A 304 (or 412) response when the request's If-None-Match or
+    If-Modified-Since header matches ``validators``, else None
+    """
+    if validators is None or request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, validators.etag, validators.last_modified)
+    return set_validators(response, validators) if response is not None else None
+
+
+class ConditionalGetMixin:
+    """
+    Answers conditional GETs on list and retrieve before the queryset is
+    read or serialized. Views implement ``list_validators`` and
+    ``object_validators`` with a single cheap query each.
+    """
+    def list(self, request, *args, **kwargs):
+        validators = self.list_validators(request)
+        response = not_modified(request, validators)
+        if response is None:
+            response = set_validators(super().list(request, *args, **kwargs), validators)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.object_validators(request, self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        response = not_modified(request, validators)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, validators)
+        return response
@@ -0,0 +1,149 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import aauthenticate, authenticate, get_user_model
+
+
+class VerifiedCredentialCache:
+    """
+    Bounded, TTL-based cache of recently verified Basic auth credentials.
+
+    Entries are keyed by an HMAC of the username and password, so plaintext
+    credentials are never held. Each entry remembers the user's password hash
+    at verification time. A hit is only honoured while that hash still
+    matches and the user is still active, so a password change or
+    deactivation invalidates it in every worker.
+    """
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}  # user id -> keys of that user's entries
+
+    def _key(self, username, password):
+        message = f'{username}\x00{password}'.encode('utf-8')
+        return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).digest()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _check(self, key, entry, user):
+        if user is None or not user.is_active or user.password != entry[1]:
+            self.discard(key)
+            return None
+        return user
+
+    def get(self, username, password):
+        """Return the cached user for these credentials, or None"""
+        key = self._key(username, password)
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        user = get_user_model().objects.filter(pk=entry[0]).first()
+        return self._check(key, entry, user)
+
+    async def aget(self, username, password):
+        """Async version of get"""
+        key = self._key(username, password)
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        user = await get_user_model().objects.filter(pk=entry[0]).afirst()
+        return self._check(key, entry, user)
+
+    def set(self, username, password, user):
+        key = self._key(username, password)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user.pk, user.password, time.monotonic() + self.ttl)
+            self._user_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        # Callers hold self._lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._user_keys.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[entry[0]]
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        """Drop every entry for a user"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_credential_cache():
+    """
+    Return the process-wide credential cache, or None when caching is
+    disabled with BASIC_AUTH_CACHE_TTL = 0.
+    """
+    global _cache
+    if getattr(settings, 'BASIC_AUTH_CACHE_TTL', 300) <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = VerifiedCredentialCache(
+                    max_entries=getattr(settings, 'BASIC_AUTH_CACHE_SIZE', 1024),
+                    ttl=settings.BASIC_AUTH_CACHE_TTL,
+                )
+    return _cache
+
+
+def authenticate_basic(request, username, password):
+    """Authenticate Basic auth credentials, using the verified-credential cache"""
+    cache = get_credential_cache()
+    if cache is not None:
+        user = cache.get(username, password)
+        if user is not None:
+            return user
+
+    user = authenticate(request, username=username, password=password)
+    if user is not None and cache is not None:
+        cache.set(username, password, user)
+    return user
+
+
+async def aauthenticate_basic(request, username, password):
+    """Async version of authenticate_basic"""
+    cache = get_credential_cache()
+    if cache is not None:
+        user = await cache.aget(username, password)
+        if user is not None:
+            return user
+
+    user = await aauthenticate(request, username=username, password=password)
+    if user is not None and cache is not None:
+        cache.set(username, password, user)
+    return user
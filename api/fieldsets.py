@@ -0,0 +1,117 @@
+"""
+Sparse fieldsets for the catalog endpoints.
+
+``?fields=a,b`` keeps only the named fields of each item and ``?exclude=a,b``
+drops the named ones. List views leave out their ``lean_fields`` (the
+unbounded text columns) unless the request names fields itself; an empty
+``?fields=`` asks for everything. The columns behind dropped fields are
+deferred in SQL as well, so payload size and database transfer shrink
+together.
+"""
+from functools import lru_cache
+
+from rest_framework.exceptions import ValidationError
+
+from .pagination import query_params
+
+TOUR_LEAN_FIELDS = ('itinerary', 'included_items', 'excluded_items', 'highlights')
+HOTEL_LEAN_FIELDS = ('description', 'address')
+
+
+@lru_cache(maxsize=None)
+def serializer_fields(serializer_class):
+    """``(name, source)`` of the fields ``serializer_class`` outputs, in order"""
+    return tuple(
+        (name, field.source) for name, field in serializer_class().fields.items() if not field.write_only
+    )
+
+
+def split_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_fieldset(request, serializer_class, lean=()):
+    """
+    The field names a GET asks for, in serializer order, or None when every
+    field is kept. Unknown names are a 400.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    params = query_params(request)
+    if 'fields' in params or 'exclude' in params:
+        fields = split_names(params.get('fields', ''))
+        exclude = split_names(params.get('exclude', ''))
+    else:
+        fields, exclude = set(), set(lean)
+
+    names = [name for name, _ in serializer_fields(serializer_class)]
+    unknown = (fields | exclude) - set(names)
+    if unknown:
+        raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+    kept = [name for name in names if (not fields or name in fields) and name not in exclude]
+    return kept if len(kept) < len(names) else None
+
+
+def deferred_columns(serializer_class, fields, required=()):
+    """
+    Model columns that neither a field in ``fields`` nor ``required`` reads,
+    including those the serializer never outputs
+    """
+    opts = serializer_class.Meta.model._meta
+    kept = {opts.pk.name, *required}
+    kept.update(source for name, source in serializer_fields(serializer_class) if name in fields)
+    return sorted({field.name for field in opts.concrete_fields} - kept)
+
+
+def sparse_queryset(queryset, serializer_class, fields, required=()):
+    if fields is None:
+        return queryset
+    return queryset.defer(*deferred_columns(serializer_class, fields, required))
+
+
+def keyset_columns(view_class):
+    """Columns a view's keyset pagination reads cursor positions from"""
+    orderings = getattr(view_class, 'keyset_orderings', None) or {}
+    return [field.lstrip('-') for field in orderings.values()]
+
+
+def required_columns(view_class):
+    """Columns a view reads besides the output fields: keyset orderings and projection inputs"""
+    projection = getattr(view_class, 'projection', None)
+    return [*keyset_columns(view_class), *(projection.requires if projection is not None else ())]
+
+
+class SparseFieldsMixin:
+    """Serializer mixin dropping the fields not named in ``context['fields']``"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    View mixin applying ``?fields=`` / ``?exclude=`` to the serializer
+    context and deferring the dropped columns. ``lean_fields`` are left out
+    of list responses by default.
+    """
+    lean_fields = ()
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            lean = self.lean_fields if self.action == 'list' else ()
+            self._fieldset = get_fieldset(self.request, self.get_serializer_class(), lean)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_fieldset()
+        return context
+
+    def filter_queryset(self, queryset):
+        return sparse_queryset(
+            super().filter_queryset(queryset), self.get_serializer_class(), self.get_fieldset(),
+            required_columns(type(self)),
+        )
@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework import status
+
+from .booking import (BookingError, bookings_changed, charge_points, check_booking_open, claim_seats, record_bookings,
+                      release_seats)
+from .models import SeatHold, TourBooking, TourPackage
+
+SOLD_OUT_MESSAGE = 'This tour is fully booked. Please select another tour.'
+
+
+class SoldOut(BookingError):
+    """Raised when no seats are left to hold on a package"""
+    def __init__(self):
+        super().__init__(SOLD_OUT_MESSAGE)
+
+
+class AdmissionQueue:
+    """
+    Per-package admission queue for seat holds.
+
+    Each package gets a single worker thread that handles its hold requests
+    one at a time in arrival order, so a flash sale reaches the database as
+    an ordered stream of claims instead of hundreds of competing writes.
+    Once a claim fails the package is treated as sold out for
+    ``sold_out_ttl`` seconds and new requests are turned away without
+    queueing. Workers of the least recently used packages are shut down
+    beyond ``max_packages``.
+    """
+    def __init__(self, timeout=10.0, sold_out_ttl=1.0, max_packages=256):
+        self.timeout = timeout
+        self.sold_out_ttl = sold_out_ttl
+        self.max_packages = max_packages
+        self._lock = threading.Lock()
+        self._workers = OrderedDict()  # package id -> single-thread executor
+        self._sold_out = {}  # package id -> monotonic time the flag lapses
+
+    def is_sold_out(self, package_id):
+        with self._lock:
+            until = self._sold_out.get(package_id)
+            if until is not None and until <= time.monotonic():
+                del self._sold_out[package_id]
+                return False
+            return until is not None
+
+    def mark_sold_out(self, package_id):
+        with self._lock:
+            self._sold_out[package_id] = time.monotonic() + self.sold_out_ttl
+
+    def clear_sold_out(self, package_id):
+        with self._lock:
+            self._sold_out.pop(package_id, None)
+
+    def _worker(self, package_id):
+        with self._lock:
+            worker = self._workers.get(package_id)
+            if worker is None:
+                worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'seat-hold-{package_id}')
+                self._workers[package_id] = worker
+                while len(self._workers) > self.max_packages:
+                    _, idle = self._workers.popitem(last=False)
+                    idle.shutdown(wait=False)
+            else:
+                self._workers.move_to_end(package_id)
+            return worker
+
+    def run(self, package_id, func, *args):
+        """
+        Run ``func(*args)`` in the package's queue and return its result.
+        Raises SoldOut without queueing while the package is marked sold out,
+        and BookingError with status 503 if the queue does not reach the
+        request within ``timeout`` seconds. A request the worker has already
+        started is waited for, since its hold may commit.
+        """
+        if self.is_sold_out(package_id):
+            raise SoldOut()
+
+        future = self._worker(package_id).submit(func, *args)
+        try:
+            return self._result(package_id, future, self.timeout)
+        except FutureTimeout:
+            # Drop the request only if the worker has not picked it up yet
+            if future.cancel():
+                raise BookingError(
+                    'Too many requests for this tour, please try again.',
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+            return self._result(package_id, future, None)
+
+    def _result(self, package_id, future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except SoldOut:
+            self.mark_sold_out(package_id)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, OrderedDict()
+        for worker in workers.values():
+            worker.shutdown(wait=False)
+
+
+def place_hold(user, package, num_seats, now=None):
+    """
+    Claim seats for a new hold on the package. If the package looks full,
+    its expired holds are released first and the claim is retried once.
+    """
+    now = now or timezone.now()
+    check_booking_open(package, now)
+    if SeatHold.objects.filter(user=user, package=package, status='Active', expires_at__gt=now).exists():
+        raise BookingError('You already hold seats on this tour.', status.HTTP_409_CONFLICT)
+
+    with transaction.atomic():
+        if not claim_seats(package.pk, num_seats):
+            if not release_expired_holds(now, package_id=package.pk) or not claim_seats(package.pk, num_seats):
+                raise SoldOut()
+        return SeatHold.objects.create(
+            user=user, package=package, num_seats=num_seats,
+            expires_at=now + timedelta(seconds=getattr(settings, 'SEAT_HOLD_TTL', 300)),
+        )
+
+
+def _place_hold_in_worker(user, package, num_seats):
+    close_old_connections()
+    try:
+        return place_hold(user, package, num_seats)
+    finally:
+        close_old_connections()
+
+
+def hold_seats(user, package, num_seats):
+    """Place a hold through the package's admission queue, if enabled"""
+    queue = get_admission_queue()
+    if queue is None:
+        return place_hold(user, package, num_seats)
+    return queue.run(package.pk, _place_hold_in_worker, user, package, num_seats)
+
+
+def convert_hold(hold, now=None):
+    """
+    Turn an active hold into a booking: charge the points, insert the
+    booking and mark the hold converted in one transaction. The seats were
+    claimed when the hold was placed, so the seat counter is not touched.
+    """
+    now = now or timezone.now()
+    if hold.status != 'Active' or hold.expires_at <= now:
+        raise BookingError('This seat hold is no longer active.', status.HTTP_409_CONFLICT)
+
+    package = hold.package
+    total_cost = float(package.price) * hold.num_seats
+
+    with transaction.atomic():
+        if not charge_points(hold.user_id, total_cost):
+            raise BookingError('Insufficient points to book this tour')
+        booking = TourBooking.objects.create(
+            user_id=hold.user_id, package=package, num_travelers=hold.num_seats, total_cost=total_cost
+        )
+        # Loses against a concurrent sweep or release of the same hold
+        converted = SeatHold.objects.filter(
+            pk=hold.pk, status='Active', expires_at__gt=now
+        ).update(status='Converted', booking=booking)
+        if not converted:
+            raise BookingError('This seat hold is no longer active.', status.HTTP_409_CONFLICT)
+        record_bookings(hold.user_id, 1, booking.total_cost)
+        # The seats were already counted, but the package now has one more booking
+        TourPackage.objects.filter(pk=package.pk).update(**bookings_changed())
+
+    hold.status = 'Converted'
+    hold.booking = booking
+    return booking
+
+
+def release_hold(hold):
+    """Give the seats of an active hold back before it expires"""
+    with transaction.atomic():
+        released = SeatHold.objects.filter(pk=hold.pk, status='Active').update(status='Released')
+        if released:
+            release_seats(hold.package_id, hold.num_seats)
+    if released:
+        _seats_freed(hold.package_id)
+        hold.status = 'Released'
+    return bool(released)
+
+
+def release_expired_holds(now=None, package_id=None):
+    """
+    Expire every active hold past its deadline and give its seats back.
+    Uses one locking read, one UPDATE for the holds and one UPDATE per
+    affected package. Returns the number of holds expired.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = SeatHold.objects.filter(status='Active', expires_at__lte=now)
+        if package_id is not None:
+            expired = expired.filter(package_id=package_id)
+        seats = defaultdict(int)
+        for held_package_id, num_seats in expired.select_for_update().values_list('package_id', 'num_seats'):
+            seats[held_package_id] += num_seats
+        if not seats:
+            return 0
+        count = expired.update(status='Expired')
+        for held_package_id, num_seats in seats.items():
+            release_seats(held_package_id, num_seats)
+
+    for held_package_id in seats:
+        _seats_freed(held_package_id)
+    return count
+
+
+def _seats_freed(package_id):
+    if _queue is not None:
+        _queue.clear_sold_out(package_id)
+
+
+_queue = None
+_lock = threading.Lock()
+
+
+def get_admission_queue():
+    """
+    Return the process-wide admission queue, or None when
+    SEAT_HOLD_ADMISSION_QUEUE is disabled and holds are placed inline.
+    """
+    global _queue
+    if not getattr(settings, 'SEAT_HOLD_ADMISSION_QUEUE', True):
+        return None
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                _queue = AdmissionQueue(
+                    timeout=getattr(settings, 'SEAT_HOLD_QUEUE_TIMEOUT', 10.0),
+                    sold_out_ttl=getattr(settings, 'SEAT_HOLD_SOLD_OUT_TTL', 1.0),
+                )
+    return _queue
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Events for first requests running in this process, so local duplicates
+# are woken up as soon as the response is stored instead of polling
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _record_key(user_id, scope, key):
+    return hashlib.sha256(f'{user_id}:{scope}:{key}'.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True)
+    return hashlib.sha256(f'{request.method}:{request.path}:{body}'.encode()).hexdigest()
+
+
+def _claim(record_key, fingerprint, now):
+    """Insert the in-progress record; returns False if the key is taken"""
+    try:
+        with transaction.atomic():
+            IdempotencyRecord.objects.create(
+                key=record_key, fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)),
+            )
+    except IntegrityError:
+        return False
+    with _inflight_lock:
+        _inflight[record_key] = threading.Event()
+    return True
+
+
+def _finish(record_key, response=None):
+    """Store the response of the first request, or drop the key so it can be retried"""
+    try:
+        records = IdempotencyRecord.objects.filter(key=record_key)
+        if response is None:
+            records.delete()
+        else:
+            records.update(
+                status_code=response.status_code,
+                response_body=json.dumps(response.data, cls=JSONEncoder),
+            )
+    finally:
+        with _inflight_lock:
+            event = _inflight.pop(record_key, None)
+        if event is not None:
+            event.set()
+
+
+def _wait_for(record_key):
+    """
+    Return the record for a taken key once its first request has finished.
+    Returns None if the key was released or expired in the meantime, and the
+    unfinished record if the wait times out.
+    """
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10.0)
+    lock_timeout = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60.0))
+    interval = 0.01
+    while True:
+        record = IdempotencyRecord.objects.filter(key=record_key).first()
+        now = timezone.now()
+        if record is None:
+            return None
+        if record.expires_at <= now or (record.status_code is None and record.created_at <= now - lock_timeout):
+            # Expired, or the first request died without finishing
+            IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            return None
+        remaining = deadline - time.monotonic()
+        if record.status_code is not None or remaining <= 0:
+            return record
+
+        with _inflight_lock:
+            event = _inflight.get(record_key)
+        if event is not None:
+            event.wait(min(remaining, 1.0))
+        else:
+            time.sleep(min(remaining, interval))
+            interval = min(interval * 2, 0.25)
+
+
+def replay(record):
+    response = Response(json.loads(record.response_body), status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def run_idempotent(request, scope, key, handler):
+    """
+    Run ``handler()`` at most once per user, scope and key. Later requests
+    with the same key get the stored response; duplicates that arrive while
+    the first request is running wait for it. Server errors are not stored,
+    so the request can be retried.
+    """
+    record_key = _record_key(request.user.pk, scope, key)
+    fingerprint = _fingerprint(request)
+
+    while not _claim(record_key, fingerprint, timezone.now()):
+        record = _wait_for(record_key)
+        if record is None:
+            continue
+        if record.fingerprint != fingerprint:
+            return Response(
+                {'error': 'This Idempotency-Key was already used for a different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is None:
+            return Response(
+                {'error': 'A request with this Idempotency-Key is still being processed.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return replay(record)
+
+    try:
+        response = handler()
+    except BaseException:
+        _finish(record_key)
+        raise
+    _finish(record_key, response if response.status_code < 500 else None)
+    return response
+
+
+def idempotent(scope):
+    """
+    Make a DRF view or viewset action honour the Idempotency-Key header.
+    Requests without the header run as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.META.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return run_idempotent(request, scope, key, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def purge_expired(now=None):
+    """Delete stored responses past their TTL; returns the number deleted"""
+    count, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return count
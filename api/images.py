@@ -0,0 +1,254 @@
+"""
+Resized variants of uploaded hotel and tour images.
+
+Saving a hotel or tour package with a new image queues the generation of
+one resized copy per ``IMAGE_VARIANT_SIZES`` entry, in every format of
+``IMAGE_VARIANT_FORMATS``, on a small worker pool. Variants are written
+next to the original under ``variants/`` with EXIF and other metadata
+dropped (orientation is applied to the pixels first), and their names are
+recorded on the model in a JSON map that serializers expose as URLs.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from .blobstore import ContentAddressedStorage
+from .catalog_cache import catalog_changed
+from .models import Hotel, TourPackage
+
+# model -> (image field, variants map field)
+IMAGE_FIELDS = {
+    Hotel: ('primary_picture', 'primary_picture_variants'),
+    TourPackage: ('images', 'images_variants'),
+}
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def validate_image_pixels(value):
+    """Reject uploads above IMAGE_MAX_PIXELS before they are stored"""
+    image = getattr(value, 'image', None)
+    if image is not None and image.width * image.height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f'Image is {image.width}x{image.height}; at most {settings.IMAGE_MAX_PIXELS} pixels are allowed.'
+        )
+
+
+def flatten(image):
+    """``image`` in a mode every output format can store, alpha kept only for WebP"""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def encode(image, fmt, icc_profile=None):
+    buffer = io.BytesIO()
+    options = {'quality': settings.IMAGE_VARIANT_QUALITY}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        options.update(optimize=True, progressive=True)
+    else:
+        # method 2 encodes about 2.5x faster than the default 4 for ~3% larger files
+        options['method'] = 2
+    # No exif= option and a fresh image, so no EXIF, XMP or GPS data is written
+    image.save(buffer, FORMATS[fmt], **options)
+    return buffer.getvalue()
+
+
+def render_variants(source):
+    """
+    ``{size name: (width, height, {format: bytes})}`` for an image file. The
+    longest edge of each variant is capped at its size and at the original's;
+    sizes the original is too small to fill collapse into one.
+    """
+    sizes = sorted(settings.IMAGE_VARIANT_SIZES.items(), key=lambda item: item[1])
+    with Image.open(source) as image:
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f'{image.width}x{image.height} is over IMAGE_MAX_PIXELS')
+        # JPEGs can be decoded straight at a reduced scale, far cheaper than a full decode
+        image.draft('RGB', fit(image.size, sizes[-1][1]))
+        icc_profile = image.info.get('icc_profile')
+        image = flatten(ImageOps.exif_transpose(image))
+
+    targets = {}
+    for name, edge in sizes:
+        edge = min(edge, max(image.size))
+        if edge not in targets.values():
+            targets[name] = edge
+
+    # Largest first, each variant scaled down from the previous one
+    rendered = {}
+    for name, edge in sorted(targets.items(), key=lambda item: -item[1]):
+        image = image.copy() if max(image.size) <= edge else image.resize(
+            fit(image.size, edge), Image.LANCZOS, reducing_gap=3.0
+        )
+        rendered[name] = (image.width, image.height, {
+            fmt: encode(image, fmt, icc_profile) for fmt in settings.IMAGE_VARIANT_FORMATS
+        })
+    return rendered
+
+
+def fit(size, edge):
+    width, height = size
+    scale = edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def variant_name(source_name, size_name, fmt):
+    stem = os.path.splitext(source_name)[0]
+    return f'variants/{stem}/{size_name}.{"jpg" if fmt == "jpeg" else fmt}'
+
+
+def save_variants(storage, source_name, rendered):
+    variants = {}
+    for size_name, (width, height, files) in rendered.items():
+        entry = {'width': width, 'height': height}
+        for fmt, data in files.items():
+            entry[fmt] = storage.save(variant_name(source_name, size_name, fmt), ContentFile(data))
+        variants[size_name] = entry
+    return variants
+
+
+def variant_files(variants_map):
+    for entry in (variants_map or {}).get('variants', {}).values():
+        for fmt in FORMATS:
+            if fmt in entry:
+                yield entry[fmt]
+
+
+def discard_variants(model, variants_map):
+    storage = model._meta.get_field(IMAGE_FIELDS[model][0]).storage
+    for name in variant_files(variants_map):
+        storage.delete(name)
+
+
+def generate_variants(model, pk):
+    """
+    Render and store the variants of one object's current image and record
+    them on the row, unless the image changed while they were being made.
+    Returns the recorded map, or None when there was nothing to do.
+    """
+    image_field, variants_field = IMAGE_FIELDS[model]
+    source_name, previous = model.objects.filter(pk=pk).values_list(image_field, variants_field).first() or (None, None)
+    if not source_name:
+        return None
+    storage = model._meta.get_field(image_field).storage
+    try:
+        with storage.open(source_name) as source:
+            result = {'source': source_name, 'variants': save_variants(storage, source_name, render_variants(source))}
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        result = {'source': source_name, 'error': str(e)}
+
+    updated = model.objects.filter(pk=pk, **{image_field: source_name}).update(
+        **{variants_field: result, 'updated_at': timezone.now()}
+    )
+    if not updated:
+        discard_variants(model, result)
+        return None
+    if (previous or {}).get('source') == source_name:
+        # Regenerated; variants of a replaced image are discarded when it is replaced
+        discard_variants(model, previous)
+    if model is TourPackage:
+        catalog_changed()
+    return result
+
+
+def _in_background(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"Error processing image variants: {e}")
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def submit(func, *args):
+    """Run ``func`` on the image worker pool, or inline when IMAGE_VARIANTS_BACKGROUND is off"""
+    global _executor
+    if not settings.IMAGE_VARIANTS_BACKGROUND:
+        func(*args)
+        return
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants'
+                )
+    _executor.submit(_in_background, func, *args)
+
+
+def queue_variants(model, pk):
+    """Generate an object's variants once the current transaction commits"""
+    transaction.on_commit(lambda: submit(generate_variants, model, pk))
+
+
+def queue_discard(model, variants_map):
+    if any(variant_files(variants_map)):
+        transaction.on_commit(lambda: submit(discard_variants, model, variants_map))
+
+
+def counts_references(model):
+    """
+    Whether the model's image storage reference counts its files. Plain
+    storages never delete an original, as Django doesn't: rows may share a name.
+    """
+    return isinstance(model._meta.get_field(IMAGE_FIELDS[model][0]).storage, ContentAddressedStorage)
+
+
+def release_image(model, name):
+    """Drop a replaced or deleted original's blob reference once the current transaction commits"""
+    if name and counts_references(model):
+        storage = model._meta.get_field(IMAGE_FIELDS[model][0]).storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def variant_urls(variants_map, request=None, storage=default_storage):
+    """``{size: {'width', 'height', format: url}}`` of a recorded variants map"""
+    urls = {}
+    for size_name, entry in (variants_map or {}).get('variants', {}).items():
+        item = {'width': entry['width'], 'height': entry['height']}
+        for fmt in FORMATS:
+            if fmt in entry:
+                url = storage.url(entry[fmt])
+                item[fmt] = request.build_absolute_uri(url) if request is not None else url
+        urls[size_name] = item
+    return urls
+
+
+class ImageVariantsField(serializers.Field):
+    """URLs of an image's resized variants, empty until they have been generated"""
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+    def bind_request(self, request):
+        """The converter Projection uses for this field in one request"""
+        return lambda value: variant_urls(value, request)
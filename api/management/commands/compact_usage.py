@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.usage import compact_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact old API usage rollups: minute rows into hour buckets and hour rows into day buckets. "
+        "Run it hourly, e.g. from cron."
+    )
+
+    def handle(self, *args, **options):
+        minutes, hours = compact_all(timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {minutes} minute rows into hours and {hours} hour rows into days"
+        ))
@@ -0,0 +1,30 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.blobstore import collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove content-addressed media blobs that have had no references for MEDIA_BLOB_GC_GRACE seconds. "
+        "Run it daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help="Seconds a blob must have been unreferenced (default: MEDIA_BLOB_GC_GRACE)",
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="Reset reference counts from the image fields before collecting",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be removed")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount_references()
+            self.stdout.write(f"Corrected the reference count of {changed} blob(s)")
+        removed, freed = collect_garbage(default_storage, options['grace'], options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} blob(s), {freed / 1024 / 1024:.1f} MiB"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_FIELDS, generate_variants
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants of hotel and tour package images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Regenerate every image, not only those without variants",
+        )
+
+    def handle(self, *args, **options):
+        for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+            queryset = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{variants_field: {}})
+            done = failed = 0
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                result = generate_variants(model, pk)
+                if result is None:
+                    continue
+                if 'error' in result:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {pk}: {result['error']}")
+                else:
+                    done += 1
+            self.stdout.write(f"{model.__name__}: {done} generated, {failed} failed")
+        self.stdout.write(self.style.SUCCESS("Image variants generated"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked upload sessions past CHUNKED_UPLOAD_TTL and their partial files. Run it hourly, e.g. from cron."
+
+    def handle(self, *args, **options):
+        count = purge_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} expired upload session(s)"))
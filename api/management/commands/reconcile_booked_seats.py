@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.booking import booked_seats_drift, reconcile_booked_seats
+
+
+class Command(BaseCommand):
+    help = "Reconcile TourPackage.booked_seats with the seats held by non-cancelled bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report packages whose counter has drifted",
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            drifted = [(p, p.booked_seats, p.actual_booked) for p in booked_seats_drift()]
+        else:
+            drifted = reconcile_booked_seats()
+
+        for package, counted, actual in drifted:
+            self.stdout.write(f"{package.tracking_id} {package.name}: counter {counted}, bookings {actual}")
+
+        verb = "need reconciling" if options['dry_run'] else "reconciled"
+        self.stdout.write(self.style.SUCCESS(f"{len(drifted)} package(s) {verb}"))
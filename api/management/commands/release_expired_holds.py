@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release the seats of expired seat holds"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep sweeping every INTERVAL seconds instead of running once",
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            count = release_expired_holds()
+            if count or not interval:
+                self.stdout.write(self.style.SUCCESS(f"Released {count} expired seat hold(s)"))
+            if not interval:
+                return
+            close_old_connections()
+            time.sleep(interval)
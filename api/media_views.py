@@ -0,0 +1,93 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+
+from .blobstore import blob_digest
+from .conditional import Validators, not_modified, set_validators
+
+# A blob's name is its content hash, so its URL never needs revalidating
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` inclusive of a single-range ``Range`` header, None to
+    send the whole file (no header, several ranges or a unit other than
+    bytes), or ``()`` when the range lies past the end of the file
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N is the last N bytes
+        if int(last) == 0:
+            return ()
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return ()
+    if end < start:
+        return None
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(STREAM_BLOCK_SIZE, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+
+
+@require_safe
+def serve_blob(request, name):
+    """
+    Serve a content-addressed media blob with ``Cache-Control: immutable``,
+    answering If-None-Match from the hash in its name and single byte ranges
+    with 206 Partial Content
+    """
+    digest = blob_digest(name)
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if digest is None or not os.path.isfile(path):
+        raise Http404('No such media file')
+
+    validators = Validators(quote_etag(digest), None)
+    response = not_modified(request, validators)
+    if response is not None:
+        response['Cache-Control'] = IMMUTABLE
+        return response
+
+    size = os.path.getsize(path)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if if_range is not None and if_range != validators.etag:
+        byte_range = None  # the client's copy is of other bytes; send them all
+
+    if byte_range == ():
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = IMMUTABLE
+    return set_validators(response, validators)
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+
+class MeteringEngine:
+    """
+    Prices API requests from a declarative table.
+
+    The table maps either a URL name (``'hotel-list'``) or a full route
+    pattern as reported by ``ResolverMatch.route``
+    (``'api/hotels/search/basic/'``) to a number of points. It is compiled
+    once into two dicts, so pricing a request is a constant-time lookup.
+    Requests matching neither cost ``default_price``.
+    """
+    def __init__(self, prices, default_price):
+        self.default_price = default_price
+        self._by_name = {}
+        self._by_route = {}
+        for key, price in prices.items():
+            if '/' in key:
+                self._by_route[key] = float(price)
+            else:
+                self._by_name[key] = float(price)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            getattr(settings, 'POINT_PRICES', {}),
+            settings.POINT_DEDUCTION_PER_REQUEST,
+        )
+
+    def price_for(self, resolver_match):
+        """Return the price of a resolved request"""
+        price = self._by_name.get(resolver_match.url_name)
+        if price is None:
+            price = self._by_route.get(resolver_match.route, self.default_price)
+        return price
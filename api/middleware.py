@@ -1,60 +1,175 @@
-from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import RequestScopedJWTAuthentication, RevokedToken
+from .metering import MeteringEngine
+from .revocation import get_revocation_index
+from .point_buffer import get_point_buffer
+from .usage import get_usage_buffer
 
 class PointDeductionMiddleware:
     """
-    Middleware to deduct points for each API request
+    Middleware to deduct points for each API request.
+
+    The Bearer token is authenticated in ``__call__``. The charge happens in
+    ``process_view`` once the URL is resolved, so the metering engine can
+    price the request by route and every request is charged exactly once.
+    The applied price is returned in the ``X-Points-Charged`` header.
+    Runs natively under both WSGI and ASGI.
     """
+    sync_capable = True
+    async_capable = True
+    price_header = 'X-Points-Charged'
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
+        self.jwt_auth = RequestScopedJWTAuthentication()
+        self.metering = MeteringEngine.from_settings()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Let Django await the charge instead of running it on a thread
+            self.process_view = self.aprocess_view
 
-    def __call__(self, request):
-        # Skip point deduction for authentication endpoints and admin
+    def is_metered(self, request):
+        # Skip point deduction for authentication endpoints, admin and non-API requests
         if request.path.startswith('/api/auth/') or request.path.startswith('/admin/'):
+            return False
+        return request.path.startswith('/api/')
+
+    def get_bearer_token(self, request):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if auth_header.startswith('Bearer '):
+            return auth_header.split(' ')[1]
+        return None
+
+    def revoked_token_response(self):
+        return JsonResponse(
+            {'error': 'Token has been revoked.'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    def insufficient_points_response(self):
+        return JsonResponse(
+            {'error': 'Insufficient points to make this request.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    def authenticated(self, request, user, validated_token):
+        # Add user to request for views and share the validated token with DRF
+        request.user = user
+        request.jwt_auth = (user, validated_token)
+
+    def get_charge(self, request):
+        """Return (user, price) for a request that should be charged, else None"""
+        if not hasattr(request, 'jwt_auth') or hasattr(request, 'points_charged'):
+            return None
+        price = self.metering.price_for(request.resolver_match)
+        if not price:
+            return None
+        return request.jwt_auth[0], price
+
+    def route_name(self, request):
+        match = request.resolver_match
+        return match.url_name or match.route
+
+    def add_price_header(self, request, response):
+        if hasattr(request, 'points_charged'):
+            response[self.price_header] = str(request.points_charged)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.is_metered(request):
             return self.get_response(request)
-        
-        # Skip for non-API requests
-        if not request.path.startswith('/api/'):
-            return self.get_response(request)
-        
+
         # Authenticate user from JWT token
         try:
-            auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-            if auth_header.startswith('Bearer '):
-                validated_token = self.jwt_auth.get_validated_token(auth_header.split(' ')[1])
+            raw_token = self.get_bearer_token(request)
+            if raw_token:
+                get_revocation_index().refresh_if_due()
+                validated_token = self.jwt_auth.get_validated_token(raw_token)
                 user = self.jwt_auth.get_user(validated_token)
-                
-                # Skip point deduction for superusers
-                if user.is_superuser:
-                    # Check if basic auth was used
-                    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-                    if auth_header and auth_header.startswith('Basic '):
-                        request.user = user
-                        return self.get_response(request)
-
-                # Check if user has sufficient points
-                if not user.has_sufficient_points():
-                    return JsonResponse(
-                        {'error': 'Insufficient points to make this request.'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-                
-                # Deduct points
-                if request.path.startswith('/api/hotels/'):
-                    deduction_amount = 5.0  # Deduct 5 points for hotel requests
-                else:
-                    deduction_amount = settings.POINT_DEDUCTION_PER_REQUEST
-                
-                user.deduct_points(deduction_amount)
-                
-                # Add user to request for views
-                request.user = user
-            
+                self.authenticated(request, user, validated_token)
+
+        except RevokedToken:
+            # Revoked tokens are rejected before the user is loaded
+            return self.revoked_token_response()
         except Exception as e:
             # If authentication fails, let the view handle it
             pass
-        
-        return self.get_response(request)
+
+        return self.add_price_header(request, self.get_response(request))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        charge = self.get_charge(request)
+        if charge is None:
+            return None
+        user, price = charge
+        point_buffer = get_point_buffer()
+
+        # Check if user has sufficient points, counting deductions not yet written
+        pending = point_buffer.pending_for(user.pk) if point_buffer else 0
+        if not user.has_sufficient_points(pending):
+            return self.insufficient_points_response()
+
+        if point_buffer:
+            point_buffer.deduct(user, price)
+        else:
+            user.deduct_points(price)
+        request.points_charged = price
+
+        usage_buffer = get_usage_buffer()
+        if usage_buffer:
+            # Written by the buffer's own thread, never on this request
+            usage_buffer.record(user.pk, self.route_name(request), price)
+        return None
+
+    async def __acall__(self, request):
+        if not self.is_metered(request):
+            return await self.get_response(request)
+
+        try:
+            raw_token = self.get_bearer_token(request)
+            if raw_token:
+                revocation_index = get_revocation_index()
+                if revocation_index.refresh_due():
+                    await sync_to_async(revocation_index.refresh)()
+                validated_token = self.jwt_auth.get_validated_token(raw_token)
+                user = await self.jwt_auth.aget_user(validated_token)
+                self.authenticated(request, user, validated_token)
+
+        except RevokedToken:
+            # Revoked tokens are rejected before the user is loaded
+            return self.revoked_token_response()
+        except Exception as e:
+            # If authentication fails, let the view handle it
+            pass
+
+        return self.add_price_header(request, await self.get_response(request))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        charge = self.get_charge(request)
+        if charge is None:
+            return None
+        user, price = charge
+        point_buffer = get_point_buffer()
+
+        pending = point_buffer.pending_for(user.pk) if point_buffer else 0
+        if not user.has_sufficient_points(pending):
+            return self.insufficient_points_response()
+
+        if point_buffer:
+            # Only the in-memory part runs on the event loop, the write goes to a thread
+            point_buffer.deduct(user, price, flush=False)
+            if point_buffer.flush_due():
+                await sync_to_async(point_buffer.flush)()
+        else:
+            await user.adeduct_points(price)
+        request.points_charged = price
+
+        usage_buffer = get_usage_buffer()
+        if usage_buffer:
+            usage_buffer.record(user.pk, self.route_name(request), price)
+        return None
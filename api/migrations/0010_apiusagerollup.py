@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0009_tourpackage_tracking_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route', models.CharField(max_length=100)),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], default='minute', max_length=6)),
+                ('bucket_start', models.DateTimeField()),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('points', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'bucket_start'], name='usage_user_bucket_idx'), models.Index(fields=['granularity', 'bucket_start'], name='usage_granularity_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'route', 'granularity', 'bucket_start'), name='unique_usage_bucket')],
+            },
+        ),
+    ]
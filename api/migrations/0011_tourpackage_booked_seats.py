@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:59
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_booked_seats(apps, schema_editor):
+    TourPackage = apps.get_model('custom_api', 'TourPackage')
+    TourBooking = apps.get_model('custom_api', 'TourBooking')
+    booked = (
+        TourBooking.objects.filter(package=OuterRef('pk'))
+        .exclude(status='Cancelled')
+        .values('package')
+        .annotate(total=Sum('num_travelers'))
+        .values('total')
+    )
+    TourPackage.objects.update(booked_seats=Coalesce(Subquery(booked), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0010_apiusagerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourpackage',
+            name='booked_seats',
+            field=models.PositiveIntegerField(default=0, help_text='Seats held by bookings that are not cancelled'),
+        ),
+        migrations.RunPython(populate_booked_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:05
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0011_tourpackage_booked_seats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_seats', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('Active', 'Active'), ('Converted', 'Converted'), ('Expired', 'Expired'), ('Released', 'Released')], default='Active', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('tracking_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='seat_hold', to='custom_api.tourbooking')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='custom_api.tourpackage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx')],
+            },
+        ),
+    ]
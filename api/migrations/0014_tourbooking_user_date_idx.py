@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0013_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tourbooking',
+            index=models.Index(fields=['user', '-booking_date', '-id'], name='booking_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_booking_summaries(apps, schema_editor):
+    TourBooking = apps.get_model('custom_api', 'TourBooking')
+    BookingSummary = apps.get_model('custom_api', 'BookingSummary')
+    cancelled = Q(status='Cancelled')
+    rows = (
+        TourBooking.objects.values('user_id')
+        .annotate(
+            success_count=Count('pk', filter=~cancelled),
+            cancel_count=Count('pk', filter=cancelled),
+            spent_total=Coalesce(Sum('total_cost', filter=~cancelled), 0, output_field=DecimalField()),
+            refunded_total=Coalesce(Sum('total_cost', filter=cancelled), 0, output_field=DecimalField()),
+        )
+        .order_by('user_id')
+    )
+    BookingSummary.objects.bulk_create([BookingSummary(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0014_tourbooking_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='booking_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('cancel_count', models.PositiveIntegerField(default=0)),
+                ('spent_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refunded_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_booking_summaries, migrations.RunPython.noop),
+    ]
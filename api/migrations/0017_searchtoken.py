@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:25
+
+from django.db import migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    """FTS5 table used by api.search on SQLite, filled from the current rows"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS custom_api_search_fts USING fts5("
+        "kind UNINDEXED, name, place, body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO custom_api_search_fts (rowid, kind, name, place, body) "
+        "SELECT hotel_id * 2, 'hotel', hotel_name, hotel_country, "
+        "coalesce(description, '') || ' ' || coalesce(address, '') FROM custom_api_hotel"
+    )
+    schema_editor.execute(
+        "INSERT INTO custom_api_search_fts (rowid, kind, name, place, body) "
+        "SELECT id * 2 + 1, 'tour', name, destination, "
+        "itinerary || ' ' || coalesce(highlights, '') FROM custom_api_tourpackage"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS custom_api_search_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0016_catalog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('kind', models.CharField(max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('weight', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'kind'], name='searchtoken_term_idx'), models.Index(fields=['kind', 'object_id'], name='searchtoken_object_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
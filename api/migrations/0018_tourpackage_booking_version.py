@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0017_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourpackage',
+            name='booking_version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped whenever the package's bookings or seats change"),
+        ),
+        migrations.AddField(
+            model_name='tourpackage',
+            name='bookings_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
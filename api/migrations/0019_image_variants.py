@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_api', '0018_tourpackage_booking_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='primary_picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of primary_picture, see api/images.py'),
+        ),
+        migrations.AddField(
+            model_name='tourpackage',
+            name='images_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of images, see api/images.py'),
+        ),
+    ]
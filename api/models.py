@@ -1,4 +1,7 @@
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.utils import timezone
@@ -15,9 +18,9 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
-    def has_sufficient_points(self):
+    def has_sufficient_points(self, pending=0):
         """Check if user has sufficient points to make a request"""
-        return self.point > 0
+        return self.point - pending > 0
     
     def deduct_points(self, amount=settings.POINT_DEDUCTION_PER_REQUEST):
         """Deduct points from user account"""
@@ -25,24 +28,25 @@ class User(AbstractUser):
             self.point -= amount
             self.save(update_fields=['point'])
             if self.point <= 0:
-                # Invalidate JWT token by rotating the refresh token
-                from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
-                from rest_framework_simplejwt.tokens import RefreshToken
-                
-                try:
-                    refresh_token = RefreshToken.for_user(self)
-                    
-                    # Blacklist all outstanding tokens for the user
-                    OutstandingToken.objects.filter(user=self).delete()
-
-                    # Blacklist the refresh token
-                    BlacklistedToken.objects.create(token=str(refresh_token))
-                except Exception as e:
-                    # Handle any errors during token blacklisting
-                    print(f"Error blacklisting token: {e}")
+                self.invalidate_tokens()
             return True
         return False
 
+    async def adeduct_points(self, amount=settings.POINT_DEDUCTION_PER_REQUEST):
+        """Async version of deduct_points"""
+        if self.point >= amount:
+            self.point -= amount
+            await self.asave(update_fields=['point'])
+            if self.point <= 0:
+                await sync_to_async(self.invalidate_tokens)()
+            return True
+        return False
+
+    def invalidate_tokens(self):
+        """Invalidate JWT tokens once the user has run out of points"""
+        from .revocation import revoke_user_tokens
+        revoke_user_tokens(self.pk)
+
 class Hotel(models.Model):
     """
     Hotel model to store hotel information
@@ -51,16 +55,42 @@ class Hotel(models.Model):
     hotel_name = models.CharField(max_length=255)
     hotel_country = models.CharField(max_length=100)
     primary_picture = models.ImageField(upload_to='hotel_images/', null=True, blank=True)
+    primary_picture_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of primary_picture, see api/images.py")
     description = models.TextField(null=True, blank=True)
     address = models.TextField(null=True, blank=True)
     rating = models.FloatField(default=0.0, null=True, blank=True)
     price_range = models.CharField(max_length=50, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Keyset pagination orderings, see KeysetPagination
+        indexes = [
+            models.Index(fields=['created_at', 'hotel_id'], name='hotel_created_idx'),
+            models.Index(fields=['rating', 'hotel_id'], name='hotel_rating_idx'),
+        ]
     
     def __str__(self):
         return self.hotel_name
 
+class TourPackageQuerySet(models.QuerySet):
+    def with_availability(self):
+        """
+        Annotate ``total_booked`` and ``available_seats`` from the bookings
+        that are not cancelled, computed in the same query as the packages.
+
+        The sum is a correlated subquery rather than a join with GROUP BY,
+        which would read every package column (the deferred ones too) to
+        group on.
+        """
+        booked = TourBooking.objects.filter(package=OuterRef('pk')).exclude(status='Cancelled').values(
+            'package'
+        ).annotate(total=Sum('num_travelers')).values('total')
+        return self.annotate(
+            total_booked=Coalesce(Subquery(booked), 0),
+            available_seats=F('capacity') - F('total_booked'),
+        )
+
 class TourPackage(models.Model):
     """
     Model to store tour package details
@@ -74,7 +104,11 @@ class TourPackage(models.Model):
     end_date = models.DateField(default=timezone.now)
     last_booking_date = models.DateTimeField(null=True, blank=True)
     capacity = models.PositiveIntegerField(default=10)
+    booked_seats = models.PositiveIntegerField(default=0, help_text="Seats held by bookings that are not cancelled")
+    booking_version = models.PositiveIntegerField(default=0, help_text="Bumped whenever the package's bookings or seats change")
+    bookings_updated_at = models.DateTimeField(null=True, blank=True)
     images = models.ImageField(upload_to='tour_images/', null=True, blank=True)
+    images_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of images, see api/images.py")
     included_items = models.TextField(null=True, blank=True)
     excluded_items = models.TextField(null=True, blank=True)
     DIFFICULTY_CHOICES = [
@@ -88,6 +122,29 @@ class TourPackage(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     tracking_id = models.UUIDField(default=uuid.uuid4, editable=False)
 
+    objects = TourPackageQuerySet.as_manager()
+
+    class Meta:
+        # Keyset pagination orderings, see KeysetPagination
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='tourpackage_created_idx'),
+            models.Index(fields=['start_date', 'id'], name='tourpackage_start_idx'),
+            models.Index(fields=['price', 'id'], name='tourpackage_price_idx'),
+        ]
+
+    # Written only by the F() updates in api/booking.py
+    COUNTER_FIELDS = ('booked_seats', 'booking_version', 'bookings_updated_at')
+
+    def save(self, *args, **kwargs):
+        # A plain save() of a loaded package would write back counters read at
+        # load time, undoing seats claimed since; update every other column
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -109,6 +166,11 @@ class TourBooking(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
     tracking_id = models.UUIDField(editable=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-booking_date', '-id'], name='booking_user_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Calculate total cost before saving
         self.total_cost = self.package.price * self.num_travelers
@@ -118,3 +180,163 @@ class TourBooking(models.Model):
 
     def __str__(self):
         return f"Booking for {self.package.name} by {self.user.username}"
+
+class BookingSummary(models.Model):
+    """
+    Running totals of a user's bookings, updated in the same transaction as
+    every booking and cancellation so the account endpoints read them with
+    one primary key lookup. Spent and refunded totals are summed from
+    ``total_cost`` of the active and cancelled bookings.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='booking_summary'
+    )
+    success_count = models.PositiveIntegerField(default=0)
+    cancel_count = models.PositiveIntegerField(default=0)
+    spent_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunded_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Booking summary of {self.user_id}"
+
+class ApiUsageRollup(models.Model):
+    """
+    Aggregated API usage per user, route and time bucket.
+    Minute buckets are compacted into hour and then day buckets over time.
+    """
+    GRANULARITY_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='usage_rollups')
+    route = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=6, choices=GRANULARITY_CHOICES, default='minute')
+    bucket_start = models.DateTimeField()
+    request_count = models.PositiveIntegerField(default=0)
+    points = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'route', 'granularity', 'bucket_start'], name='unique_usage_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'bucket_start'], name='usage_user_bucket_idx'),
+            models.Index(fields=['granularity', 'bucket_start'], name='usage_granularity_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.route} by {self.user_id} at {self.bucket_start}"
+
+class SeatHold(models.Model):
+    """
+    Short-lived reservation of seats on a tour package. The seats are taken
+    from the package's booked_seats counter while the hold is active and are
+    either turned into a booking or released when the hold expires.
+    """
+    STATUS_CHOICES = [
+        ('Active', 'Active'),
+        ('Converted', 'Converted'),
+        ('Expired', 'Expired'),
+        ('Released', 'Released'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='seat_holds')
+    package = models.ForeignKey(TourPackage, on_delete=models.CASCADE, related_name='seat_holds')
+    num_seats = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    tracking_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    booking = models.OneToOneField(TourBooking, on_delete=models.SET_NULL, null=True, blank=True, related_name='seat_hold')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Hold of {self.num_seats} seat(s) on {self.package.name} by {self.user.username}"
+
+class IdempotencyRecord(models.Model):
+    """
+    First response to a request sent with an Idempotency-Key header. The key
+    is stored hashed together with the user and endpoint; ``status_code`` is
+    empty while the first request is still running.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in progress'})"
+
+class SearchToken(models.Model):
+    """
+    Inverted index row of the full-text search: one term of one hotel or
+    tour package with its field-weighted frequency. Used on databases
+    without SQLite FTS5, see ``api.search``.
+    """
+    term = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10)
+    object_id = models.PositiveIntegerField()
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'kind'], name='searchtoken_term_idx'),
+            models.Index(fields=['kind', 'object_id'], name='searchtoken_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.kind} {self.object_id}"
+
+class UploadSession(models.Model):
+    """
+    Resumable chunked upload. Chunks are appended at ``offset`` to a partial
+    file under MEDIA_ROOT until ``size`` bytes have arrived; completing the
+    session checks the SHA-256 of the whole file, after which it can be
+    attached to a hotel or tour package by ``tracking_id``.
+    """
+    STATUS_CHOICES = [
+        ('Uploading', 'Uploading'),
+        ('Complete', 'Complete'),
+        ('Attached', 'Attached'),
+    ]
+
+    tracking_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes, {self.status})"
+
+class MediaBlob(models.Model):
+    """
+    One stored file of the content-addressed media storage, named after the
+    SHA-256 of its bytes. ``refcount`` counts the saves not yet released by
+    a delete; unreferenced blobs are removed by the gc_media_blobs command.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
@@ -0,0 +1,248 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def query_params(request):
+    """Query parameters of a DRF request or a plain Django request"""
+    return getattr(request, 'query_params', request.GET)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination for plain Django async views.
+
+    Counts and slices the queryset with the async ORM and produces the same
+    ``count``/``next``/``previous``/``results`` payload as the synchronous
+    viewsets.
+    """
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        paginator.count = await queryset.acount()
+
+        page_number = request.GET.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            page_number = paginator.num_pages
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+
+        bottom = (number - 1) * paginator.per_page
+        top = bottom + paginator.per_page
+        objects = [obj async for obj in queryset[bottom:top]]
+        self.page = Page(objects, number, paginator)
+        return objects
+
+    def get_paginated_data(self, data):
+        return {
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+
+class BookingHistoryPagination(CursorPagination):
+    """
+    Keyset pagination for a user's booking history, newest booking first.
+    Pages are read by seeking past the cursor on (booking_date, id), so deep
+    pages cost the same as the first one.
+    """
+    ordering = ('-booking_date', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over ``(field, pk)`` for the catalog endpoints.
+
+    The view lists the orderings a client may pick with ``?ordering=`` in
+    ``keyset_orderings`` (name -> model field, ``-`` prefix for descending;
+    the first entry is the default). A page is read by seeking past the
+    ``(field, pk)`` pair at the edge of the previous page, so page 10,000
+    costs the same as page 1, and no ``COUNT(*)`` runs. Null values of a
+    nullable field sort last.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.finish_page([obj async for obj in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        """Order and filter ``queryset`` down to the requested page plus one row"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        orderings = getattr(view, 'keyset_orderings', None) or {'id': 'pk'}
+        ordering = query_params(request).get(self.ordering_query_param)
+        field = orderings.get(ordering) or next(iter(orderings.values()))
+        self.descending = field.startswith('-')
+        self.field = field.lstrip('-')
+        self.nullable = self.field != 'pk' and queryset.model._meta.get_field(self.field).null
+        self.pk_name = queryset.model._meta.pk.attname
+
+        self.position, self.reverse = self.decode_cursor(request, queryset.model)
+        if self.position is not None:
+            value, pk = self.position
+            queryset = queryset.filter(self.seek(value, pk, after=not self.reverse))
+        return queryset.order_by(*self.order_by(self.reverse))[:self.page_size + 1]
+
+    def finish_page(self, objects):
+        has_more = len(objects) > self.page_size
+        objects = objects[:self.page_size]
+        if self.reverse:
+            objects.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = objects
+        return objects
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                query_params(request)[self.page_size_query_param], strict=True, cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def order_by(self, reverse):
+        descending = self.descending != reverse
+        nulls = {}
+        if self.nullable:
+            # Nulls come last going forward, so first going backward
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        field = F(self.field).desc(**nulls) if descending else F(self.field).asc(**nulls)
+        return field, '-pk' if descending else 'pk'
+
+    def seek(self, value, pk, after):
+        """Rows after (or before) the ``(value, pk)`` position in forward order"""
+        op = 'lt' if self.descending == after else 'gt'
+        same_value_q = Q(**{f'pk__{op}': pk})
+        if value is None:
+            nulls = Q(**{f'{self.field}__isnull': True}) & same_value_q
+            return nulls if after else nulls | Q(**{f'{self.field}__isnull': False})
+        # Spelled so the leading range condition can seek on a (field, pk) index
+        q = Q(**{f'{self.field}__{op}e': value}) & (Q(**{f'{self.field}__{op}': value}) | same_value_q)
+        if self.nullable and after:
+            q |= Q(**{f'{self.field}__isnull': True})
+        return q
+
+    def decode_cursor(self, request, model):
+        """
+        ``((value, pk), reverse)`` of the request's cursor, with both values
+        converted by their model fields so a tampered cursor is a 404 here
+        rather than an error once the seek filter runs
+        """
+        encoded = query_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        pk_field = model._meta.pk
+        field = pk_field if self.field == 'pk' else model._meta.get_field(self.field)
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if pk is None or (value is None and not self.nullable):
+                raise ValueError('null position')
+            value = None if value is None else field.to_python(value)
+            return (value, pk_field.to_python(pk)), bool(reverse)
+        except (TypeError, ValueError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def position_of(self, obj):
+        """The ``(field, pk)`` pair of a model instance or a ``.values()`` row"""
+        if isinstance(obj, dict):
+            pk = obj[self.pk_name]
+            return (pk if self.field == 'pk' else obj[self.field]), pk
+        return getattr(obj, self.field), obj.pk
+
+    def encode_cursor(self, obj, reverse):
+        position = [*self.position_of(obj), int(reverse)]
+        encoded = base64.urlsafe_b64encode(json.dumps(position, default=str).encode('ascii'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Walked back past the first row: the next page starts at the beginning
+            url = remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+            return replace_query_param(url, 'pagination', 'cursor')
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Page numbers by default, or keyset pages when the request asks for them
+    with ``?pagination=cursor`` or carries a ``?cursor=``.
+    """
+    keyset_class = KeysetPagination
+    keyset = None
+
+    def use_keyset(self, request):
+        params = query_params(request)
+        return params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class AsyncCatalogPagination(AsyncPageNumberPagination):
+    """CatalogPagination for plain Django async views"""
+    keyset_class = KeysetPagination
+    keyset = None
+    use_keyset = CatalogPagination.use_keyset
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request)
+
+    def get_paginated_data(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_data(data)
+        return super().get_paginated_data(data)
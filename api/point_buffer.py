@@ -0,0 +1,168 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+
+class PointDeductionBuffer:
+    """
+    Write-behind buffer for per-request point deductions.
+
+    Deductions are summed per user in process memory and written back in
+    batches with atomic ``F('point') - n`` updates, either when the number of
+    buffered charges reaches ``flush_size`` or when ``flush_interval`` seconds
+    have passed since the last flush. Anything still pending is flushed when
+    the worker exits.
+    """
+    def __init__(self, flush_size=100, flush_interval=1.0, background=True):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def pending_for(self, user_id):
+        """Return the amount buffered for a user but not yet written"""
+        with self._lock:
+            return self._pending.get(user_id, 0.0)
+
+    def available_points(self, user):
+        """Return the user's balance minus any pending deductions"""
+        return user.point - self.pending_for(user.pk)
+
+    def deduct(self, user, amount=settings.POINT_DEDUCTION_PER_REQUEST, flush=True):
+        """
+        Buffer a deduction for the user. Mirrors ``User.deduct_points`` and
+        returns False without charging if the available balance is too low.
+        Pass ``flush=False`` to leave a due flush to the caller, e.g. from
+        async code that must not touch the database on the event loop.
+        """
+        with self._lock:
+            if user.point - self._pending.get(user.pk, 0.0) < amount:
+                return False
+            self._pending[user.pk] += amount
+            self._count += 1
+        if self.background:
+            self._ensure_thread()
+        if flush and self.flush_due():
+            self.flush()
+        return True
+
+    def flush_due(self):
+        """Whether the size or time threshold for a flush has been reached"""
+        with self._lock:
+            return (
+                self._count >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def flush(self):
+        """Write all pending deductions to the database"""
+        from .models import User
+
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = defaultdict(float)
+                self._count = 0
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    for user_id, amount in pending.items():
+                        User.objects.filter(pk=user_id).update(point=F('point') - amount)
+            except Exception:
+                # Put the amounts back so they are retried on the next flush
+                with self._lock:
+                    for user_id, amount in pending.items():
+                        self._pending[user_id] += amount
+                        self._count += 1
+                raise
+
+            for user in User.objects.filter(pk__in=list(pending), point__lte=0):
+                user.invalidate_tokens()
+            return len(pending)
+
+    def stop(self):
+        """Stop the background flusher and write out anything pending"""
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='point-deduction-flusher', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing point deductions: {e}")
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_point_buffer():
+    """
+    Return the process-wide deduction buffer, or None when write-behind
+    metering is disabled in settings.
+    """
+    global _buffer
+    if not getattr(settings, 'POINT_DEDUCTION_WRITE_BEHIND', False):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = PointDeductionBuffer(
+                    flush_size=getattr(settings, 'POINT_DEDUCTION_FLUSH_SIZE', 100),
+                    flush_interval=getattr(settings, 'POINT_DEDUCTION_FLUSH_INTERVAL', 1.0),
+                )
+                atexit.register(_stop_at_exit)
+    return _buffer
+
+
+def shutdown_point_buffer():
+    """
+    Stop the process-wide buffer and write out pending deductions before a
+    test database is destroyed; see ``usage.shutdown_usage_buffer``.
+    """
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        atexit.unregister(_stop_at_exit)
+        _stop(buffer)
+
+
+def _stop_at_exit():
+    if _buffer is not None:
+        _stop(_buffer)
+
+
+def _stop(buffer):
+    try:
+        buffer.stop()
+    except Exception as e:
+        print(f"Error flushing point deductions: {e}")
@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import keyset_columns
+
+
+class Projection:
+    """
+    Read-only fast path of a ModelSerializer for list endpoints.
+
+    Rows are read with ``.values()`` and mapped to output dicts through a
+    field plan compiled once from the serializer's own fields, so the output
+    is the same as ``serializer_class(rows, many=True).data`` without
+    building model instances or going through DRF's per-field attribute
+    lookups. Fields with no column behind them are given explicitly:
+    ``computed`` maps a field name to a function of the row (for
+    SerializerMethodFields), ``converters`` maps a field name to a function
+    of its column value (for tweaks made in ``to_representation``), and
+    ``requires`` lists the extra columns or annotations those functions read.
+    """
+    def __init__(self, serializer_class, computed=None, converters=None, requires=()):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+        self.converters = converters or {}
+        self.requires = tuple(requires)
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = self.compile()
+        return self._plan
+
+    def compile(self):
+        """
+        ``(columns, steps)``: the columns to select, and one
+        ``(name, column, convert, bound)`` step per output field in serializer
+        order. A step without a column is computed from the row; a bound
+        step's ``convert`` takes the request and returns the converter to use
+        for one call, so per-request state is looked up once, not per row.
+        """
+        serializer = self.serializer_class()
+        pk_name = serializer.Meta.model._meta.pk.attname
+        columns = [pk_name, *self.requires]
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed:
+                steps.append((name, None, self.computed[name], False))
+                continue
+            if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer,
+                                  serializers.RelatedField, serializers.ManyRelatedField)) \
+                    or field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{name} has no column to project; '
+                    f'give it in computed'
+                )
+            column = pk_name if field.source == 'pk' else field.source
+            columns.append(column)
+            if name in self.converters:
+                steps.append((name, column, self.converters[name], False))
+            elif hasattr(field, 'bind_request'):
+                steps.append((name, column, field.bind_request, True))
+            elif isinstance(field, serializers.FileField):
+                storage = serializer.Meta.model._meta.get_field(column).storage
+                steps.append((name, column, file_url(storage, field), True))
+            elif isinstance(field, serializers.DateTimeField) and is_iso_8601(field):
+                steps.append((name, column, iso_datetime(field), True))
+            else:
+                steps.append((name, column, fast_converter(field), False))
+        return list(dict.fromkeys(columns)), steps
+
+    def values(self, queryset, fields=None, extra=()):
+        """
+        ``queryset`` narrowed to the columns the plan reads, or only those
+        behind ``fields`` (a sparse fieldset) plus ``extra``
+        """
+        columns, steps = self.plan
+        if fields is not None:
+            # The pk and the computed fields' inputs are always read
+            kept = {columns[0], *self.requires}
+            kept.update(column for name, column, _, _ in steps if name in fields)
+            columns = [column for column in columns if column in kept]
+        return queryset.values(*dict.fromkeys([*columns, *extra]))
+
+    def serialize(self, rows, context=None):
+        """
+        The serializer's representation of ``.values()`` rows, limited to
+        ``context['fields']`` when that is set
+        """
+        context = context or {}
+        request = context.get('request')
+        fields = context.get('fields')
+        steps = [
+            (name, column, convert(request) if bound else convert)
+            for name, column, convert, bound in self.plan[1]
+            if fields is None or name in fields
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in steps:
+                if column is None:
+                    item[name] = convert(row)
+                else:
+                    value = row[column]
+                    # Serializer.to_representation passes None through untouched
+                    item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+
+def fast_converter(field):
+    """
+    ``field.to_representation``, or the builtin it amounts to for the common
+    scalar fields
+    """
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.CharField:
+        return str
+    return field.to_representation
+
+
+def is_iso_8601(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return output_format is not None and output_format.lower() == ISO_8601
+
+
+def iso_datetime(field):
+    """
+    DateTimeField.to_representation in ISO 8601, with the field's timezone
+    resolved once per call instead of once per value
+    """
+    def bind(request):
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if isinstance(value, str) or value.utcoffset() is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+    return bind
+
+
+def file_url(storage, field):
+    """FileField.to_representation of a stored file name, bound per request"""
+    def bind(request):
+        def convert(name):
+            if not name:
+                return None
+            if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+    return bind
+
+
+class ProjectionListMixin:
+    """
+    Serve ``list`` through the view's ``projection`` while
+    settings.FAST_LIST_SERIALIZERS is on
+    """
+    projection = None
+
+    def list(self, request, *args, **kwargs):
+        if self.projection is None or not settings.FAST_LIST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        context = self.get_serializer_context()
+        rows = self.projection.values(
+            self.filter_queryset(self.get_queryset()), context.get('fields'),
+            extra=keyset_columns(type(self)),
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.projection.serialize(page, context))
+        return Response(self.projection.serialize(rows, context))
@@ -0,0 +1,161 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+# Outstanding tokens whose jti starts with this prefix are not real refresh
+# tokens. Blacklisting one revokes every token issued to the user up to its
+# creation time.
+REVOKE_ALL_PREFIX = 'revoke-all-'
+
+
+class TokenRevocationIndex:
+    """
+    In-memory index of revoked JWTs, keyed by user id and token jti.
+
+    The index is backed by the simplejwt blacklist tables and loaded
+    incrementally: the highest ``BlacklistedToken`` id seen so far acts as a
+    version number, and a refresh only reads rows above it. Refreshes are
+    throttled to one every ``check_interval`` seconds, so between them a
+    revocation check never touches the database. Entries are dropped once
+    every token they could match has expired.
+    """
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._user_cutoffs = {}  # user id -> (iat cutoff, expires)
+        self._jtis = {}  # jti -> expires
+        self._version = 0
+        self._next_check = 0.0
+
+    def is_revoked(self, token):
+        """Check a validated token against the index without any I/O"""
+        now = time.time()
+        with self._lock:
+            expires = self._jtis.get(token.get(api_settings.JTI_CLAIM))
+            if expires is not None and expires > now:
+                return True
+            cutoff = self._user_cutoffs.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        if cutoff is None or cutoff[1] <= now:
+            return False
+        return token.get('iat', 0) <= cutoff[0]
+
+    def revoke_user(self, user_id, at=None):
+        """Revoke every token issued to the user up to ``at`` in this process"""
+        at = at or time.time()
+        expires = at + api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        with self._lock:
+            previous = self._user_cutoffs.get(str(user_id))
+            if previous is None or previous[0] < at:
+                self._user_cutoffs[str(user_id)] = (at, expires)
+
+    def refresh_due(self):
+        return time.monotonic() >= self._next_check
+
+    def refresh(self):
+        """Load blacklist rows added since the last refresh, in any worker"""
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        with self._refresh_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            rows = (
+                BlacklistedToken.objects
+                .filter(id__gt=self._version, token__expires_at__gt=timezone.now())
+                .order_by('id')
+                .values_list('id', 'token__jti', 'token__user_id', 'token__created_at', 'token__expires_at')
+            )
+            for row_id, jti, user_id, created_at, expires_at in rows:
+                if jti.startswith(REVOKE_ALL_PREFIX):
+                    if user_id is not None:
+                        self.revoke_user(user_id, created_at.timestamp())
+                else:
+                    with self._lock:
+                        self._jtis[jti] = expires_at.timestamp()
+                self._version = max(self._version, row_id)
+            self._prune()
+
+    def refresh_if_due(self):
+        if self.refresh_due():
+            self.refresh()
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            self._user_cutoffs = {k: v for k, v in self._user_cutoffs.items() if v[1] > now}
+            self._jtis = {k: v for k, v in self._jtis.items() if v > now}
+
+
+def blacklist_user_tokens(user_id):
+    """
+    Blacklist every outstanding refresh token of the user and record a
+    user-wide revocation marker so other workers also reject access tokens.
+    """
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    now = timezone.now()
+    with transaction.atomic():
+        tokens = list(OutstandingToken.objects.filter(user_id=user_id, blacklistedtoken__isnull=True))
+        marker = OutstandingToken.objects.create(
+            user_id=user_id,
+            jti=f'{REVOKE_ALL_PREFIX}{uuid.uuid4().hex}',
+            token='',
+            created_at=now,
+            expires_at=now + api_settings.ACCESS_TOKEN_LIFETIME,
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token=token) for token in tokens] + [BlacklistedToken(token=marker)]
+        )
+
+
+def _blacklist_in_background(user_id):
+    close_old_connections()
+    try:
+        blacklist_user_tokens(user_id)
+    except Exception as e:
+        # Handle any errors during token blacklisting
+        print(f"Error blacklisting token: {e}")
+    finally:
+        close_old_connections()
+
+
+_index = None
+_executor = None
+_lock = threading.Lock()
+
+
+def get_revocation_index():
+    """Return the process-wide token revocation index"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = TokenRevocationIndex(
+                    check_interval=getattr(settings, 'TOKEN_REVOCATION_CHECK_INTERVAL', 1.0)
+                )
+    return _index
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke all of a user's tokens. The local index is updated immediately and
+    the blacklist writes run on a background thread unless
+    TOKEN_REVOCATION_BACKGROUND_WRITES is disabled.
+    """
+    global _executor
+    get_revocation_index().revoke_user(user_id)
+
+    if not getattr(settings, 'TOKEN_REVOCATION_BACKGROUND_WRITES', True):
+        blacklist_user_tokens(user_id)
+        return
+
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-revocation')
+    _executor.submit(_blacklist_in_background, user_id)
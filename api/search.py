@@ -0,0 +1,203 @@
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+# Searchable models by kind, with the fields feeding each weighted column
+DOCUMENTS = {
+    'hotel': {
+        'model': 'Hotel',
+        'name': ('hotel_name',),
+        'place': ('hotel_country',),
+        'body': ('description', 'address'),
+    },
+    'tour': {
+        'model': 'TourPackage',
+        'name': ('name',),
+        'place': ('destination',),
+        'body': ('itinerary', 'highlights'),
+    },
+}
+KINDS = tuple(DOCUMENTS)
+COLUMN_WEIGHTS = {'name': 10.0, 'place': 5.0, 'body': 1.0}
+
+FTS_TABLE = 'custom_api_search_fts'
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+
+
+def kind_of(instance):
+    for kind, document in DOCUMENTS.items():
+        if instance._meta.object_name == document['model']:
+            return kind
+    return None
+
+
+def document_columns(kind, instance):
+    """The text of ``instance`` in the name, place and body columns"""
+    return {
+        column: ' '.join(str(getattr(instance, field) or '') for field in DOCUMENTS[kind][column])
+        for column in COLUMN_WEIGHTS
+    }
+
+
+def query_terms(query):
+    return [term[:MAX_TERM_LENGTH] for term in TERM_RE.findall(query.lower())]
+
+
+class FtsSearchIndex:
+    """
+    Search index in an SQLite FTS5 table ranked by bm25.
+
+    Each document's rowid encodes its kind and primary key, so updates and
+    deletes address a single row. Every query term is matched as a prefix
+    and all terms must match.
+    """
+    def rowid(self, kind, pk):
+        return pk * len(KINDS) + KINDS.index(kind)
+
+    def index(self, kind, instance):
+        columns = document_columns(kind, instance)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [self.rowid(kind, instance.pk)])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, kind, name, place, body) VALUES (%s, %s, %s, %s, %s)',
+                [self.rowid(kind, instance.pk), kind, columns['name'], columns['place'], columns['body']],
+            )
+
+    def remove(self, kind, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [self.rowid(kind, pk)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query, kinds=KINDS, limit=20):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Quoted so user input is never read as FTS5 query syntax
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        weights = ', '.join(str(COLUMN_WEIGHTS[column]) for column in ('name', 'place', 'body'))
+        placeholders = ', '.join(['%s'] * len(kinds))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, kind, bm25({FTS_TABLE}, 0, {weights}) AS score FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND kind IN ({placeholders}) ORDER BY score LIMIT %s',
+                [match, *kinds, limit],
+            )
+            # bm25 is lower for better matches
+            return [(kind, rowid // len(KINDS), -score) for rowid, kind, score in cursor.fetchall()]
+
+
+class InvertedSearchIndex:
+    """
+    Search index in the ``SearchToken`` table for databases without FTS5.
+
+    Each document stores one row per distinct term, weighted by how often
+    it appears in each column. A query matches terms by prefix, requires
+    every term to match and ranks by the summed weights, all in one query.
+    """
+    def index(self, kind, instance):
+        from .models import SearchToken
+
+        weights = Counter()
+        for column, text in document_columns(kind, instance).items():
+            for term in query_terms(text):
+                weights[term] += COLUMN_WEIGHTS[column]
+        with transaction.atomic():
+            self.remove(kind, instance.pk)
+            SearchToken.objects.bulk_create(
+                SearchToken(term=term, kind=kind, object_id=instance.pk, weight=weight)
+                for term, weight in weights.items()
+            )
+
+    def remove(self, kind, pk):
+        from .models import SearchToken
+        SearchToken.objects.filter(kind=kind, object_id=pk).delete()
+
+    def clear(self):
+        from .models import SearchToken
+        SearchToken.objects.all().delete()
+
+    def search(self, query, kinds=KINDS, limit=20):
+        from .models import SearchToken
+
+        terms = query_terms(query)
+        if not terms:
+            return []
+        matches = Q()
+        per_term = {}
+        for i, term in enumerate(terms):
+            matches |= Q(term__startswith=term)
+            per_term[f'matched_{i}'] = Count('pk', filter=Q(term__startswith=term))
+        rows = (
+            SearchToken.objects.filter(matches, kind__in=kinds)
+            .values('kind', 'object_id')
+            .annotate(score=Sum('weight'), **per_term)
+            .filter(**{f'{name}__gt': 0 for name in per_term})
+            .order_by('-score', 'kind', 'object_id')[:limit]
+        )
+        return [(row['kind'], row['object_id'], row['score']) for row in rows]
+
+
+_index = None
+
+
+def get_search_index():
+    """FTS5 on SQLite, the inverted index everywhere else"""
+    global _index
+    if _index is None:
+        _index = FtsSearchIndex() if connection.vendor == 'sqlite' else InvertedSearchIndex()
+    return _index
+
+
+def index_document(instance):
+    kind = kind_of(instance)
+    if kind is not None:
+        get_search_index().index(kind, instance)
+
+
+def remove_document(instance):
+    kind = kind_of(instance)
+    if kind is not None:
+        get_search_index().remove(kind, instance.pk)
+
+
+def search(query, kinds=KINDS, limit=20):
+    """
+    Ranked search over hotels and tour packages. Returns ``(kind, instance,
+    score)`` tuples, best match first, loading each kind with one query.
+    """
+    from .models import Hotel, TourPackage
+
+    hits = get_search_index().search(query, kinds, limit)
+    querysets = {'hotel': Hotel.objects.all(), 'tour': TourPackage.objects.with_availability()}
+    loaded = {}
+    for kind in kinds:
+        ids = [pk for hit_kind, pk, _ in hits if hit_kind == kind]
+        if ids:
+            loaded[kind] = querysets[kind].in_bulk(ids)
+    return [
+        (kind, loaded[kind][pk], score)
+        for kind, pk, score in hits
+        if pk in loaded.get(kind, {})
+    ]
+
+
+def rebuild_search_index(batch_size=500):
+    """Drop and re-create every search document; returns the count per kind"""
+    from .models import Hotel, TourPackage
+
+    index = get_search_index()
+    counts = {}
+    with transaction.atomic():
+        index.clear()
+        for kind, model in (('hotel', Hotel), ('tour', TourPackage)):
+            counts[kind] = 0
+            for instance in model.objects.iterator(chunk_size=batch_size):
+                index.index(kind, instance)
+                counts[kind] += 1
+    return counts
@@ -2,7 +2,12 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.db import models
-from .models import Hotel, TourPackage, TourBooking
+from .booking import booking_totals
+from .models import BookingSummary, Hotel, TourPackage, TourBooking, UploadSession
+from .fieldsets import SparseFieldsMixin
+from .images import ImageVariantsField, validate_image_pixels
+from .projection import Projection
+from .uploads import UploadReferenceMixin
 from django.utils import timezone
 
 User = get_user_model()
@@ -44,68 +49,156 @@ class UserBookingHistoryItemSerializer(serializers.ModelSerializer):
         read_only_fields = fields # Make all fields read-only for history display
 
 class UserDetailSerializer(serializers.ModelSerializer):
-    """Serializer for User details including booking history and booking summary"""
-    tour_bookings = UserBookingHistoryItemSerializer(many=True, read_only=True)
+    """
+    Serializer for User details including booking summary. The user's most
+    recent bookings are nested only when the request asks for them with
+    ``?include_bookings=true`` (up to ``?bookings_limit=``, default 10);
+    the full history is paginated by ``user/bookings/history/``.
+    """
+    tour_bookings = serializers.SerializerMethodField()
     booking_summary = serializers.SerializerMethodField()
 
+    BOOKINGS_LIMIT = 10
+    MAX_BOOKINGS_LIMIT = 100
+
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'point', 'created_at', 'booking_summary', 'tour_bookings')
         read_only_fields = ('id', 'point', 'created_at', 'booking_summary', 'tour_bookings')
 
-    def get_booking_summary(self, obj):
-        """Calculates booking summary statistics for the user"""
-        total_booking_success = obj.tour_bookings.filter(status='Pending').count() # Assuming 'Pending' means successful booking
-        total_booking_cancel = obj.tour_bookings.filter(status='Cancelled').count()
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.include_bookings():
+            fields.pop('tour_bookings')
+        return fields
+
+    def include_bookings(self):
+        request = self.context.get('request')
+        return request is not None and request.query_params.get('include_bookings', '').lower() in ('1', 'true')
 
-        total_return_point = obj.tour_bookings.filter(status='Cancelled').aggregate(total_refund=models.Sum('total_cost'))['total_refund'] or 0
-        # To calculate total spent, we need to sum the total_cost of all bookings that are not cancelled.
-        # Assuming total_cost is stored on the booking object when created.
-        total_spend_point = obj.tour_bookings.exclude(status='Cancelled').aggregate(total_spent=models.Sum('total_cost'))['total_spent'] or 0
+    def get_tour_bookings(self, obj):
+        """The user's most recent bookings, newest first"""
+        try:
+            limit = int(self.context['request'].query_params.get('bookings_limit', self.BOOKINGS_LIMIT))
+        except ValueError:
+            limit = self.BOOKINGS_LIMIT
+        limit = min(max(limit, 0), self.MAX_BOOKINGS_LIMIT)
+        bookings = obj.tour_bookings.select_related('package').order_by('-booking_date', '-id')[:limit]
+        return UserBookingHistoryItemSerializer(bookings, many=True).data
+
+    def get_booking_summary(self, obj):
+        """Booking summary statistics, read from the user's BookingSummary row"""
+        try:
+            summary = obj.booking_summary
+            totals = {
+                'success_count': summary.success_count,
+                'cancel_count': summary.cancel_count,
+                'spent_total': summary.spent_total,
+                'refunded_total': summary.refunded_total,
+            }
+        except BookingSummary.DoesNotExist:
+            # Users who never booked have no summary row yet
+            totals = booking_totals(obj.pk)
 
         return {
-            "total_booking_success": total_booking_success,
-            "total_booking_cancel": total_booking_cancel,
-            "total_return_point": total_return_point,
-            "total_spend_point": total_spend_point,
+            "total_booking_success": totals['success_count'],
+            "total_booking_cancel": totals['cancel_count'],
+            "total_return_point": totals['refunded_total'],
+            "total_spend_point": totals['spent_total'],
         }
 
-class HotelSerializer(serializers.ModelSerializer):
+class HotelSerializer(UploadReferenceMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Hotel model"""
+    primary_picture_variants = ImageVariantsField()
+    primary_picture_upload = serializers.UUIDField(write_only=True, required=False, help_text="tracking_id of a completed upload to use as primary_picture")
+    upload_fields = {'primary_picture_upload': 'primary_picture'}
+
     class Meta:
         model = Hotel
         fields = '__all__'
         read_only_fields = ('hotel_id', 'created_at', 'updated_at')
+        extra_kwargs = {'primary_picture': {'validators': [validate_image_pixels]}}
 
 class GivePointsSerializer(serializers.Serializer):
     """Serializer for giving points to a user"""
     user_id = serializers.IntegerField(required=True)
     points = serializers.FloatField(required=True)
 
-class TourPackageSerializer(serializers.ModelSerializer):
+class SearchQuerySerializer(serializers.Serializer):
+    """Serializer for full-text search query parameters"""
+    q = serializers.CharField(required=True, max_length=200)
+    type = serializers.ChoiceField(choices=('all', 'hotel', 'tour'), default='all')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+class UsageQuerySerializer(serializers.Serializer):
+    """Serializer for API usage time series query parameters"""
+    user_id = serializers.IntegerField(required=False)
+    route = serializers.CharField(required=False)
+    granularity = serializers.ChoiceField(choices=('minute', 'hour', 'day'), default='hour')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now())
+        attrs.setdefault('start', attrs['end'] - timezone.timedelta(days=1))
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({"start": "start must be before end."})
+        return attrs
+
+def total_booked(package):
+    """
+    Seats booked on a package, read from the ``with_availability()``
+    annotation when the queryset has it
+    """
+    booked = getattr(package, 'total_booked', None)
+    if booked is None:
+        booked = package.bookings.exclude(status='Cancelled').aggregate(
+            total_booked=models.Sum('num_travelers')
+        )['total_booked'] or 0
+    return booked
+
+class TourPackageSerializer(UploadReferenceMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for TourPackage model"""
     total_capacity = serializers.IntegerField(source='capacity', read_only=True)
     already_booking = serializers.SerializerMethodField(read_only=True)
     available_sit = serializers.SerializerMethodField(read_only=True)
+    images_variants = ImageVariantsField()
+    images_upload = serializers.UUIDField(write_only=True, required=False, help_text="tracking_id of a completed upload to use as images")
+    upload_fields = {'images_upload': 'images'}
 
     class Meta:
         model = TourPackage
-        fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at', 'total_capacity', 'already_booking', 'available_sit')
+        exclude = ('booking_version', 'bookings_updated_at')
+        read_only_fields = ('created_at', 'updated_at', 'booked_seats', 'total_capacity', 'already_booking', 'available_sit')
+        extra_kwargs = {'images': {'validators': [validate_image_pixels]}}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.last_booking_date:
-            representation['last_booking_date'] = instance.last_booking_date.strftime('%Y-%m-%d %H:%M:%S')
+            representation['last_booking_date'] = format_last_booking_date(instance.last_booking_date)
         return representation
 
     def get_already_booking(self, obj):
         """Calculate the number of already booked seats"""
-        return obj.bookings.aggregate(total_booked=models.Sum('num_travelers'))['total_booked'] or 0
+        return total_booked(obj)
 
     def get_available_sit(self, obj):
         """Calculate the number of available seats"""
-        return obj.capacity - (obj.bookings.aggregate(total_booked=models.Sum('num_travelers'))['total_booked'] or 0)
+        return obj.capacity - total_booked(obj)
+
+def format_last_booking_date(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+# TourPackageSerializer over with_availability() rows, see Projection
+tour_package_projection = Projection(
+    TourPackageSerializer,
+    computed={
+        'already_booking': lambda row: row['total_booked'],
+        'available_sit': lambda row: row['capacity'] - row['total_booked'],
+    },
+    converters={'last_booking_date': format_last_booking_date},
+    requires=('capacity', 'total_booked'),
+)
 
 class TourBookingSerializer(serializers.ModelSerializer):
     """Serializer for TourBooking model"""
@@ -116,21 +209,57 @@ class TourBookingSerializer(serializers.ModelSerializer):
         fields = ('package_tracking_id', 'num_travelers')
         read_only_fields = ('booking_date', 'total_cost', 'user', 'package') # Mark package as read-only here
 
-class TourDetailSerializer(serializers.ModelSerializer):
+class BulkTourBookingSerializer(serializers.Serializer):
+    """Serializer for booking several tour packages in one request"""
+    bookings = TourBookingSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=True, help_text="Book all items or none of them")
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for opening and reporting on a chunked upload"""
+    class Meta:
+        model = UploadSession
+        fields = ('tracking_id', 'filename', 'content_type', 'size', 'offset', 'status', 'sha256', 'expires_at')
+        read_only_fields = ('tracking_id', 'offset', 'status', 'sha256', 'expires_at')
+
+class UploadCompleteSerializer(serializers.Serializer):
+    """Serializer for the checksum that completes a chunked upload"""
+    checksum = serializers.RegexField(r'^(sha256:)?[0-9a-fA-F]{64}$', help_text="SHA-256 of the whole file, hex, optionally prefixed with 'sha256:'")
+
+    def validate_checksum(self, value):
+        return value.lower().removeprefix('sha256:')
+
+class SeatHoldSerializer(serializers.Serializer):
+    """Serializer for requesting a seat hold on a tour package"""
+    package_tracking_id = serializers.UUIDField()
+    num_seats = serializers.IntegerField(min_value=1)
+
+class TourDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for TourPackage model with booking details"""
     bookings = serializers.SerializerMethodField()
     is_active = serializers.SerializerMethodField()
+    images_variants = ImageVariantsField()
 
     class Meta:
         model = TourPackage
-        fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at')
+        exclude = ('booking_version', 'bookings_updated_at')
+        read_only_fields = ('created_at', 'updated_at', 'booked_seats')
 
     def get_bookings(self, obj):
         """Get total booked and available seats"""
-        total_booked = obj.bookings.aggregate(total_booked=models.Sum('num_travelers'))['total_booked'] or 0
-        available_sit = obj.capacity - total_booked
-        return {'total_booked': total_booked, 'available_sit': available_sit}
+        booked = total_booked(obj)
+        return {'total_booked': booked, 'available_sit': obj.capacity - booked}
 
     def get_is_active(self, obj):
         return timezone.now().date() <= obj.end_date
+
+# TourDetailSerializer over with_availability() rows, see Projection
+tour_detail_projection = Projection(
+    TourDetailSerializer,
+    computed={
+        'bookings': lambda row: {
+            'total_booked': row['total_booked'], 'available_sit': row['capacity'] - row['total_booked'],
+        },
+        'is_active': lambda row: timezone.now().date() <= row['end_date'],
+    },
+    requires=('capacity', 'end_date', 'total_booked'),
+)
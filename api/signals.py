@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from .catalog_cache import catalog_changed
+from .credential_cache import get_credential_cache
+from .images import IMAGE_FIELDS, counts_references, queue_discard, queue_variants, release_image
+from .models import Hotel, TourBooking, TourPackage
+from .search import index_document, remove_document
 
 User = get_user_model()
 
@@ -9,3 +14,66 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         # You can add any initial profile setup here
         pass
+
+@receiver(post_save, sender=User)
+def invalidate_cached_credentials(sender, instance, created, update_fields=None, **kwargs):
+    """Drop cached Basic auth credentials when a user's password or status may have changed"""
+    if created or (update_fields is not None and not {'password', 'is_active'} & set(update_fields)):
+        return
+    cache = get_credential_cache()
+    if cache is not None:
+        cache.invalidate_user(instance.pk)
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=TourPackage)
+def update_search_index(sender, instance, **kwargs):
+    """Re-index a hotel or tour package in the same transaction as its write"""
+    index_document(instance)
+
+@receiver(post_delete, sender=Hotel)
+@receiver(post_delete, sender=TourPackage)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_document(instance)
+
+@receiver(post_save, sender=TourPackage)
+@receiver(post_delete, sender=TourPackage)
+@receiver(post_save, sender=TourBooking)
+@receiver(post_delete, sender=TourBooking)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Drop cached tour catalog pages once the write commits"""
+    catalog_changed()
+
+@receiver(pre_save, sender=Hotel)
+@receiver(pre_save, sender=TourPackage)
+def reset_stale_image_variants(sender, instance, **kwargs):
+    """Forget the variants of an image that is being replaced or removed"""
+    image_field, variants_field = IMAGE_FIELDS[sender]
+    variants = getattr(instance, variants_field) or {}
+    if variants.get('source', '') != (getattr(instance, image_field).name or ''):
+        queue_discard(sender, variants)
+        setattr(instance, variants_field, {})
+
+@receiver(pre_save, sender=Hotel)
+@receiver(pre_save, sender=TourPackage)
+def release_replaced_image(sender, instance, **kwargs):
+    """Drop the blob reference of an image that is being replaced or removed"""
+    if instance.pk is None or not counts_references(sender):
+        return
+    image_field = IMAGE_FIELDS[sender][0]
+    previous = sender.objects.filter(pk=instance.pk).values_list(image_field, flat=True).first()
+    if previous and previous != getattr(instance, image_field).name:
+        release_image(sender, previous)
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=TourPackage)
+def generate_image_variants(sender, instance, **kwargs):
+    image_field, variants_field = IMAGE_FIELDS[sender]
+    if getattr(instance, image_field) and not getattr(instance, variants_field):
+        queue_variants(sender, instance.pk)
+
+@receiver(post_delete, sender=Hotel)
+@receiver(post_delete, sender=TourPackage)
+def discard_image_variants(sender, instance, **kwargs):
+    image_field, variants_field = IMAGE_FIELDS[sender]
+    queue_discard(sender, getattr(instance, variants_field))
+    release_image(sender, getattr(instance, image_field).name)
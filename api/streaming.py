@@ -0,0 +1,58 @@
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+json_renderer = JSONRenderer()
+
+
+def serialized_chunks(queryset, serializer_class, chunk_size, context=None):
+    """
+    Read ``queryset`` with a server-side iterator and serialize it
+    ``chunk_size`` rows at a time, yielding one list of dicts per chunk.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield serializer_class(chunk, many=True, context=context or {}).data
+
+
+def json_array(chunks):
+    """
+    Encode chunks as one JSON array, byte for byte what JSONRenderer
+    produces for the whole list
+    """
+    yield b'['
+    first = True
+    for chunk in chunks:
+        body = json_renderer.render(chunk)[1:-1]
+        if body:
+            yield body if first else b',' + body
+            first = False
+    yield b']'
+
+
+def ndjson(chunks):
+    """Encode chunks as newline-delimited JSON, one object per line"""
+    # The encoding options JSONRenderer uses for compact output
+    encoder = encoders.JSONEncoder(
+        ensure_ascii=json_renderer.ensure_ascii, separators=(',', ':'), allow_nan=False
+    )
+    for chunk in chunks:
+        yield ''.join(encoder.encode(item) + '\n' for item in chunk).encode()
+
+
+def stream_queryset(queryset, serializer_class, chunk_size, format='json', context=None):
+    """
+    StreamingHttpResponse of a serialized queryset, as a JSON array or as
+    NDJSON. Memory is bounded by one chunk whatever the queryset size.
+    """
+    chunks = serialized_chunks(queryset, serializer_class, chunk_size, context)
+    if format == 'ndjson':
+        return StreamingHttpResponse(ndjson(chunks), content_type=NDJSON_MEDIA_TYPE)
+    return StreamingHttpResponse(json_array(chunks), content_type=json_renderer.media_type)
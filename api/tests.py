@@ -1,10 +1,49 @@
 from django.test import TestCase
-from django.urls import reverse
+from django.urls import reverse, resolve
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
-from .models import TourPackage, TourBooking
+from .models import TourPackage, TourBooking, Hotel, ApiUsageRollup, SeatHold, IdempotencyRecord, BookingSummary, UploadSession, MediaBlob
 from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from django.test import override_settings
+from .revocation import REVOKE_ALL_PREFIX
+from .holds import AdmissionQueue, SoldOut, release_expired_holds
+from .booking import BookingError, booking_totals, cancel_package_bookings, refund_percentage
+from .idempotency import purge_expired
+from .uploads import UploadError, partial_path, write_chunk
+from .serializers import (TourDetailSerializer, TourPackageSerializer, UserBookingHistoryItemSerializer,
+                          UserDetailSerializer, tour_detail_projection, tour_package_projection)
+from .projection import Projection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.core.exceptions import ImproperlyConfigured
+from .views import TourPackageViewSet
+from django.contrib.auth import authenticate
+from unittest import mock
+from io import StringIO
+from django.core.management import call_command
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import json
+import uuid
+from decimal import Decimal
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from . import async_views
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 
 class CancelBookingTests(TestCase):
     def setUp(self):
@@ -91,3 +130,2172 @@ class CancelBookingTests(TestCase):
         url = reverse('cancel-booking', args=[self.booking.id])
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(TOKEN_REVOCATION_BACKGROUND_WRITES=False)
+class PointDeductionBufferTests(TestCase):
+    def setUp(self):
+        from .point_buffer import PointDeductionBuffer
+        from .revocation import TokenRevocationIndex
+        patcher = mock.patch('api.revocation._index', TokenRevocationIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username='metered', password='testpassword', email='metered@example.com', point=1.0
+        )
+        self.buffer = PointDeductionBuffer(flush_size=3, flush_interval=60, background=False)
+
+    def test_deductions_are_held_until_flush_size(self):
+        self.buffer.deduct(self.user, 0.1)
+        self.buffer.deduct(self.user, 0.1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.point, 1.0)
+        self.assertAlmostEqual(self.buffer.pending_for(self.user.pk), 0.2)
+
+        self.buffer.deduct(self.user, 0.1)
+        self.user.refresh_from_db()
+        self.assertAlmostEqual(self.user.point, 0.7)
+        self.assertEqual(self.buffer.pending_for(self.user.pk), 0)
+
+    def test_deduct_checks_balance_minus_pending(self):
+        self.assertTrue(self.buffer.deduct(self.user, 0.6))
+        self.assertFalse(self.buffer.deduct(self.user, 0.6))
+        self.assertAlmostEqual(self.buffer.available_points(self.user), 0.4)
+
+    def test_middleware_uses_buffer_and_rejects_exhausted_balance(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with mock.patch('api.middleware.get_point_buffer', return_value=self.buffer):
+            self.buffer.deduct(self.user, 1.0)
+            response = client.get('/api/tourdetails/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.point, 1.0)
+
+        self.buffer.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.point, 0.0)
+
+
+# A time-based usage flush would add its own user query to the request
+@override_settings(API_USAGE_ROLLUPS=False)
+class RequestScopedAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='scoped', password='testpassword', email='scoped@example.com'
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_lookups(self, queries):
+        table = get_user_model()._meta.db_table
+        return [
+            q['sql'] for q in queries
+            if q['sql'].startswith('SELECT') and f'FROM "{table}"' in q['sql']
+        ]
+
+    def test_one_user_lookup_per_request(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/user/account/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'scoped')
+        self.assertEqual(len(self.user_lookups(ctx.captured_queries)), 1)
+
+    def test_skipped_paths_still_authenticate_in_drf(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/auth/points/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.user_lookups(ctx.captured_queries)), 1)
+
+    def test_invalid_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = self.client.get('/api/user/account/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class VerifiedCredentialCacheTests(TestCase):
+    def setUp(self):
+        from .credential_cache import get_credential_cache
+        self.cache = get_credential_cache()
+        self.cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='basic', password='basic-password-123', email='basic@example.com'
+        )
+        token = base64.b64encode(b'basic:basic-password-123').decode()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {token}')
+        self.url = reverse('hotel-search-basic')
+
+    def test_search_authenticates_once_per_request(self):
+        with mock.patch('api.credential_cache.authenticate', wraps=authenticate) as auth:
+            response = self.client.post(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(auth.call_count, 1)
+
+            response = self.client.post(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(auth.call_count, 1)
+
+    def test_cache_keys_do_not_contain_plaintext(self):
+        self.client.post(self.url)
+        for key, entry in self.cache._entries.items():
+            self.assertNotIn(b'basic-password-123', key)
+            self.assertNotIn('basic-password-123', str(entry))
+
+    def test_password_change_invalidates_entry(self):
+        self.client.post(self.url)
+        self.user.set_password('another-password-456')
+        self.user.save()
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_invalidates_entry_in_other_workers(self):
+        self.client.post(self.url)
+        # A queryset update skips signals, as a write from another worker would
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.cache.get('basic', 'basic-password-123'))
+
+    def test_unrelated_saves_keep_entry(self):
+        self.client.post(self.url)
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(len(self.cache._entries), 1)
+
+        self.user.set_password('another-password-456')
+        self.user.save(update_fields=['password'])
+        self.assertEqual(len(self.cache._entries), 0)
+        self.assertEqual(self.cache._user_keys, {})
+
+    def test_invalidate_user_only_drops_that_user(self):
+        other = get_user_model().objects.create_user(username='other', password='other-password-123')
+        self.cache.set('basic', 'basic-password-123', self.user)
+        self.cache.set('other', 'other-password-123', other)
+        self.cache.invalidate_user(self.user.pk)
+        self.assertIsNone(self.cache.get('basic', 'basic-password-123'))
+        self.assertEqual(self.cache.get('other', 'other-password-123'), other)
+
+    def test_wrong_password_is_rejected(self):
+        token = base64.b64encode(b'basic:wrong-password').decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {token}')
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='async', password='testpassword', email='async@example.com'
+        )
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+        self.tour = TourPackage.objects.create(
+            name='Async Tour', destination='Sylhet', duration=3, price=50, itinerary='Day 1', capacity=8,
+        )
+        TourBooking.objects.create(user=self.user, package=self.tour, num_travelers=3)
+        Hotel.objects.create(hotel_name='Sea View', hotel_country='Bangladesh')
+        Hotel.objects.create(hotel_name='Hill Top', hotel_country='Nepal')
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, path, *args, **headers):
+        return async_to_sync(view)(self.factory.get(path, headers=headers), *args)
+
+    def test_tour_detail_list_matches_sync_view(self):
+        expected = APIClient().get('/api/tourdetails/').json()
+        response = self.call(async_views.tour_detail_list, '/api/tourdetails/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(expected['results'][0]['bookings'], {'total_booked': 3, 'available_sit': 5})
+
+    def test_tour_detail_retrieve_matches_sync_view(self):
+        path = f'/api/tourdetails/{self.tour.tracking_id}/'
+        expected = APIClient().get(path).json()
+        response = self.call(async_views.tour_detail_retrieve, path, str(self.tour.tracking_id))
+        self.assertEqual(json.loads(response.content), expected)
+
+        response = self.call(async_views.tour_detail_retrieve, '/api/tourdetails/nope/', 'nope')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_hotel_list_requires_authentication(self):
+        response = self.call(async_views.hotel_list, '/api/hotels/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.call(async_views.hotel_list, '/api/hotels/?country=nep', authorization=self.token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['hotel_name'], 'Hill Top')
+
+    def test_hotel_list_cursor_matches_sync_view(self):
+        path = '/api/hotels/?pagination=cursor&page_size=1'
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.token)
+        expected = client.get(path).json()
+        response = self.call(async_views.hotel_list, path, authorization=self.token)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertIsNotNone(expected['next'])
+
+    def test_tour_detail_user_returns_404_body(self):
+        path = f'/api/user/tourpackages/{uuid.uuid4()}/details/'
+        response = self.call(async_views.tour_detail_user_async, path, uuid.uuid4(), authorization=self.token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(json.loads(response.content), {'error': 'Tour package not found'})
+
+    async def test_async_middleware_deducts_points(self):
+        response = await self.async_client.get('/api/tourdetails/', headers={'authorization': self.token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        await self.user.arefresh_from_db()
+        self.assertAlmostEqual(self.user.point, 100 - 0.001)
+
+
+@override_settings(TOKEN_REVOCATION_BACKGROUND_WRITES=False)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        from .revocation import TokenRevocationIndex
+        self.index = TokenRevocationIndex(check_interval=3600)
+        patcher = mock.patch('api.revocation._index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(
+            username='revoked', password='testpassword', email='revoked@example.com', point=0.001
+        )
+        self.refresh = RefreshToken.for_user(self.user)
+        self.token = AccessToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_exhausted_user_is_rejected_without_queries(self):
+        self.index.refresh()
+        response = self.client.get('/api/tourdetails/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.index.is_revoked(self.token))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tourdetails/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'error': 'Token has been revoked.'})
+
+    def test_revocation_is_written_to_blacklist(self):
+        self.user.deduct_points(0.001)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=self.refresh['jti']).exists())
+        self.assertTrue(BlacklistedToken.objects.filter(
+            token__user=self.user, token__jti__startswith=REVOKE_ALL_PREFIX
+        ).exists())
+
+    async def test_async_deduction_writes_revocation_off_the_event_loop(self):
+        self.assertTrue(await self.user.adeduct_points(0.001))
+        self.assertTrue(await BlacklistedToken.objects.filter(token__jti=self.refresh['jti']).aexists())
+
+    def test_other_workers_pick_up_revocations(self):
+        from .revocation import TokenRevocationIndex, blacklist_user_tokens
+        blacklist_user_tokens(self.user.pk)
+        other_worker = TokenRevocationIndex()
+        self.assertFalse(other_worker.is_revoked(self.token))
+        other_worker.refresh()
+        self.assertTrue(other_worker.is_revoked(self.token))
+
+    def test_drf_authentication_rejects_revoked_token(self):
+        self.index.revoke_user(self.user.pk)
+        response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class MeteringEngineTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='priced', password='testpassword', email='priced@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_price_table_lookup(self):
+        from .metering import MeteringEngine
+        engine = MeteringEngine({'hotel-list': 5, 'api/bookings/cancel/': 2}, 0.001)
+        self.assertEqual(engine.price_for(resolve('/api/hotels/')), 5.0)
+        self.assertEqual(engine.price_for(resolve('/api/bookings/cancel/')), 2.0)
+        self.assertEqual(engine.price_for(resolve('/api/tourdetails/')), 0.001)
+
+    def test_hotel_requests_cost_five_points(self):
+        response = self.client.get('/api/hotels/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Points-Charged'], '5.0')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.point, 995)
+
+    def test_booking_is_charged_once(self):
+        package = TourPackage.objects.create(
+            name='Priced Tour', destination='Cox', duration=2, price=10, itinerary='-', capacity=5,
+        )
+        response = self.client.post('/api/tourbookings/', {
+            'package_tracking_id': str(package.tracking_id), 'num_travelers': 2,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['X-Points-Charged'], '0.001')
+        self.user.refresh_from_db()
+        self.assertAlmostEqual(self.user.point, 1000 - 20 - 0.001)
+
+    def test_unmetered_paths_have_no_price_header(self):
+        response = self.client.get('/api/auth/points/')
+        self.assertNotIn('X-Points-Charged', response)
+
+
+class ApiUsageRollupTests(TestCase):
+    def setUp(self):
+        from .usage import UsageRollupBuffer
+        self.buffer = UsageRollupBuffer(flush_size=2, flush_interval=3600, background=False)
+        patcher = mock.patch('api.middleware.get_usage_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(
+            username='usage', password='testpassword', email='usage@example.com', point=1000
+        )
+        self.admin = get_user_model().objects.create_superuser(
+            username='usage-admin', password='testpassword', email='usage-admin@example.com'
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_requests_are_rolled_up_per_route_and_minute(self):
+        self.client.get('/api/hotels/')
+        self.client.get('/api/hotels/')
+        self.client.get('/api/tourdetails/')
+        self.assertEqual(ApiUsageRollup.objects.count(), 0)
+
+        self.buffer.flush()
+        rows = {r.route: r for r in ApiUsageRollup.objects.filter(user=self.user)}
+        self.assertEqual(rows['hotel-list'].request_count, 2)
+        self.assertEqual(rows['hotel-list'].points, 10.0)
+        self.assertEqual(rows['hotel-list'].granularity, 'minute')
+        self.assertEqual(rows['tourdetail-list'].request_count, 1)
+
+        self.client.get('/api/hotels/')
+        self.buffer.flush()
+        self.assertEqual(ApiUsageRollup.objects.get(user=self.user, route='hotel-list').request_count, 3)
+
+    def test_failed_flush_keeps_the_counters(self):
+        self.buffer.record(self.user.pk, 'hotel-list', 5.0)
+        self.buffer.record(self.user.pk, 'hotel-list', 5.0)
+        with mock.patch('api.usage.add_to_bucket', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(ApiUsageRollup.objects.count(), 0)
+        self.buffer.flush()
+        row = ApiUsageRollup.objects.get(user=self.user)
+        self.assertEqual((row.request_count, row.points), (2, 10.0))
+
+    def test_requests_never_flush_inline(self):
+        # flush_size is 2, so the old inline path would have written here
+        with mock.patch.object(self.buffer, 'flush', side_effect=AssertionError('flushed on a request')):
+            for _ in range(3):
+                self.assertEqual(self.client.get('/api/hotels/').status_code, status.HTTP_200_OK)
+
+    def test_background_flusher_writes_when_the_buffer_fills(self):
+        from .usage import UsageRollupBuffer
+        buffer = UsageRollupBuffer(flush_size=2, flush_interval=3600)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, 'flush', side_effect=lambda: flushed.set()):
+            buffer.record(self.user.pk, 'hotel-list', 5.0)
+            self.assertFalse(flushed.wait(0.2))
+            buffer.record(self.user.pk, 'hotel-list', 5.0)
+            self.assertTrue(flushed.wait(5))
+        buffer._stopped.set()
+        buffer._wake.set()
+
+    def test_shutdown_flushes_into_the_current_database(self):
+        from . import usage
+        with override_settings(API_USAGE_ROLLUPS=True, USAGE_FLUSH_INTERVAL=3600):
+            buffer = usage.get_usage_buffer()
+        buffer.record(self.user.pk, 'hotel-list', 5.0)
+        with mock.patch('api.usage.atexit') as exit_hooks:
+            usage.shutdown_usage_buffer()
+        exit_hooks.unregister.assert_called_once_with(usage._stop_at_exit)
+        self.assertIsNone(usage._buffer)
+        self.assertFalse(buffer._thread.is_alive())
+        self.assertEqual(ApiUsageRollup.objects.get().request_count, 1)
+
+    def test_test_runner_turns_rollups_off(self):
+        from .usage import get_usage_buffer
+        self.assertIsNone(get_usage_buffer())
+
+    def test_compaction_folds_old_minutes_into_hours(self):
+        from .usage import compact_all
+        old = timezone.now().replace(minute=0, second=0, microsecond=0) - timezone.timedelta(days=2)
+        for minute in (1, 2, 59):
+            ApiUsageRollup.objects.create(
+                user=self.user, route='hotel-list', bucket_start=old + timezone.timedelta(minutes=minute),
+                request_count=2, points=10,
+            )
+        compact_all(timezone.now())
+        row = ApiUsageRollup.objects.get(user=self.user)
+        self.assertEqual((row.granularity, row.bucket_start), ('hour', old))
+        self.assertEqual((row.request_count, row.points), (6, 30))
+
+    def test_admin_usage_series(self):
+        now = timezone.now().replace(second=0, microsecond=0)
+        ApiUsageRollup.objects.create(user=self.user, route='hotel-list', bucket_start=now, request_count=3, points=15)
+        ApiUsageRollup.objects.create(user=self.user, route='tourdetail-list', bucket_start=now, request_count=1, points=0.001)
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('api-usage'), {'user_id': self.user.pk, 'granularity': 'minute'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'usagerollup' in q['sql']]), 1)
+        self.assertEqual(len(response.data['series']), 1)
+        self.assertEqual(response.data['series'][0]['requests'], 4)
+
+        response = self.client.get(reverse('api-usage'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SeatCounterBookingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='seats', password='testpassword', email='seats@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.package = TourPackage.objects.create(
+            name='Seat Tour', destination='Bandarban', duration=2, price=10, itinerary='-', capacity=4,
+        )
+
+    def book(self, num_travelers):
+        return self.client.post('/api/tourbookings/', {
+            'package_tracking_id': str(self.package.tracking_id), 'num_travelers': num_travelers,
+        })
+
+    def test_booking_claims_seats_up_to_capacity(self):
+        response = self.book(3)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_booked_seats_history'], 3)
+
+        response = self.book(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'This tour is fully booked. Please select another tour.')
+
+        self.package.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 3)
+        self.assertEqual(TourBooking.objects.filter(package=self.package).count(), 1)
+        self.assertAlmostEqual(self.user.point, 1000 - 30 - 0.002)
+
+    def test_insufficient_points_claims_nothing(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(point=15)
+        response = self.book(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 0)
+
+    def test_cancellation_releases_seats(self):
+        response = self.book(4)
+        response = self.client.post(reverse('cancel-booking'), {
+            'package_tracking_id': str(self.package.tracking_id),
+            'tour_booking_tracking_id': response.data['tour_booking_tracking_id'],
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['booking_status'], 'Cancelled')
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 0)
+        self.assertEqual(self.book(4).status_code, status.HTTP_201_CREATED)
+
+    def test_reconcile_command_fixes_drift(self):
+        TourBooking.objects.create(user=self.user, package=self.package, num_travelers=2)
+        TourBooking.objects.create(user=self.user, package=self.package, num_travelers=1, status='Cancelled')
+        out = StringIO()
+        call_command('reconcile_booked_seats', stdout=out)
+        self.assertIn('1 package(s) reconciled', out.getvalue())
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 2)
+
+    def test_admin_updates_cannot_reset_the_seat_counter(self):
+        self.assertEqual(self.book(4).status_code, status.HTTP_201_CREATED)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.patch(f'/api/admin/tourpackages/{self.package.tracking_id}/', {
+            'booked_seats': 0, 'name': 'Renamed',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['booked_seats'], 4)
+        self.assertEqual(self.book(1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.package.refresh_from_db()
+        self.assertEqual((self.package.name, self.package.booked_seats), ('Renamed', 4))
+
+    def test_saving_a_stale_instance_keeps_seats_claimed_since(self):
+        stale = TourPackage.objects.get(pk=self.package.pk)
+        self.assertEqual(self.book(3).status_code, status.HTTP_201_CREATED)
+        stale.name = 'Renamed'
+        stale.save()
+        self.package.refresh_from_db()
+        self.assertEqual((self.package.name, self.package.booked_seats, self.package.booking_version), ('Renamed', 3, 1))
+
+    def test_bookings_cannot_be_edited_or_deleted_around_the_counter(self):
+        self.assertEqual(self.book(2).status_code, status.HTTP_201_CREATED)
+        booking = TourBooking.objects.get(package=self.package)
+        url = f'/api/tourbookings/{booking.pk}/'
+        response = self.client.patch(url, {'num_travelers': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        booking.refresh_from_db()
+        self.package.refresh_from_db()
+        self.assertEqual((booking.num_travelers, self.package.booked_seats), (2, 2))
+
+
+class BulkBookingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='agency', password='testpassword', email='agency@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.small = TourPackage.objects.create(
+            name='Small Tour', destination='Rangamati', duration=2, price=10, itinerary='-', capacity=2,
+        )
+        self.large = TourPackage.objects.create(
+            name='Large Tour', destination='Kuakata', duration=2, price=20, itinerary='-', capacity=50,
+        )
+        self.url = reverse('tourbooking-bulk-create')
+
+    def post(self, items, atomic=True):
+        return self.client.post(self.url, {'bookings': items, 'atomic': atomic}, format='json')
+
+    def item(self, package, num_travelers):
+        return {'package_tracking_id': str(package.tracking_id), 'num_travelers': num_travelers}
+
+    def test_atomic_batch_books_everything_in_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post([self.item(self.small, 2), self.item(self.large, 3), self.item(self.large, 1)])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data['results']], ['booked'] * 3)
+        self.assertEqual(response.data['total_cost'], 100.0)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "custom_api_tourbooking"')]
+        self.assertEqual(len(inserts), 1)
+
+        self.large.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.large.booked_seats, 4)
+        self.assertAlmostEqual(self.user.point, 1000 - 100 - 0.001)
+
+    def test_atomic_batch_fails_as_a_whole(self):
+        response = self.post([self.item(self.large, 3), self.item(self.small, 3)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in response.data['results']], ['not_booked', 'failed'])
+        self.assertEqual(TourBooking.objects.count(), 0)
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.booked_seats, 0)
+        self.user.refresh_from_db()
+        self.assertAlmostEqual(self.user.point, 1000 - 0.001)
+
+    def test_per_item_batch_books_what_it_can(self):
+        response = self.post(
+            [self.item(self.large, 3), self.item(self.small, 3), {'package_tracking_id': 'nope', 'num_travelers': 1}],
+            atomic=False,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data['results']], ['booked', 'failed', 'failed'])
+        self.assertEqual(TourBooking.objects.filter(user=self.user).count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(response.data['remaining_points'], self.user.point)
+
+
+@override_settings(SEAT_HOLD_ADMISSION_QUEUE=False)
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='holder', password='testpassword', email='holder@example.com', point=1000
+        )
+        self.other = get_user_model().objects.create_user(
+            username='rival', password='testpassword', email='rival@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.package = TourPackage.objects.create(
+            name='Flash Tour', destination='Sajek', duration=2, price=10, itinerary='-', capacity=3,
+        )
+
+    def hold(self, num_seats, client=None):
+        return (client or self.client).post(reverse('seathold-list'), {
+            'package_tracking_id': str(self.package.tracking_id), 'num_seats': num_seats,
+        })
+
+    def other_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.other)}')
+        return client
+
+    def test_holds_are_granted_up_to_capacity(self):
+        response = self.hold(2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'Active')
+
+        response = self.hold(2, client=self.other_client())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'This tour is fully booked. Please select another tour.')
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 2)
+
+    def test_one_active_hold_per_user_and_package(self):
+        self.hold(1)
+        self.assertEqual(self.hold(1).status_code, status.HTTP_409_CONFLICT)
+
+    def test_confirm_turns_hold_into_booking(self):
+        tracking_id = self.hold(3).data['hold_tracking_id']
+        response = self.client.post(reverse('seathold-confirm', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_cost'], 30.0)
+
+        booking = TourBooking.objects.get(tracking_id=response.data['tour_booking_tracking_id'])
+        self.assertEqual(booking.num_travelers, 3)
+        self.assertEqual(SeatHold.objects.get(tracking_id=tracking_id).booking, booking)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 3)
+
+        response = self.client.post(reverse('seathold-confirm', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(TourBooking.objects.count(), 1)
+
+    def test_confirm_without_points_keeps_the_hold(self):
+        tracking_id = self.hold(3).data['hold_tracking_id']
+        get_user_model().objects.filter(pk=self.user.pk).update(point=5)
+        response = self.client.post(reverse('seathold-confirm', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(TourBooking.objects.count(), 0)
+        self.assertEqual(SeatHold.objects.get(tracking_id=tracking_id).status, 'Active')
+
+    def test_release_gives_seats_back(self):
+        tracking_id = self.hold(3).data['hold_tracking_id']
+        response = self.client.delete(reverse('seathold-detail', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'Released')
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 0)
+
+    def test_other_users_holds_are_not_visible(self):
+        tracking_id = self.hold(1).data['hold_tracking_id']
+        response = self.other_client().post(reverse('seathold-confirm', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sweeper_releases_expired_holds_in_bulk(self):
+        second = TourPackage.objects.create(
+            name='Second Tour', destination='Sylhet', duration=2, price=10, itinerary='-', capacity=5,
+        )
+        past = timezone.now() - timezone.timedelta(minutes=1)
+        for package, seats in ((self.package, 2), (self.package, 1), (second, 4)):
+            SeatHold.objects.create(user=self.user, package=package, num_seats=seats, expires_at=past)
+        TourPackage.objects.filter(pk=self.package.pk).update(booked_seats=3)
+        TourPackage.objects.filter(pk=second.pk).update(booked_seats=4)
+
+        with self.assertNumQueries(6):  # savepoint, read, hold update, 2 package updates, release
+            self.assertEqual(release_expired_holds(), 3)
+        self.assertFalse(SeatHold.objects.filter(status='Active').exists())
+        self.package.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((self.package.booked_seats, second.booked_seats), (0, 0))
+
+    def test_full_package_reclaims_expired_holds(self):
+        SeatHold.objects.create(
+            user=self.other, package=self.package, num_seats=3,
+            expires_at=timezone.now() - timezone.timedelta(seconds=1),
+        )
+        TourPackage.objects.filter(pk=self.package.pk).update(booked_seats=3)
+        self.assertEqual(self.hold(2).status_code, status.HTTP_201_CREATED)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 2)
+
+    def test_expired_hold_cannot_be_confirmed(self):
+        tracking_id = self.hold(1).data['hold_tracking_id']
+        SeatHold.objects.filter(tracking_id=tracking_id).update(expires_at=timezone.now())
+        response = self.client.post(reverse('seathold-confirm', args=[tracking_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_reconcile_counts_active_holds(self):
+        self.hold(2)
+        out = StringIO()
+        call_command('reconcile_booked_seats', '--dry-run', stdout=out)
+        self.assertIn('0 package(s) need reconciling', out.getvalue())
+
+
+class AdmissionQueueTests(TestCase):
+    def setUp(self):
+        self.queue = AdmissionQueue(timeout=5.0, sold_out_ttl=60.0)
+        self.addCleanup(self.queue.shutdown)
+
+    def test_requests_run_one_at_a_time_in_order(self):
+        seen = []
+        active = []
+
+        def claim(i):
+            active.append(i)
+            self.assertEqual(len(active), 1)
+            seen.append(i)
+            active.remove(i)
+            return i
+
+        futures = [self.queue._worker(1).submit(claim, i) for i in range(20)]
+        self.assertEqual([f.result() for f in futures], list(range(20)))
+        self.assertEqual(seen, list(range(20)))
+        self.assertEqual(self.queue.run(1, claim, 99), 99)
+
+    def test_sold_out_package_is_rejected_without_queueing(self):
+        calls = []
+
+        def claim():
+            calls.append(1)
+            raise SoldOut()
+
+        with self.assertRaises(SoldOut):
+            self.queue.run(1, claim)
+        with self.assertRaises(SoldOut):
+            self.queue.run(1, claim)
+        self.assertEqual(len(calls), 1)
+
+        self.queue.clear_sold_out(1)
+        with self.assertRaises(SoldOut):
+            self.queue.run(1, claim)
+        self.assertEqual(len(calls), 2)
+
+    def test_request_times_out_with_503(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        self.queue.timeout = 0.05
+        self.queue._worker(1).submit(gate.wait)
+        with self.assertRaises(BookingError) as ctx:
+            self.queue.run(1, lambda: None)
+        self.assertEqual(ctx.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_started_request_is_waited_for_past_the_timeout(self):
+        self.queue.timeout = 0.05
+        started = threading.Event()
+
+        def slow_claim():
+            started.set()
+            time.sleep(0.2)
+            return 'hold'
+
+        # The claim is already running when the timeout passes, so its result is returned, not a 503
+        self.assertEqual(self.queue.run(1, slow_claim), 'hold')
+        self.assertTrue(started.is_set())
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='retrier', password='testpassword', email='retrier@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.package = TourPackage.objects.create(
+            name='Retry Tour', destination='Cox\'s Bazar', duration=2, price=10, itinerary='-', capacity=10,
+            start_date=timezone.now().date() + timezone.timedelta(days=30),
+        )
+
+    def book(self, key, num_travelers=2, client=None):
+        return (client or self.client).post('/api/tourbookings/', {
+            'package_tracking_id': str(self.package.tracking_id), 'num_travelers': num_travelers,
+        }, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_booking_is_replayed(self):
+        first = self.book('booking-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.book('booking-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        touched = [q['sql'] for q in ctx.captured_queries if 'custom_api_tourpackage' in q['sql']
+                   or 'INSERT INTO "custom_api_tourbooking"' in q['sql']]
+        self.assertEqual(touched, [])
+
+        self.assertEqual(TourBooking.objects.count(), 1)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 2)
+
+    def test_new_key_books_again(self):
+        self.book('booking-1')
+        self.assertEqual(self.book('booking-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(TourBooking.objects.count(), 2)
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        self.book('booking-1', num_travelers=2)
+        response = self.book('booking-1', num_travelers=3)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(TourBooking.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        other = get_user_model().objects.create_user(
+            username='other', password='testpassword', email='other@example.com', point=1000
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.book('shared-key')
+        response = self.book('shared-key', client=client)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(TourBooking.objects.filter(user=other).count(), 1)
+
+    def test_retried_cancellation_refunds_once(self):
+        booking = self.book('booking-1').data
+        payload = {
+            'package_tracking_id': str(self.package.tracking_id),
+            'tour_booking_tracking_id': booking['tour_booking_tracking_id'],
+        }
+        first = self.client.post(reverse('cancel-booking'), payload, HTTP_IDEMPOTENCY_KEY='cancel-1')
+        retry = self.client.post(reverse('cancel-booking'), payload, HTTP_IDEMPOTENCY_KEY='cancel-1')
+        self.assertEqual(first.data['message'], 'Booking cancelled successfully')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.booked_seats, 0)
+
+    def test_failed_validation_does_not_consume_the_key(self):
+        response = self.client.post('/api/tourbookings/', {}, HTTP_IDEMPOTENCY_KEY='booking-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_duplicate_of_unfinished_request_gets_409(self):
+        self.book('booking-1')
+        IdempotencyRecord.objects.update(status_code=None, response_body='')
+        response = self.book('booking-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_abandoned_key_is_taken_over(self):
+        self.book('booking-1')
+        IdempotencyRecord.objects.update(
+            status_code=None, response_body='', created_at=timezone.now() - timezone.timedelta(hours=1)
+        )
+        response = self.book('booking-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_expired_records_are_purged(self):
+        self.book('booking-1')
+        self.assertEqual(purge_expired(timezone.now()), 0)
+        self.assertEqual(purge_expired(timezone.now() + timezone.timedelta(days=2)), 1)
+
+
+
+class BulkPackageCancellationTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            username='operator', password='testpassword', email='operator@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        self.package = TourPackage.objects.create(
+            name='Cancelled Tour', destination='Bandarban', duration=2, price=100, itinerary='-', capacity=50,
+            start_date=timezone.now().date() + timezone.timedelta(days=3),
+        )
+        self.users = [
+            get_user_model().objects.create_user(
+                username=f'traveler{i}', password='testpassword', email=f'traveler{i}@example.com', point=0
+            )
+            for i in range(3)
+        ]
+        now = timezone.now()
+        for user, num_travelers, booked_at in (
+            (self.users[0], 2, now + timezone.timedelta(days=2)),
+            (self.users[0], 1, now + timezone.timedelta(hours=5)),
+            (self.users[1], 3, now),
+            (self.users[2], 1, now),
+        ):
+            booking = TourBooking.objects.create(user=user, package=self.package, num_travelers=num_travelers)
+            TourBooking.objects.filter(pk=booking.pk).update(booking_date=booked_at)
+        TourBooking.objects.filter(user=self.users[2]).update(status='Cancelled')
+        TourPackage.objects.filter(pk=self.package.pk).update(booked_seats=6)
+        self.url = reverse('cancel-package-bookings-admin', args=[self.package.tracking_id])
+
+    def test_refunds_match_the_single_cancellation_tiers(self):
+        now = timezone.now()
+        expected = {}
+        for booking in TourBooking.objects.exclude(status='Cancelled').select_related('package'):
+            expected.setdefault(booking.user_id, 0)
+            expected[booking.user_id] += float(booking.total_cost) * refund_percentage(booking, now)
+
+        cancelled, refunds = cancel_package_bookings(self.package, now)
+        self.assertEqual(cancelled, 3)
+        self.assertEqual(refunds.keys(), expected.keys())
+        for user_id, refund in expected.items():
+            self.assertAlmostEqual(refunds[user_id], refund)
+            self.assertAlmostEqual(get_user_model().objects.get(pk=user_id).point, refund)
+        self.assertEqual(self.package.booked_seats, 0)
+        self.assertFalse(TourBooking.objects.exclude(status='Cancelled').exists())
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        for _ in range(20):
+            TourBooking.objects.create(user=self.users[1], package=self.package, num_travelers=1)
+        TourPackage.objects.filter(pk=self.package.pk).update(booked_seats=26)
+        for user in self.users:
+            BookingSummary.objects.create(user=user, **booking_totals(user.pk))
+        # savepoint, lock, aggregate, 2 user credits, status update, seat release,
+        # 2 summary updates, release, refresh
+        with self.assertNumQueries(11):
+            cancel_package_bookings(self.package)
+
+    def test_admin_endpoint(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['cancelled_bookings'], 3)
+        self.assertEqual(response.data['refunded_users'], 2)
+        self.assertEqual(response.data['booked_seats'], 0)
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.data['cancelled_bookings'], 0)
+
+    def test_requires_admin(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[0])}')
+        self.assertEqual(client.post(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TourBooking.objects.exclude(status='Cancelled').count(), 3)
+
+
+# Keep revocation refreshes and usage flushes out of the measured requests
+@override_settings(API_USAGE_ROLLUPS=False)
+class TourAvailabilityQueryTests(TestCase):
+    def setUp(self):
+        from .revocation import TokenRevocationIndex
+        patcher = mock.patch('api.revocation._index', TokenRevocationIndex(check_interval=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = get_user_model().objects.create_superuser(
+            username='catalog', password='testpassword', email='catalog@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        self.client.get('/api/tourdetails/')
+
+    def create_packages(self, count):
+        for i in range(count):
+            package = TourPackage.objects.create(
+                name=f'Tour {i}', destination='Sylhet', duration=2, price=10, itinerary='-', capacity=8,
+            )
+            TourBooking.objects.create(user=self.admin, package=package, num_travelers=3)
+            TourBooking.objects.create(user=self.admin, package=package, num_travelers=2, status='Cancelled')
+
+    def list_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_packages(2)
+        for url in ('/api/tourdetails/', '/api/tourpackages/all/'):
+            _, few = self.list_queries(url)
+            self.create_packages(8)
+            response, many = self.list_queries(url)
+            self.assertEqual(len(response.data['results']), 10)
+            self.assertEqual(few, many)
+            TourPackage.objects.filter(name__in=[f'Tour {i}' for i in range(2, 8)]).delete()
+
+    def test_annotations_skip_cancelled_bookings(self):
+        self.create_packages(1)
+        package = TourPackage.objects.get()
+        response = self.client.get(f'/api/tourdetails/{package.tracking_id}/')
+        self.assertEqual(response.data['bookings'], {'total_booked': 3, 'available_sit': 5})
+
+        response = self.client.get(reverse('tour-detail-admin', args=[package.tracking_id]))
+        self.assertEqual(response.data['bookings'], {'total_booked': 3, 'available_sit': 5})
+
+    def test_package_viewset_reads_annotations(self):
+        self.create_packages(3)
+        view = TourPackageViewSet()
+        view.request = mock.Mock(query_params={})
+        with self.assertNumQueries(1):
+            data = TourPackageSerializer(view.get_queryset(), many=True).data
+        self.assertEqual({(row['already_booking'], row['available_sit']) for row in data}, {(3, 5)})
+
+    def test_unannotated_instances_fall_back_to_one_query(self):
+        self.create_packages(1)
+        package = TourPackage.objects.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(TourDetailSerializer(package).data['bookings']['total_booked'], 3)
+
+
+# Keep revocation refreshes and usage flushes out of the measured requests
+@override_settings(API_USAGE_ROLLUPS=False)
+class UserBookingHistoryTests(TestCase):
+    def setUp(self):
+        from .revocation import TokenRevocationIndex
+        patcher = mock.patch('api.revocation._index', TokenRevocationIndex(check_interval=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username='traveler', password='testpassword', email='traveler@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = reverse('user-booking-history')
+        self.client.get(self.url)
+
+    def create_bookings(self, count, days_ahead=10, **kwargs):
+        today = timezone.now().date()
+        for i in range(count):
+            package = TourPackage.objects.create(
+                name=f'Tour {i}', destination='Bandarban', duration=2, price=10, itinerary='-',
+                start_date=today + timezone.timedelta(days=days_ahead + i),
+                end_date=today + timezone.timedelta(days=days_ahead + i + 2),
+            )
+            TourBooking.objects.create(user=self.user, package=package, **kwargs)
+
+    def history_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_booking_count(self):
+        self.create_bookings(2)
+        _, few = self.history_queries(self.url)
+        self.create_bookings(30)
+        response, many = self.history_queries(self.url)
+        self.assertEqual(few, many)
+        self.assertEqual(response.data['count'], 32)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_status_counters(self):
+        self.create_bookings(3)
+        self.create_bookings(2, status='Cancelled')
+        self.create_bookings(1, days_ahead=-10)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(response.data['status'], {'active_booking': 3, 'cancel_booking': 2})
+
+    def test_cursor_walks_every_booking_once(self):
+        self.create_bookings(25)
+        seen = []
+        url = self.url
+        while url:
+            response = self.client.get(url)
+            seen.extend(row['tour_booking_tracking_id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {str(b.tracking_id) for b in TourBooking.objects.all()})
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_nearest_upcoming_tour_sums_travelers_on_its_package(self):
+        self.create_bookings(2)
+        package = TourPackage.objects.order_by('start_date').first()
+        TourBooking.objects.create(user=self.user, package=package, num_travelers=3)
+        response = self.client.get(self.url)
+        nearest = response.data['nearest_upcoming_tour']
+        self.assertEqual(nearest['package'], package.id)
+        self.assertEqual(nearest['total_num_travelers'], 4)
+
+
+@override_settings(SEAT_HOLD_ADMISSION_QUEUE=False)
+class BookingSummaryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='summary', password='testpassword', email='summary@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.package = TourPackage.objects.create(
+            name='Sajek', destination='Rangamati', duration=2, price=25, itinerary='-', capacity=20,
+            start_date=timezone.now().date() + timezone.timedelta(days=10),
+            end_date=timezone.now().date() + timezone.timedelta(days=12),
+        )
+
+    def book(self, num_travelers):
+        response = self.client.post('/api/tourbookings/', {
+            'package_tracking_id': str(self.package.tracking_id), 'num_travelers': num_travelers,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['tour_booking_tracking_id']
+
+    def summary(self):
+        return self.client.get('/api/user/account/').data['booking_summary']
+
+    def test_summary_follows_bookings_and_cancellations(self):
+        first = self.book(2)
+        self.book(1)
+        self.client.post('/api/tourbookings/bulk/', {'bookings': [
+            {'package_tracking_id': str(self.package.tracking_id), 'num_travelers': 1},
+        ]}, format='json')
+        self.client.post('/api/bookings/cancel/', {
+            'package_tracking_id': str(self.package.tracking_id), 'tour_booking_tracking_id': first,
+        })
+        self.assertEqual(self.summary(), {
+            'total_booking_success': 2, 'total_booking_cancel': 1,
+            'total_return_point': Decimal('50.00'), 'total_spend_point': Decimal('50.00'),
+        })
+
+        cancel_package_bookings(self.package)
+        summary = BookingSummary.objects.get(user=self.user)
+        self.assertEqual((summary.success_count, summary.cancel_count), (0, 3))
+        self.assertEqual((summary.spent_total, summary.refunded_total), (0, Decimal('100.00')))
+
+    def test_summary_matches_bookings(self):
+        self.book(3)
+        hold = self.client.post('/api/seatholds/', {
+            'package_tracking_id': str(self.package.tracking_id), 'num_seats': 2,
+        }).data
+        self.client.post(f"/api/seatholds/{hold['hold_tracking_id']}/confirm/")
+        summary = BookingSummary.objects.get(user=self.user)
+        self.assertEqual(booking_totals(self.user.pk), {
+            'success_count': summary.success_count, 'cancel_count': summary.cancel_count,
+            'spent_total': summary.spent_total, 'refunded_total': summary.refunded_total,
+        })
+        self.assertEqual(summary.success_count, 2)
+
+    def test_summary_is_one_lookup_and_bookings_are_optional(self):
+        for _ in range(3):
+            self.book(1)
+        self.user.refresh_from_db()
+        request = mock.Mock(query_params={})
+        with self.assertNumQueries(1):
+            data = UserDetailSerializer(self.user, context={'request': request}).data
+        self.assertNotIn('tour_bookings', data)
+        self.assertEqual(data['booking_summary']['total_booking_success'], 3)
+
+        response = self.client.get('/api/user/account/', {'include_bookings': 'true', 'bookings_limit': 2})
+        self.assertEqual(len(response.data['tour_bookings']), 2)
+        self.assertEqual(response.data['tour_bookings'][0]['package_name'], 'Sajek')
+
+    def test_user_without_bookings(self):
+        self.assertEqual(self.summary(), {
+            'total_booking_success': 0, 'total_booking_cancel': 0,
+            'total_return_point': 0, 'total_spend_point': 0,
+        })
+
+
+@override_settings(API_USAGE_ROLLUPS=False)
+class CatalogKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='browser', password='testpassword', email='browser@example.com', point=10000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        ratings = [4.5, 4.5, None, 3.0, 4.5, None, 5.0, 3.0, 4.5, None, 2.0, 4.5]
+        for i, rating in enumerate(ratings * 2):
+            Hotel.objects.create(
+                hotel_name=f'Hotel {i}', hotel_country='Bangladesh' if i % 2 else 'Nepal', rating=rating
+            )
+
+    def walk(self, url, params):
+        ids, pages = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            ids.extend(row['hotel_id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_walks_ties_and_nulls_in_order(self):
+        ids, pages = self.walk('/api/hotels/', {'pagination': 'cursor', 'ordering': 'rating', 'page_size': 5})
+        expected = list(
+            Hotel.objects.order_by(F('rating').desc(nulls_last=True), '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 5)
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link_returns_the_previous_page(self):
+        _, pages = self.walk('/api/hotels/', {'pagination': 'cursor', 'ordering': 'rating', 'page_size': 5})
+        for before, page in zip(pages, pages[1:]):
+            response = self.client.get(page['previous'])
+            self.assertEqual(response.data['results'], before['results'])
+
+    def test_filters_apply_in_cursor_mode(self):
+        ids, _ = self.walk('/api/hotels/', {'pagination': 'cursor', 'country': 'nepal', 'page_size': 4})
+        expected = list(
+            Hotel.objects.filter(hotel_country='Nepal').order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_tour_catalogs_accept_cursors(self):
+        for i in range(12):
+            TourPackage.objects.create(
+                name=f'Tour {i}', destination='Sylhet', duration=2, price=10 + i % 3, itinerary='-'
+            )
+        for url in ('/api/tourdetails/', '/api/tourpackages/all/'):
+            response = self.client.get(url, {'pagination': 'cursor', 'ordering': 'price'})
+            self.assertEqual(len(response.data['results']), 10)
+            response = self.client.get(response.data['next'])
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNone(response.data['next'])
+
+    def test_page_numbers_stay_the_default(self):
+        response = self.client.get('/api/hotels/')
+        self.assertEqual(response.data['count'], 24)
+        self.assertIn('page=2', response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/hotels/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_values_are_not_found(self):
+        TourPackage.objects.create(name='Tour', destination='Sylhet', duration=2, price=10, itinerary='-')
+        anonymous = APIClient()
+        for position, ordering in (
+            (['notadate', 1, 0], None), ([{'a': 1}, 1, 0], None), (['abc', 1, 0], 'price'),
+            ([None, 1, 0], 'price'), (['2024-01-01T00:00:00Z', 'x', 0], None),
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            params = {'pagination': 'cursor', 'cursor': cursor}
+            if ordering:
+                params['ordering'] = ordering
+            response = anonymous.get('/api/tourdetails/', params)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+        # A well-formed cursor still seeks
+        cursor = base64.urlsafe_b64encode(json.dumps(['20.00', 10**9, 0]).encode()).decode()
+        response = anonymous.get('/api/tourdetails/', {'pagination': 'cursor', 'ordering': 'price', 'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='seeker', password='testpassword', email='seeker@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create_documents(self):
+        self.sea_view = Hotel.objects.create(
+            hotel_name='Sea View Resort', hotel_country='Bangladesh', description='Rooms facing the beach'
+        )
+        self.hill_top = Hotel.objects.create(
+            hotel_name='Hill Top', hotel_country='Nepal', address='Near the seaside road'
+        )
+        self.tour = TourPackage.objects.create(
+            name='Sundarbans Cruise', destination='Khulna', duration=3, price=50,
+            itinerary='Day 1: boat safari', highlights='Royal Bengal tiger, seafood dinner',
+        )
+
+    def results(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['type'], row['data'].get('hotel_id') or row['data'].get('tracking_id'))
+                for row in response.data['results']]
+
+    def check_search(self):
+        self.create_documents()
+        tour = ('tour', str(self.tour.tracking_id))
+        # Prefix matches ranked by column: name before body text
+        self.assertEqual(self.results(q='sea'), [
+            ('hotel', self.sea_view.hotel_id), ('hotel', self.hill_top.hotel_id), tour,
+        ])
+        self.assertEqual(self.results(q='bengal tig'), [tour])
+        self.assertEqual(self.results(q='sea', type='tour'), [tour])
+        self.assertEqual(self.results(q='sea nepal'), [('hotel', self.hill_top.hotel_id)])
+
+        self.hill_top.hotel_name = 'Seaside Lodge'
+        self.hill_top.address = ''
+        self.hill_top.save()
+        self.assertEqual(self.results(q='lodge'), [('hotel', self.hill_top.hotel_id)])
+        self.sea_view.delete()
+        self.assertEqual(self.results(q='resort'), [])
+
+    def test_fts_index(self):
+        from .search import FtsSearchIndex
+        with mock.patch('api.search._index', FtsSearchIndex()):
+            self.check_search()
+
+    def test_inverted_index(self):
+        from .search import InvertedSearchIndex
+        with mock.patch('api.search._index', InvertedSearchIndex()):
+            self.check_search()
+
+    def test_query_syntax_is_escaped(self):
+        self.create_documents()
+        self.assertEqual(self.results(q='"sea* OR NOT)'), self.results(q='sea or not'))
+        response = self.client.get(reverse('search'), {'q': '***'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_rebuild_command(self):
+        self.create_documents()
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM custom_api_search_fts')
+        self.assertEqual(self.results(q='hill'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('hotel: 2 indexed', out.getvalue())
+        self.assertEqual(self.results(q='hill'), [('hotel', self.hill_top.hotel_id)])
+
+
+@override_settings(HOTEL_STREAM_CHUNK_SIZE=2)
+class HotelStreamingTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(
+            username='streamer', password='stream-password-123', email='streamer@example.com', point=1000
+        )
+        token = base64.b64encode(b'streamer:stream-password-123').decode()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {token}')
+        self.url = reverse('hotel-search-basic')
+        for i in range(5):
+            Hotel.objects.create(hotel_name=f'Hotel {i}', hotel_country='Bangladesh', rating=i, description='ঢাকা')
+
+    def test_json_stream_matches_buffered_response(self):
+        buffered = self.client.post(self.url)
+        response = self.client.post(f'{self.url}?stream=json')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(b''.join(response.streaming_content), buffered.content)
+
+    def test_ndjson_stream(self):
+        response = self.client.post(f'{self.url}?stream=ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['hotel_name'] for line in lines], [f'Hotel {i}' for i in range(5)])
+
+    def test_empty_catalog(self):
+        Hotel.objects.all().delete()
+        response = self.client.post(f'{self.url}?stream=json')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    def test_stream_requires_valid_credentials(self):
+        token = base64.b64encode(b'streamer:wrong').decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {token}')
+        response = self.client.post(f'{self.url}?stream=json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(API_USAGE_ROLLUPS=False, SEAT_HOLD_ADMISSION_QUEUE=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='poller', password='testpassword', email='poller@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.tour = TourPackage.objects.create(
+            name='Polled Tour', destination='Sylhet', duration=2, price=10, itinerary='-', capacity=8,
+            end_date=timezone.now().date() + timezone.timedelta(days=5),
+        )
+        self.hotel = Hotel.objects.create(hotel_name='Polled Hotel', hotel_country='Bangladesh')
+        self.paths = [
+            '/api/tourdetails/', '/api/tourpackages/all/', f'/api/tourdetails/{self.tour.tracking_id}/',
+            f'/api/user/tourpackages/{self.tour.tracking_id}/details/',
+        ]
+
+    def etags(self, paths):
+        etags = []
+        for path in paths:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etags.append(response['ETag'])
+        return etags
+
+    def test_matching_etag_skips_serialization(self):
+        for path, etag in zip(self.paths, self.etags(self.paths)):
+            with mock.patch.object(TourDetailSerializer, 'to_representation') as to_representation:
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            to_representation.assert_not_called()
+
+    def test_bookings_change_the_etag(self):
+        before = self.etags(self.paths)
+        response = self.client.post('/api/tourbookings/', {
+            'package_tracking_id': str(self.tour.tracking_id), 'num_travelers': 2,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        after_booking = self.etags(self.paths)
+        self.assertTrue(all(a != b for a, b in zip(before, after_booking)))
+
+        # Confirming a hold adds a booking without moving the seat counter
+        hold = self.client.post('/api/seatholds/', {
+            'package_tracking_id': str(self.tour.tracking_id), 'num_seats': 1,
+        }).data
+        after_hold = self.etags(self.paths)
+        self.client.post(f"/api/seatholds/{hold['hold_tracking_id']}/confirm/")
+        self.assertTrue(all(a != b for a, b in zip(after_hold, self.etags(self.paths))))
+
+    def test_package_save_changes_the_etag(self):
+        before = self.etags(self.paths)
+        self.tour.name = 'Renamed Tour'
+        self.tour.save()
+        for path, etag in zip(self.paths, before):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_hotels_answer_if_modified_since(self):
+        for path in ('/api/hotels/', f'/api/hotels/{self.hotel.pk}/'):
+            response = self.client.get(path)
+            last_modified = response['Last-Modified']
+            response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        hotels = self.client.get('/api/hotels/')
+        Hotel.objects.create(hotel_name='New Hotel', hotel_country='Nepal')
+        response = self.client.get('/api/hotels/', HTTP_IF_NONE_MATCH=hotels['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_query_params_are_part_of_the_etag(self):
+        etag = self.client.get('/api/hotels/')['ETag']
+        response = self.client.get('/api/hotels/?country=nepal', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_objects_are_still_404(self):
+        response = self.client.get(f'/api/tourdetails/{uuid.uuid4()}/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_views_answer_conditional_gets(self):
+        factory = AsyncRequestFactory()
+        path = f'/api/tourdetails/{self.tour.tracking_id}/'
+        etag = self.client.get(path)['ETag']
+        request = factory.get(path, headers={'if-none-match': etag})
+        response = async_to_sync(async_views.tour_detail_retrieve)(request, str(self.tour.tracking_id))
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(CATALOG_RESPONSE_CACHE=True)
+class CatalogResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.user = get_user_model().objects.create_user(
+            username='browser', password='testpassword', email='browser@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.tour = TourPackage.objects.create(
+            name='Cached Tour', destination='Bandarban', duration=3, price=10, itinerary='-', capacity=8,
+            end_date=timezone.now().date() + timezone.timedelta(days=5),
+        )
+
+    def get(self, path='/api/tourdetails/', **extra):
+        response = self.client.get(path, **extra)
+        self.assertIn(response.status_code, (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED))
+        return response
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.get()
+        self.assertEqual(first['X-Catalog-Cache'], 'MISS')
+        with mock.patch.object(TourDetailSerializer, 'to_representation') as to_representation, \
+                mock.patch.object(Projection, 'serialize') as serialize:
+            second = self.get()
+        to_representation.assert_not_called()
+        serialize.assert_not_called()
+        self.assertEqual(second['X-Catalog-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.get('/api/tourdetails/?page_size=1')['X-Catalog-Cache'], 'MISS')
+
+    def test_cached_page_answers_conditional_get(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['X-Catalog-Cache'], 'HIT')
+
+    def test_booking_invalidates_cached_pages(self):
+        before = json.loads(self.get().content)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tourbookings/', {
+                'package_tracking_id': str(self.tour.tracking_id), 'num_travelers': 2,
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.get()
+        self.assertEqual(response['X-Catalog-Cache'], 'MISS')
+        self.assertEqual(before['results'][0]['booked_seats'] + 2, json.loads(response.content)['results'][0]['booked_seats'])
+
+    def test_package_save_invalidates_cached_pages(self):
+        self.get('/api/tourpackages/all/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tour.name = 'Renamed Tour'
+            self.tour.save()
+        response = self.get('/api/tourpackages/all/')
+        self.assertEqual(response['X-Catalog-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.content)['results'][0]['name'], 'Renamed Tour')
+
+    def test_uncommitted_writes_do_not_invalidate(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=False):
+            self.tour.save()
+        self.assertEqual(self.get()['X-Catalog-Cache'], 'HIT')
+
+    @override_settings(CATALOG_RESPONSE_CACHE=False)
+    def test_disabled_cache_is_bypassed(self):
+        self.assertFalse(self.get().has_header('X-Catalog-Cache'))
+
+    def test_admin_stats(self):
+        self.get()
+        self.get()
+        admin = get_user_model().objects.create_superuser(
+            username='cacheadmin', password='testpassword', email='cacheadmin@example.com'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        response = self.client.get('/api/admin/cache/catalog/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['hits'], response.data['misses']), (1, 1))
+
+
+class ProjectionParityTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='parity', password='testpassword', email='parity@example.com', point=100000
+        )
+        today = timezone.now().date()
+        self.tours = [
+            TourPackage.objects.create(
+                name='Tea Gardens', destination='Sylhet', duration=3, price=Decimal('120.50'), itinerary='Day 1',
+                capacity=10, end_date=today + timezone.timedelta(days=9), images='tour_images/tea.jpg',
+                last_booking_date=timezone.now() + timezone.timedelta(days=3), included_items='Meals',
+                difficulty_level='Moderate', highlights='Ratargul \u2013 swamp forest',
+            ),
+            TourPackage.objects.create(
+                name='Past Tour', destination='Cox\'s Bazar', duration=1, price=99, itinerary='-', capacity=4,
+                start_date=today - timezone.timedelta(days=4), end_date=today - timezone.timedelta(days=1),
+            ),
+            TourPackage.objects.create(
+                name='Unbooked', destination='Bandarban', duration=2, price=Decimal('0.99'), itinerary='-',
+                end_date=today,
+            ),
+        ]
+        for num_travelers, status_ in ((2, 'Confirmed'), (3, 'Cancelled'), (1, 'Pending')):
+            TourBooking.objects.create(
+                user=self.user, package=self.tours[0], num_travelers=num_travelers, status=status_
+            )
+        TourBooking.objects.create(user=self.user, package=self.tours[1], num_travelers=4)
+        self.request = APIRequestFactory().get('/api/tourdetails/')
+
+    def assertSameJson(self, fast, slow):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_projections_match_their_serializers(self):
+        queryset = TourPackage.objects.with_availability().order_by('pk')
+        context = {'request': self.request}
+        for projection, serializer_class in (
+            (tour_detail_projection, TourDetailSerializer), (tour_package_projection, TourPackageSerializer),
+        ):
+            with self.subTest(serializer=serializer_class.__name__):
+                fast = projection.serialize(projection.values(queryset), context)
+                slow = serializer_class(queryset, many=True, context=context).data
+                self.assertSameJson(fast, slow)
+                self.assertEqual(fast[0]['images'], 'http://testserver/media/tour_images/tea.jpg')
+
+    def test_list_endpoints_match_the_serializer_path(self):
+        admin = get_user_model().objects.create_superuser(
+            username='parityadmin', password='testpassword', email='parityadmin@example.com'
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        paths = [
+            '/api/tourdetails/', '/api/tourpackages/all/?page_size=2',
+            '/api/tourdetails/?pagination=cursor&page_size=2&ordering=price',
+        ]
+        with override_settings(API_USAGE_ROLLUPS=False):
+            for path in paths:
+                with self.subTest(path=path):
+                    with override_settings(FAST_LIST_SERIALIZERS=False):
+                        slow = client.get(path)
+                    fast = client.get(path)
+                    self.assertEqual(fast.status_code, status.HTTP_200_OK)
+                    self.assertEqual(fast.content, slow.content)
+
+            # Cursors taken from projected rows walk the same pages
+            page = client.get(paths[-1]).json()
+            with override_settings(FAST_LIST_SERIALIZERS=False):
+                slow = client.get(page['next'])
+            self.assertEqual(client.get(page['next']).content, slow.content)
+
+            # TourPackageViewSet.list is not routed, so call the view directly
+            view = TourPackageViewSet.as_view({'get': 'list'})
+            responses = []
+            for fast in (True, False):
+                request = APIRequestFactory().get('/api/tourpackages/', {'destination': 'sylhet'})
+                force_authenticate(request, user=admin)
+                with override_settings(FAST_LIST_SERIALIZERS=fast):
+                    response = view(request).render()
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                responses.append(response.content)
+            self.assertEqual(*responses)
+            self.assertEqual(len(json.loads(responses[0])['results']), 1)
+
+    def test_async_list_matches_the_serializer_path(self):
+        request = AsyncRequestFactory().get('/api/tourdetails/')
+        with override_settings(FAST_LIST_SERIALIZERS=False):
+            slow = async_to_sync(async_views.tour_detail_list)(request)
+        fast = async_to_sync(async_views.tour_detail_list)(AsyncRequestFactory().get('/api/tourdetails/'))
+        self.assertEqual(fast.content, slow.content)
+
+    def test_fields_without_a_column_must_be_computed(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Projection(TourDetailSerializer).compile()
+        with self.assertRaises(ImproperlyConfigured):
+            Projection(UserBookingHistoryItemSerializer).compile()
+
+
+@override_settings(API_USAGE_ROLLUPS=False)
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='sparse', password='testpassword', email='sparse@example.com', point=1000
+        )
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.token)
+        for i in range(3):
+            TourPackage.objects.create(
+                name=f'Tour {i}', destination='Sylhet', duration=2, price=10 + i, capacity=8,
+                itinerary='Day 1: ' + 'walk ' * 200, highlights='Waterfalls', included_items='Meals',
+            )
+            Hotel.objects.create(
+                hotel_name=f'Hotel {i}', hotel_country='Bangladesh', description='Quiet ' * 200, address='Lake Road'
+            )
+        self.tour = TourPackage.objects.first()
+
+    def results(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.json()['results']
+
+    def selected_sql(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            self.results(path)
+        return ' '.join(query['sql'] for query in queries if 'LIMIT' in query['sql'])
+
+    def test_list_views_leave_out_heavy_text_by_default(self):
+        tour = self.results('/api/tourdetails/')[0]
+        self.assertTrue({'name', 'price', 'start_date', 'end_date', 'bookings'} <= tour.keys())
+        self.assertFalse({'itinerary', 'included_items', 'excluded_items', 'highlights'} & tour.keys())
+        hotel = self.results('/api/hotels/')[0]
+        self.assertIn('hotel_name', hotel)
+        self.assertFalse({'description', 'address'} & hotel.keys())
+        self.assertNotIn('itinerary', self.selected_sql('/api/tourdetails/'))
+        self.assertNotIn('description', self.selected_sql('/api/hotels/'))
+
+    def test_detail_views_keep_every_field(self):
+        response = self.client.get(f'/api/tourdetails/{self.tour.tracking_id}/')
+        self.assertIn('itinerary', response.data)
+        response = self.client.get(f'/api/tourdetails/{self.tour.tracking_id}/?fields=name,is_active')
+        self.assertEqual(set(response.data), {'name', 'is_active'})
+
+    def test_fields_and_exclude(self):
+        self.assertEqual(list(self.results('/api/tourdetails/?fields=price,name')[0]), ['name', 'price'])
+        sql = self.selected_sql('/api/tourdetails/?fields=name,price')
+        self.assertNotIn('"destination"', sql)
+        self.assertNotIn('"itinerary"', sql)
+
+        tour = self.results('/api/tourdetails/?exclude=images,tracking_id')[0]
+        self.assertIn('itinerary', tour)
+        self.assertFalse({'images', 'tracking_id'} & tour.keys())
+        self.assertIn('itinerary', self.results('/api/tourdetails/?fields=')[0])
+
+        hotel = self.results('/api/hotels/?fields=hotel_name,description')[0]
+        self.assertEqual(set(hotel), {'hotel_name', 'description'})
+        self.assertNotIn('"address"', self.selected_sql('/api/hotels/?fields=hotel_name,description'))
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/tourdetails/?fields=name,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', response.data['fields'])
+        response = self.call_async(async_views.hotel_list, '/api/hotels/?exclude=nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_serializer_path_and_cursors_agree(self):
+        path = '/api/tourdetails/?fields=name,bookings&pagination=cursor&ordering=price&page_size=2'
+        with override_settings(FAST_LIST_SERIALIZERS=False):
+            with CaptureQueriesContext(connection) as queries:
+                slow = self.client.get(path).json()
+        # Deferred columns are not loaded row by row afterwards
+        page_queries = [query['sql'] for query in queries if '"custom_api_tourpackage"."name"' in query['sql']]
+        self.assertEqual(len(page_queries), 1)
+        self.assertNotIn('"destination"', page_queries[0])
+        fast = self.client.get(path).json()
+        self.assertEqual(fast, slow)
+        self.assertEqual(len(self.client.get(fast['next']).json()['results']), 1)
+
+    def call_async(self, view, path):
+        request = AsyncRequestFactory().get(path, headers={'authorization': self.token})
+        return async_to_sync(view)(request)
+
+    def test_async_views_match_sync_views(self):
+        for view, path in (
+            (async_views.tour_detail_list, '/api/tourdetails/?fields=name,price'),
+            (async_views.tour_detail_list, '/api/tourdetails/'),
+            (async_views.hotel_list, '/api/hotels/?exclude=address'),
+            (async_views.hotel_list, '/api/hotels/'),
+        ):
+            with self.subTest(path=path):
+                expected = self.client.get(path).json()
+                self.assertEqual(json.loads(self.call_async(view, path).content), expected)
+                with override_settings(FAST_LIST_SERIALIZERS=False):
+                    self.assertEqual(json.loads(self.call_async(view, path).content), expected)
+
+    def test_writes_ignore_fieldsets(self):
+        admin = get_user_model().objects.create_superuser(
+            username='sparseadmin', password='testpassword', email='sparseadmin@example.com'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        response = self.client.post('/api/hotels/?fields=hotel_name', {
+            'hotel_name': 'New Hotel', 'hotel_country': 'Nepal', 'description': 'Lakeside',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['description'], 'Lakeside')
+
+
+def make_jpeg(width, height, orientation=None):
+    """A JPEG upload carrying EXIF camera, GPS and (optionally) orientation tags"""
+    from PIL import Image
+    image = Image.new('RGB', (width, height), (200, 120, 40))
+    image.paste((20, 40, 200), (0, 0, width // 2, height))
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    exif[0x8825] = {1: 'N', 2: (23.0, 46.0, 12.0)}
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(
+    IMAGE_VARIANTS_BACKGROUND=False, API_USAGE_ROLLUPS=False,
+    IMAGE_VARIANT_SIZES={'thumb': 64, 'small': 256, 'large': 1024},
+)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+
+        self.user = get_user_model().objects.create_user(
+            username='photographer', password='testpassword', email='photographer@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def upload_hotel(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/hotels/', {
+                'hotel_name': 'Photo Hotel', 'hotel_country': 'Bangladesh', 'primary_picture': image,
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        return Hotel.objects.get(pk=response.data['hotel_id'])
+
+    def open_variant(self, name):
+        from PIL import Image
+        return Image.open(os.path.join(self.media_root, name))
+
+    def test_upload_generates_stripped_resized_variants(self):
+        # Orientation 6: stored landscape, displayed portrait
+        hotel = self.upload_hotel(make_jpeg(600, 400, orientation=6))
+        variants = hotel.primary_picture_variants
+        self.assertEqual(variants['source'], hotel.primary_picture.name)
+        # 'large' is capped at the original's 600px rather than upscaled
+        self.assertEqual(
+            {name: (entry['width'], entry['height']) for name, entry in variants['variants'].items()},
+            {'thumb': (43, 64), 'small': (171, 256), 'large': (400, 600)},
+        )
+        for entry in variants['variants'].values():
+            for fmt, expected in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with self.open_variant(entry[fmt]) as image:
+                    self.assertEqual(image.format, expected)
+                    self.assertEqual(image.size, (entry['width'], entry['height']))
+                    self.assertEqual(len(image.getexif()), 0)
+                    self.assertNotIn('exif', image.info)
+
+        data = self.client.get(f'/api/hotels/{hotel.pk}/').data
+        thumb = data['primary_picture_variants']['thumb']
+        self.assertEqual(thumb['width'], 43)
+        self.assertTrue(thumb['webp'].startswith('http://testserver/media/variants/hotel_images/'))
+        listed = self.client.get('/api/hotels/').data['results'][0]
+        self.assertEqual(listed['primary_picture_variants'], data['primary_picture_variants'])
+
+    def test_tour_variants_in_projected_and_serialized_lists(self):
+        tour = TourPackage.objects.create(
+            name='Photo Tour', destination='Sylhet', duration=1, price=10, itinerary='-',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.images = make_jpeg(300, 200)
+            tour.save()
+        tour.refresh_from_db()
+        self.assertEqual(set(tour.images_variants['variants']), {'thumb', 'small', 'large'})
+        with override_settings(FAST_LIST_SERIALIZERS=False):
+            slow = self.client.get('/api/tourdetails/').content
+        fast = self.client.get('/api/tourdetails/')
+        self.assertEqual(fast.content, slow)
+        self.assertEqual(fast.json()['results'][0]['images_variants']['large']['width'], 300)
+
+    def test_replacing_the_image_replaces_its_variants(self):
+        hotel = self.upload_hotel(make_jpeg(300, 300))
+        old_files = [entry['jpeg'] for entry in hotel.primary_picture_variants['variants'].values()]
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.primary_picture = make_jpeg(500, 250)
+            hotel.save()
+        hotel.refresh_from_db()
+        self.assertEqual(hotel.primary_picture_variants['variants']['large']['width'], 500)
+        self.assertFalse(any(os.path.exists(os.path.join(self.media_root, name)) for name in old_files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.primary_picture = None
+            hotel.save()
+        hotel.refresh_from_db()
+        self.assertEqual(hotel.primary_picture_variants, {})
+        self.assertEqual(self.client.get(f'/api/hotels/{hotel.pk}/').data['primary_picture_variants'], {})
+
+    @override_settings(IMAGE_MAX_PIXELS=10_000)
+    def test_oversized_uploads_are_rejected(self):
+        response = self.client.post('/api/hotels/', {
+            'hotel_name': 'Huge', 'hotel_country': 'Nepal', 'primary_picture': make_jpeg(200, 100),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('primary_picture', response.data)
+
+    def test_unreadable_images_record_an_error(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel = Hotel.objects.create(
+                hotel_name='Broken', hotel_country='Nepal',
+                primary_picture=SimpleUploadedFile('broken.jpg', b'not an image'),
+            )
+        hotel.refresh_from_db()
+        self.assertIn('error', hotel.primary_picture_variants)
+        self.assertEqual(self.client.get(f'/api/hotels/{hotel.pk}/').data['primary_picture_variants'], {})
+
+    def test_plain_storage_keeps_replaced_and_deleted_originals(self):
+        hotel = self.upload_hotel(make_jpeg(100, 100))
+        original = hotel.primary_picture.path
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.primary_picture = make_jpeg(120, 80)
+            with CaptureQueriesContext(connection) as ctx:
+                hotel.save()
+        self.assertTrue(os.path.exists(original))
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+        replaced = hotel.primary_picture.path
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.delete()
+        self.assertTrue(os.path.exists(replaced))
+
+    def test_backfill_command(self):
+        hotel = Hotel.objects.create(
+            hotel_name='Old Hotel', hotel_country='Nepal', primary_picture=make_jpeg(100, 100),
+        )  # on_commit never runs, so no variants yet
+        self.assertEqual(hotel.primary_picture_variants, {})
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        hotel.refresh_from_db()
+        self.assertEqual(set(hotel.primary_picture_variants['variants']), {'thumb', 'small'})
+        self.assertIn('Hotel: 1 generated, 0 failed', out.getvalue())
+
+
+@override_settings(IMAGE_VARIANTS_BACKGROUND=False, API_USAGE_ROLLUPS=False, IMAGE_VARIANT_SIZES={'thumb': 64})
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(
+            username='uploader', password='testpassword', email='uploader@example.com', point=1000
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.photo = make_jpeg(300, 200).read()
+
+    def start(self, data):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'big-photo.jpg', 'size': len(data), 'content_type': 'image/jpeg',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        return f"/api/uploads/{response.data['tracking_id']}/"
+
+    def put_chunk(self, url, offset, chunk):
+        return self.client.put(url, chunk, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def upload(self, data, chunk_size=1000):
+        url = self.start(data)
+        for offset in range(0, len(data), chunk_size):
+            response = self.put_chunk(url, offset, data[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        response = self.client.post(f'{url}complete/', {'checksum': hashlib.sha256(data).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return url, response.data['tracking_id']
+
+    def test_chunks_are_written_in_order_and_checked(self):
+        url = self.start(self.photo)
+        response = self.put_chunk(url, 0, self.photo[:1000])
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+        # A retried or skipped chunk is refused with the offset to resume from
+        for offset in (0, 1500):
+            response = self.put_chunk(url, offset, self.photo[offset:offset + 1000])
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response.data['offset'], 1000)
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+        response = self.put_chunk(url, 1000, self.photo[1000:])
+        self.assertEqual(response.data['offset'], len(self.photo))
+        response = self.client.post(f'{url}complete/', {
+            'checksum': 'sha256:' + hashlib.sha256(self.photo).hexdigest().upper(),
+        }, format='json')
+        self.assertEqual(response.data['status'], 'Complete')
+        session = UploadSession.objects.get()
+        with open(partial_path(session), 'rb') as partial:
+            self.assertEqual(partial.read(), self.photo)
+        # Completing again with the same checksum is a no-op
+        response = self.client.post(f'{url}complete/', {'checksum': session.sha256}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_chunks_past_the_declared_size_are_refused(self):
+        url = self.start(b'x' * 10)
+        response = self.put_chunk(url, 0, b'x' * 11)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        with override_settings(CHUNKED_UPLOAD_MAX_SIZE=100):
+            response = self.client.post('/api/uploads/', {'filename': 'a.bin', 'size': 101}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_interrupted_chunk_keeps_the_bytes_that_arrived(self):
+        class DroppedStream:
+            def __init__(self, data):
+                self.stream = io.BytesIO(data)
+
+            def read(self, size):
+                data = self.stream.read(min(size, 700))
+                if not data:
+                    raise OSError('connection reset')
+                return data
+
+        url = self.start(self.photo)
+        session = UploadSession.objects.get()
+        with self.assertRaises(UploadError) as caught:
+            write_chunk(session, 0, DroppedStream(self.photo[:1000]), 2000)
+        self.assertEqual(caught.exception.offset, 1000)
+        self.assertEqual(self.client.get(url).data['offset'], 1000)
+        self.put_chunk(url, 1000, self.photo[1000:])
+        with open(partial_path(session), 'rb') as partial:
+            self.assertEqual(partial.read(), self.photo)
+
+    def test_checksum_mismatch_resets_the_upload(self):
+        url = self.start(self.photo)
+        self.put_chunk(url, 0, self.photo)
+        response = self.client.post(f'{url}complete/', {'checksum': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(UploadSession.objects.get().status, 'Uploading')
+        self.assertEqual(os.path.getsize(partial_path(UploadSession.objects.get())), 0)
+
+    def test_completed_upload_is_attached_to_a_hotel(self):
+        _, tracking_id = self.upload(self.photo)
+        session = UploadSession.objects.get()
+        path = partial_path(session)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/hotels/', {
+                'hotel_name': 'Chunked Hotel', 'hotel_country': 'Nepal', 'primary_picture_upload': tracking_id,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        hotel = Hotel.objects.get()
+        self.assertTrue(hotel.primary_picture.name.startswith('hotel_images/big-photo'))
+        with hotel.primary_picture.open('rb') as stored:
+            self.assertEqual(stored.read(), self.photo)
+        self.assertFalse(os.path.exists(path))  # moved, not copied
+        hotel.refresh_from_db()
+        self.assertIn('thumb', hotel.primary_picture_variants['variants'])
+        self.assertEqual(UploadSession.objects.get().status, 'Attached')
+
+        # An attached upload cannot be used twice
+        response = self.client.post('/api/hotels/', {
+            'hotel_name': 'Second', 'hotel_country': 'Nepal', 'primary_picture_upload': tracking_id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_attaches_an_upload_to_a_tour_package(self):
+        self.user.is_staff = True
+        self.user.save()
+        tour = TourPackage.objects.create(name='Tour', destination='Sylhet', duration=1, price=10, itinerary='-')
+        _, tracking_id = self.upload(self.photo, chunk_size=4096)
+        response = self.client.patch(f'/api/admin/tourpackages/{tour.tracking_id}/', {
+            'images_upload': tracking_id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        tour.refresh_from_db()
+        self.assertTrue(tour.images.name.startswith('tour_images/'))
+        self.assertNotIn('images_upload', response.data)
+
+    def test_uploads_are_private_to_their_owner(self):
+        url, tracking_id = self.upload(self.photo)
+        other = get_user_model().objects.create_user(
+            username='other', password='testpassword', email='other@example.com', point=1000
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post('/api/hotels/', {
+            'hotel_name': 'Stolen', 'hotel_country': 'Nepal', 'primary_picture_upload': tracking_id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('primary_picture_upload', response.data)
+
+    def test_non_image_uploads_fail_image_validation(self):
+        _, tracking_id = self.upload(b'not an image' * 100)
+        response = self.client.post('/api/hotels/', {
+            'hotel_name': 'Broken', 'hotel_country': 'Nepal', 'primary_picture_upload': tracking_id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('primary_picture_upload', response.data)
+        self.assertEqual(UploadSession.objects.get().status, 'Complete')
+
+    def test_chunk_puts_are_not_charged(self):
+        url = self.start(self.photo)
+        points = get_user_model().objects.get(pk=self.user.pk).point
+        self.put_chunk(url, 0, self.photo[:1000])
+        self.client.get(url)
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).point, points)
+
+    def test_purge_expired_uploads(self):
+        url = self.start(self.photo)
+        self.put_chunk(url, 0, self.photo[:1000])
+        session = UploadSession.objects.get()
+        out = StringIO()
+        call_command('purge_expired_uploads', stdout=out)
+        self.assertIn('Purged 0', out.getvalue())
+        UploadSession.objects.update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        call_command('purge_expired_uploads', stdout=out)
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(partial_path(session)))
+
+
+@override_settings(
+    IMAGE_VARIANTS_BACKGROUND=False, API_USAGE_ROLLUPS=False, IMAGE_VARIANT_SIZES={'thumb': 64},
+    IMAGE_VARIANT_FORMATS=('webp',),
+    STORAGES={
+        'default': {'BACKEND': 'api.blobstore.ContentAddressedStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        self.photo = make_jpeg(300, 200).read()
+
+    def create_hotel(self, name, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel = Hotel.objects.create(
+                hotel_name=name, hotel_country='Nepal',
+                primary_picture=SimpleUploadedFile(f'{name}.jpg', data or self.photo),
+            )
+        hotel.refresh_from_db()
+        return hotel
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_hotel('first')
+        second = self.create_hotel('second')
+        digest = hashlib.sha256(self.photo).hexdigest()
+        self.assertEqual(first.primary_picture.name, f'blobs/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second.primary_picture.name, first.primary_picture.name)
+        self.assertEqual(first.primary_picture_variants['variants'], second.primary_picture_variants['variants'])
+        thumb = first.primary_picture_variants['variants']['thumb']['webp']
+        self.assertEqual(self.refcounts(), {first.primary_picture.name: 2, thumb: 2})
+        blob_files = [name for _, _, files in os.walk(os.path.join(self.media_root, 'blobs')) for name in files]
+        self.assertEqual(len(blob_files), 2)
+        self.assertEqual(first.primary_picture.url, f'/media/{first.primary_picture.name}')
+
+    def test_blobs_are_served_with_ranges_and_immutable_caching(self):
+        url = self.create_hotel('served').primary_picture.url
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.photo)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        size = len(self.photo)
+        for header, start, end in (('bytes=0-9', 0, 9), ('bytes=100-', 100, size - 1), ('bytes=-5', size - 5, size - 1)):
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+            self.assertEqual(b''.join(response.streaming_content), self.photo[start:end + 1])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+
+        self.assertEqual(self.client.get('/media/blobs/00/' + '0' * 64 + '.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/uploads/partial/x.part').status_code, 404)
+
+    def test_references_are_released_and_collected(self):
+        keep = self.create_hotel('keep')
+        name = keep.primary_picture.name
+        thumb = keep.primary_picture_variants['variants']['thumb']['webp']
+        gone = self.create_hotel('gone')
+        with self.captureOnCommitCallbacks(execute=True):
+            gone.delete()
+        self.assertEqual(self.refcounts(), {name: 1, thumb: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            keep.primary_picture = SimpleUploadedFile('other.jpg', make_jpeg(120, 80).read())
+            keep.save()
+        self.assertEqual(self.refcounts()[name], 0)
+        self.assertEqual(self.refcounts()[thumb], 0)
+
+        out = StringIO()
+        call_command('gc_media_blobs', stdout=out)
+        self.assertIn('Removed 0 blob(s)', out.getvalue())
+        call_command('gc_media_blobs', '--grace=0', '--dry-run', stdout=out)
+        self.assertIn('Would remove 2 blob(s)', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        call_command('gc_media_blobs', '--grace=0', stdout=out)
+        self.assertIn('Removed 2 blob(s)', out.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+        self.assertNotIn(name, self.refcounts())
+        keep.refresh_from_db()
+        self.assertEqual(self.client.get(keep.primary_picture.url).status_code, 200)
+
+    def test_names_assigned_without_saving_survive_collection(self):
+        name = self.create_hotel('original').primary_picture.name
+        Hotel.objects.filter(hotel_name='original').delete()
+        copy = Hotel.objects.create(hotel_name='copy', hotel_country='Nepal', primary_picture=name)
+        MediaBlob.objects.update(refcount=0)
+        out = StringIO()
+        call_command('gc_media_blobs', '--grace=0', stdout=out)
+        self.assertTrue(os.path.exists(copy.primary_picture.path))
+        call_command('gc_media_blobs', '--recount', stdout=out)
+        self.assertIn('Corrected the reference count of 1 blob(s)', out.getvalue())
+        self.assertEqual(self.refcounts()[name], 1)
+
+    def test_orphaned_blob_files_are_collected(self):
+        orphan = os.path.join(self.media_root, 'blobs', 'ab', 'ab' + '0' * 62 + '.jpg')
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as file:
+            file.write(b'left by a rolled back save')
+        call_command('gc_media_blobs', stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+        call_command('gc_media_blobs', '--grace=0', stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_chunked_upload_is_moved_into_the_blob_store(self):
+        user = get_user_model().objects.create_user(
+            username='blobber', password='testpassword', email='blobber@example.com', point=1000
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        tracking_id = client.post('/api/uploads/', {'filename': 'x.jpg', 'size': len(self.photo)}, format='json').data['tracking_id']
+        client.put(f'/api/uploads/{tracking_id}/', self.photo, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        client.post(f'/api/uploads/{tracking_id}/complete/', {'checksum': hashlib.sha256(self.photo).hexdigest()}, format='json')
+        partial = partial_path(UploadSession.objects.get())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/hotels/', {
+                'hotel_name': 'Blob Hotel', 'hotel_country': 'Nepal', 'primary_picture_upload': tracking_id,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertFalse(os.path.exists(partial))
+        self.assertTrue(response.data['primary_picture'].startswith('http://testserver/media/blobs/'))
+        self.assertEqual(self.refcounts()[Hotel.objects.get().primary_picture.name], 1)
@@ -0,0 +1,232 @@
+"""
+Resumable chunked uploads.
+
+A client opens a session with the file's name and size, then sends the
+bytes with ``PUT`` requests carrying an ``Upload-Offset`` header. Each chunk
+is copied from the request stream to a partial file under MEDIA_ROOT 64 KiB
+at a time, so neither a chunk nor the file is ever held in memory. Whatever
+arrives before a dropped connection is kept: the client asks for the
+session's offset and resumes from there. Completing the session checks the
+SHA-256 of the whole file, after which it can be attached to a hotel or a
+tour package by its ``tracking_id``.
+"""
+import fcntl
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.fields import get_error_detail
+
+from .models import UploadSession
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be applied; carries the API error message"""
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.offset = offset
+
+
+def partial_path(session):
+    return os.path.join(settings.MEDIA_ROOT, settings.CHUNKED_UPLOAD_DIR, f'{session.tracking_id}.part')
+
+
+def next_expiry():
+    return timezone.now() + timedelta(seconds=settings.CHUNKED_UPLOAD_TTL)
+
+
+def start_upload(user, filename, size, content_type=''):
+    """Open a session and its empty partial file"""
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(
+            f'Uploads are limited to {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.',
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    session = UploadSession.objects.create(
+        user=user, filename=os.path.basename(filename), content_type=content_type, size=size,
+        expires_at=next_expiry(),
+    )
+    path = partial_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'xb').close()
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset``, which must be
+    the session's current offset. Returns the new offset. A chunk cut short
+    by the client still advances the offset by the bytes that made it to
+    disk before UploadError is raised.
+    """
+    if session.status != 'Uploading':
+        raise UploadError('This upload is already complete.', status.HTTP_409_CONFLICT)
+    if offset + length > session.size:
+        raise UploadError('The chunk runs past the declared upload size.', status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    try:
+        partial = open(partial_path(session), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('This upload has expired.', status.HTTP_410_GONE)
+
+    with partial:
+        # One writer per session, even across processes; released when the file closes
+        try:
+            fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Another chunk of this upload is being written.', status.HTTP_409_CONFLICT)
+        session.offset = UploadSession.objects.values_list('offset', flat=True).get(pk=session.pk)
+        if offset != session.offset:
+            raise UploadError(
+                f'Expected a chunk at offset {session.offset}.', status.HTTP_409_CONFLICT, offset=session.offset
+            )
+
+        partial.seek(offset)
+        partial.truncate()
+        written = 0
+        try:
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                partial.write(data)
+                written += len(data)
+        except OSError:
+            # The client went away mid-chunk; keep what arrived
+            pass
+        partial.flush()
+        os.fsync(partial.fileno())
+        session.offset = offset + written
+        session.expires_at = next_expiry()
+        UploadSession.objects.filter(pk=session.pk).update(offset=session.offset, expires_at=session.expires_at)
+
+    if written < length:
+        raise UploadError(
+            f'The chunk ended after {written} of {length} bytes; resume from offset {session.offset}.',
+            offset=session.offset,
+        )
+    return session.offset
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(session, checksum):
+    """
+    Check the finished file against the client's SHA-256 hex digest. On a
+    mismatch the partial file is emptied so the upload can be sent again.
+    """
+    if session.status != 'Uploading':
+        if session.sha256 == checksum:
+            return session
+        raise UploadError('This upload is already complete.', status.HTTP_409_CONFLICT)
+    if session.offset != session.size:
+        raise UploadError(
+            f'Only {session.offset} of {session.size} bytes have arrived.', status.HTTP_409_CONFLICT,
+            offset=session.offset,
+        )
+    path = partial_path(session)
+    digest = file_sha256(path)
+    if digest != checksum:
+        with open(path, 'r+b') as partial:
+            partial.truncate(0)
+        UploadSession.objects.filter(pk=session.pk).update(offset=0)
+        session.offset = 0
+        raise UploadError(
+            'The checksum does not match the uploaded bytes; the upload was reset to offset 0.',
+            offset=0,
+        )
+    session.status = 'Complete'
+    session.sha256 = digest
+    session.expires_at = next_expiry()
+    session.save(update_fields=['status', 'sha256', 'expires_at'])
+    return session
+
+
+def abort_upload(session):
+    remove_partial(session)
+    session.delete()
+
+
+def remove_partial(session):
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired_uploads(now=None):
+    """Delete sessions past their TTL along with their partial files; returns the number deleted"""
+    count = 0
+    for session in UploadSession.objects.filter(expires_at__lte=now or timezone.now()).iterator():
+        abort_upload(session)
+        count += 1
+    return count
+
+
+class CompletedUpload(File):
+    """
+    The partial file of a completed upload, for assigning to a FileField.
+    It exposes ``temporary_file_path`` like Django's own large uploads, so
+    the file system storage moves it into place instead of copying it.
+    """
+    def __init__(self, session):
+        self.path = partial_path(session)
+        super().__init__(open(self.path, 'rb'), name=session.filename)
+        self.content_type = session.content_type
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class UploadReferenceMixin:
+    """
+    ModelSerializer mixin taking a completed upload's ``tracking_id`` in
+    place of a multipart file. ``upload_fields`` maps each write-only UUID
+    reference field to the file field it fills; the upload goes through that
+    field's usual validation and is marked attached once the object is saved.
+    """
+    upload_fields = {}
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        self._attached_uploads = []
+        request = self.context.get('request')
+        for reference, file_field in self.upload_fields.items():
+            tracking_id = attrs.pop(reference, None)
+            if tracking_id is None:
+                continue
+            session = UploadSession.objects.filter(
+                tracking_id=tracking_id, user=getattr(request, 'user', None), status='Complete'
+            ).first()
+            if session is None:
+                raise serializers.ValidationError({reference: 'No completed upload with this id.'})
+            upload = CompletedUpload(session)
+            try:
+                attrs[file_field] = self.fields[file_field].run_validation(upload)
+            except (serializers.ValidationError, DjangoValidationError) as e:
+                upload.close()
+                detail = e.detail if isinstance(e, serializers.ValidationError) else get_error_detail(e)
+                raise serializers.ValidationError({reference: detail})
+            self._attached_uploads.append((session, upload))
+        return attrs
+
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        for session, upload in getattr(self, '_attached_uploads', ()):
+            upload.close()
+            UploadSession.objects.filter(pk=session.pk).update(status='Attached')
+        return instance
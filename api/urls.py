@@ -1,4 +1,5 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework import routers
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -6,7 +7,9 @@ from rest_framework_simplejwt.views import (
 )
 from .views import (RegisterView, UserDetailView, HotelViewSet, get_user_points, 
                     hotel_search_basic_auth, give_points, AccountDetailView, update_hotel_admin, TourPackageViewSet, 
-                    TourBookingViewSet, tour_detail_admin, tour_detail_user, UserBookingHistoryView, cancel_booking, TourDetailViewSet)
+                    TourBookingViewSet, tour_detail_admin, tour_detail_user, UserBookingHistoryView, cancel_booking, TourDetailViewSet,
+                    api_usage, SeatHoldViewSet, cancel_package_bookings_admin, search,
+                    catalog_cache_status, UploadViewSet, update_tour_package_admin)
 
 router = routers.DefaultRouter()
 router.register(r'hotels', HotelViewSet, basename='hotel')
@@ -21,6 +24,7 @@ urlpatterns = [
 
 
     path('hotels/search/basic/', hotel_search_basic_auth, name='hotel-search-basic'),
+    path('search/', search, name='search'),
 
     
     path('user/account/', AccountDetailView.as_view(), name='account-detail'),
@@ -32,11 +36,17 @@ urlpatterns = [
     path('admin/give_points/', give_points, name='give-points'),
     path('admin/hotels/<int:hotel_id>/', update_hotel_admin, name='update-hotel-admin'),
     path('admin/tourpackages/<uuid:tracking_id>/details/', tour_detail_admin, name='tour-detail-admin'),
+    path('admin/tourpackages/<uuid:tracking_id>/', update_tour_package_admin, name='update-tour-package-admin'),
+    path('admin/tourpackages/<uuid:tracking_id>/cancel_bookings/', cancel_package_bookings_admin, name='cancel-package-bookings-admin'),
+    path('admin/usage/', api_usage, name='api-usage'),
+    path('admin/cache/catalog/', catalog_cache_status, name='catalog-cache-status'),
 
 ]
 
 router.register(r'tourbookings', TourBookingViewSet, basename='tourbooking')
 router.register(r'tourdetails', TourDetailViewSet, basename='tourdetail')
+router.register(r'seatholds', SeatHoldViewSet, basename='seathold')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns += router.urls
 
@@ -45,3 +55,15 @@ urlpatterns += [
     path('tourpackages/all/', TourDetailViewSet.as_view({'get': 'list'}), name='tourpackage-list'), # Use TourDetailViewSet for public access
     path('tourpackages/delete/<uuid:tracking_id>/', TourPackageViewSet.as_view({'delete': 'destroy'}), name='tourpackage-delete'),
 ]
+
+# Async read paths for ASGI deployments, routed in front of the synchronous views
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        path('hotels/', async_views.hotel_list, name='hotel-list-async'),
+        re_path(r'^tourdetails/$', async_views.tour_detail_list, name='tourdetail-list-async'),
+        re_path(r'^tourdetails/(?P<tracking_id>[^/.]+)/$', async_views.tour_detail_retrieve, name='tourdetail-detail-async'),
+        path('tourpackages/all/', async_views.tour_detail_list, name='tourpackage-list-async'),
+        path('user/tourpackages/<uuid:tracking_id>/details/', async_views.tour_detail_user_async, name='tour-detail-user-async'),
+    ] + urlpatterns
@@ -0,0 +1,243 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Trunc
+
+
+class UsageRollupBuffer:
+    """
+    Counts API requests and points per (user, route, minute) in memory.
+
+    Counters are written to ``ApiUsageRollup`` minute rows with additive
+    ``F()`` updates by a background thread, every ``flush_interval`` seconds
+    or as soon as ``flush_size`` requests have been recorded, and when the
+    worker exits. Requests never wait for the write.
+    """
+    def __init__(self, flush_size=1000, flush_interval=10.0, background=True):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = defaultdict(lambda: [0, 0.0])
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+
+    def record(self, user_id, route, points, at=None):
+        """Count one request, waking the flusher once ``flush_size`` are buffered"""
+        minute = int((at or time.time()) // 60) * 60
+        with self._lock:
+            counter = self._counters[(user_id, route, minute)]
+            counter[0] += 1
+            counter[1] += points
+            self._count += 1
+            full = self._count >= self.flush_size
+        if self.background:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+
+    def flush_due(self):
+        with self._lock:
+            return (
+                self._count >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def flush(self):
+        """Write buffered counters to the minute rollup rows in one transaction"""
+        from .models import ApiUsageRollup
+
+        with self._flush_lock:
+            with self._lock:
+                counters = self._counters
+                self._counters = defaultdict(lambda: [0, 0.0])
+                self._count = 0
+                self._last_flush = time.monotonic()
+            if not counters:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    # Usage of users deleted since the request was recorded is dropped
+                    user_ids = {user_id for user_id, _, _ in counters}
+                    existing = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+                    for (user_id, route, minute), (requests, points) in counters.items():
+                        if user_id not in existing:
+                            continue
+                        bucket_start = datetime.fromtimestamp(minute, tz=dt_timezone.utc)
+                        add_to_bucket(ApiUsageRollup, user_id, route, 'minute', bucket_start, requests, points)
+            except Exception:
+                # Put the counts back so they are retried on the next flush
+                with self._lock:
+                    for key, (requests, points) in counters.items():
+                        counter = self._counters[key]
+                        counter[0] += requests
+                        counter[1] += points
+                        self._count += requests
+                raise
+            return len(counters)
+
+    def stop(self):
+        """Stop the background flusher and write out anything buffered"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='usage-rollup-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing API usage: {e}")
+
+
+def add_to_bucket(model, user_id, route, granularity, bucket_start, requests, points):
+    """Add counts to a rollup row, creating it if needed"""
+    lookup = dict(user_id=user_id, route=route, granularity=granularity, bucket_start=bucket_start)
+    updated = model.objects.filter(**lookup).update(
+        request_count=F('request_count') + requests, points=F('points') + points
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(request_count=requests, points=points, **lookup)
+    except IntegrityError:
+        # Another worker created the row first
+        model.objects.filter(**lookup).update(
+            request_count=F('request_count') + requests, points=F('points') + points
+        )
+
+
+def compact_usage(source, target, older_than):
+    """
+    Fold ``source`` granularity rows that start before ``older_than`` into
+    ``target`` granularity rows, then delete them. Returns the number of
+    source rows compacted.
+    """
+    from .models import ApiUsageRollup
+
+    with transaction.atomic():
+        rows = ApiUsageRollup.objects.filter(granularity=source, bucket_start__lt=older_than)
+        totals = (
+            rows.annotate(bucket=Trunc('bucket_start', target, tzinfo=dt_timezone.utc))
+            .values('user_id', 'route', 'bucket')
+            .annotate(requests=Sum('request_count'), total_points=Sum('points'))
+        )
+        for total in totals:
+            add_to_bucket(
+                ApiUsageRollup, total['user_id'], total['route'], target, total['bucket'],
+                total['requests'], total['total_points'],
+            )
+        count, _ = rows.delete()
+    return count
+
+
+def compact_all(now):
+    """Roll old minute rows into hours and old hour rows into days"""
+    minutes = compact_usage(
+        'minute', 'hour',
+        now - timedelta(hours=getattr(settings, 'USAGE_MINUTE_RETENTION_HOURS', 24)),
+    )
+    hours = compact_usage(
+        'hour', 'day',
+        now - timedelta(days=getattr(settings, 'USAGE_HOUR_RETENTION_DAYS', 30)),
+    )
+    return minutes, hours
+
+
+def usage_series(start, end, granularity, user_id=None, route=None):
+    """
+    Return a usage time series with one range query. Rows of any stored
+    granularity are truncated to the requested one in the database.
+    """
+    from .models import ApiUsageRollup
+
+    rows = ApiUsageRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end)
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    if route:
+        rows = rows.filter(route=route)
+    return (
+        rows.annotate(bucket=Trunc('bucket_start', granularity, tzinfo=dt_timezone.utc))
+        .values('bucket')
+        .annotate(requests=Sum('request_count'), points=Sum('points'))
+        .order_by('bucket')
+    )
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_usage_buffer():
+    """
+    Return the process-wide usage buffer, or None when usage rollups are
+    disabled in settings.
+    """
+    global _buffer
+    if not getattr(settings, 'API_USAGE_ROLLUPS', True):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = UsageRollupBuffer(
+                    flush_size=getattr(settings, 'USAGE_FLUSH_SIZE', 1000),
+                    flush_interval=getattr(settings, 'USAGE_FLUSH_INTERVAL', 10.0),
+                )
+                atexit.register(_stop_at_exit)
+    return _buffer
+
+
+def shutdown_usage_buffer():
+    """
+    Stop the process-wide buffer and write out what it holds while the
+    current database is still the one the requests ran against. Test runs
+    and benchmarks call this before destroying their test database, so
+    nothing is left for the exit-time flush to write elsewhere.
+    """
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        atexit.unregister(_stop_at_exit)
+        _stop(buffer)
+
+
+def _stop_at_exit():
+    if _buffer is not None:
+        _stop(_buffer)
+
+
+def _stop(buffer):
+    try:
+        buffer.stop()
+    except Exception as e:
+        print(f"Error flushing API usage: {e}")
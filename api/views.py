@@ -1,14 +1,30 @@
-from rest_framework import viewsets, generics, permissions, status, serializers
+from rest_framework import viewsets, generics, mixins, permissions, status, serializers
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
-from .models import Hotel, TourPackage, TourBooking
-from .serializers import UserSerializer, UserDetailSerializer, HotelSerializer, GivePointsSerializer, TourPackageSerializer, TourBookingSerializer, TourDetailSerializer
-from django.contrib.auth import authenticate
+from .models import Hotel, SeatHold, TourPackage, TourBooking, UploadSession
+from .serializers import UserSerializer, UserDetailSerializer, HotelSerializer, GivePointsSerializer, TourPackageSerializer, TourBookingSerializer, TourDetailSerializer, UsageQuerySerializer, SearchQuerySerializer, BulkTourBookingSerializer, SeatHoldSerializer, UploadSessionSerializer, UploadCompleteSerializer, tour_detail_projection, tour_package_projection
+from .usage import usage_series
+from .search import KINDS, search as search_documents
+from .booking import (BookingError, BookingFailed, book_package, book_packages, cancel_package_bookings,
+                      check_booking_open, record_cancellations, refund_percentage, release_seats)
+from .holds import convert_hold, hold_seats, release_hold
+from .idempotency import idempotent
+from .catalog_cache import cache_stats, cached_page, store_page
+from .conditional import (ConditionalGetMixin, hotel_catalog_validators, hotel_validators, not_modified, set_validators,
+                          tour_catalog_validators, tour_validators)
+from .fieldsets import HOTEL_LEAN_FIELDS, TOUR_LEAN_FIELDS, SparseFieldsetMixin
+from .projection import ProjectionListMixin
+from .streaming import stream_queryset
+from .uploads import UploadError, abort_upload, complete_upload, start_upload, write_chunk
+from .pagination import BookingHistoryPagination, CatalogPagination
+from django.conf import settings
+from .credential_cache import authenticate_basic
 import base64
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
 from django.utils import timezone
 from decimal import Decimal
 User = get_user_model()
@@ -24,20 +40,32 @@ class RegisterView(generics.CreateAPIView):
 @permission_classes([AllowAny])
 def hotel_search_basic_auth(request):
     """
-    View for searching hotels using basic authentication (username and password)
+    View for searching hotels using basic authentication (username and password).
+    With ?stream=json or ?stream=ndjson the hotels are streamed in chunks
+    instead of being rendered all at once.
     """
     auth_header = request.META.get('HTTP_AUTHORIZATION', '')
     
     if auth_header and auth_header.startswith('Basic '):
         try:
-            # Decode the Basic Auth string
-            auth_decoded = base64.b64decode(auth_header[6:]).decode('utf-8')
-            username, password = auth_decoded.split(':', 1)
-            
-            user = authenticate(request, username=username, password=password)
+            if hasattr(request._request, 'basic_auth_user'):
+                # Already authenticated by BasicAuthenticationMiddleware
+                user = request._request.basic_auth_user
+            else:
+                # Decode the Basic Auth string
+                auth_decoded = base64.b64decode(auth_header[6:]).decode('utf-8')
+                username, password = auth_decoded.split(':', 1)
+
+                user = authenticate_basic(request, username=username, password=password)
             
             if user is not None:
                 # Authentication successful
+                stream = request.query_params.get('stream')
+                if stream in ('json', 'ndjson'):
+                    return stream_queryset(
+                        Hotel.objects.order_by('pk'), HotelSerializer,
+                        settings.HOTEL_STREAM_CHUNK_SIZE, format=stream,
+                    )
                 hotels = Hotel.objects.all()  # Or apply filtering based on search criteria
                 serializer = HotelSerializer(hotels, many=True)
                 return Response(serializer.data)
@@ -118,12 +146,74 @@ def give_points(request):
     else:
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_status(request):
+    """
+    View for super admins to get the hit and miss counters of the tour catalog response cache
+    """
+    return Response(cache_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_usage(request):
+    """
+    View for super admins to get an API usage time series, optionally for one user and route
+    """
+    serializer = UsageQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+
+    series = usage_series(
+        params['start'], params['end'], params['granularity'],
+        user_id=params.get('user_id'), route=params.get('route'),
+    )
+    return Response({
+        'user_id': params.get('user_id'),
+        'route': params.get('route'),
+        'granularity': params['granularity'],
+        'start': params['start'],
+        'end': params['end'],
+        'series': [{
+            'bucket': row['bucket'],
+            'requests': row['requests'],
+            'points': row['points'],
+        } for row in series]
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """
+    Ranked full-text search over hotels and tour packages. Every word of
+    ``q`` must match, as a prefix, the name, place or description text.
+    """
+    serializer = SearchQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    kinds = KINDS if params['type'] == 'all' else (params['type'],)
+
+    serializers_by_kind = {'hotel': HotelSerializer, 'tour': TourDetailSerializer}
+    results = [{
+        'type': kind,
+        'score': round(score, 4),
+        'data': serializers_by_kind[kind](instance, context={'request': request}).data,
+    } for kind, instance, score in search_documents(params['q'], kinds, params['limit'])]
+    return Response({
+        'query': params['q'],
+        'count': len(results),
+        'results': results,
+    })
+
 # Hotel Views
-class HotelViewSet(viewsets.ModelViewSet):
+class HotelViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for Hotel CRUD operations"""
     queryset = Hotel.objects.all()
     serializer_class = HotelSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = CatalogPagination
+    keyset_orderings = {'created_at': '-created_at', 'rating': '-rating'}
+    lean_fields = HOTEL_LEAN_FIELDS
 
     def get_queryset(self):
         """
@@ -140,6 +230,12 @@ class HotelViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def list_validators(self, request):
+        return hotel_catalog_validators(request, self.get_queryset())
+
+    def object_validators(self, request, pk):
+        return hotel_validators(request, pk)
+
 @api_view(['PUT'])
 @permission_classes([IsAdminUser])
 def update_hotel_admin(request, hotel_id):
@@ -154,25 +250,29 @@ def update_hotel_admin(request, hotel_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
-    serializer = HotelSerializer(hotel, data=request.data)
+    serializer = HotelSerializer(hotel, data=request.data, context={'request': request})
     if serializer.is_valid():
         serializer.save()
         return Response(serializer.data)
     else:
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class TourPackageViewSet(viewsets.ModelViewSet):
+class TourPackageViewSet(SparseFieldsetMixin, ProjectionListMixin, viewsets.ModelViewSet):
     """ViewSet for TourPackage CRUD operations"""
     queryset = TourPackage.objects.all()
     serializer_class = TourPackageSerializer
+    projection = tour_package_projection
     permission_classes = [IsAdminUser] # Only allow admin users for CRUD operations
     lookup_field = 'tracking_id' # Use tracking_id for lookups
+    pagination_class = CatalogPagination
+    keyset_orderings = {'created_at': '-created_at', 'start_date': 'start_date', 'price': 'price'}
+    lean_fields = TOUR_LEAN_FIELDS
 
     def get_queryset(self):
         """
         Optionally filter tour packages by destination or name
         """
-        queryset = TourPackage.objects.all()
+        queryset = TourPackage.objects.with_availability()
         destination = self.request.query_params.get('destination')
         name = self.request.query_params.get('name')
 
@@ -183,31 +283,50 @@ class TourPackageViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-class TourDetailViewSet(viewsets.ReadOnlyModelViewSet):
+class TourDetailViewSet(ConditionalGetMixin, SparseFieldsetMixin, ProjectionListMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for listing tour packages with detailed information.
     This viewset is read-only and does not allow create, update, or delete actions.
     """
-    queryset = TourPackage.objects.all()
+    queryset = TourPackage.objects.with_availability()
     serializer_class = TourDetailSerializer
+    projection = tour_detail_projection
     permission_classes = [AllowAny] # Or set to IsAuthenticated if you want to protect this view
     lookup_field = 'tracking_id'
+    pagination_class = CatalogPagination
+    keyset_orderings = TourPackageViewSet.keyset_orderings
+    lean_fields = TOUR_LEAN_FIELDS
+
+    def list(self, request, *args, **kwargs):
+        """Serve the page from the rendered-response cache when it is there"""
+        response = cached_page(request)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return response
 
-class TourBookingViewSet(viewsets.ModelViewSet):
-    """ViewSet for TourBooking CRUD operations"""
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(request, 'catalog_cache_key', None) and isinstance(response, Response):
+            store_page(request, response.render())
+        return response
+
+    def list_validators(self, request):
+        return tour_catalog_validators(request)
+
+    def object_validators(self, request, tracking_id):
+        return tour_validators(request, tracking_id)
+
+class TourBookingViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for listing and creating tour bookings. There is no update or
+    delete: seats are claimed and released through book_package and
+    cancel_booking, which keep booked_seats and BookingSummary in step.
+    """
     queryset = TourBooking.objects.all()
     serializer_class = TourBookingSerializer
     permission_classes = [IsAuthenticated]
 
-    def dispatch(self, request, *args, **kwargs):
-        # Decrease user points before processing the request
-        if request.user.is_authenticated and not request.user.is_superuser:
-            request.user.point -= 0.001
-            if request.user.point < 0:
-                request.user.point = 0
-            request.user.save()
-        return super().dispatch(request, *args, **kwargs)
-
+    @idempotent('tourbooking-create')
     def create(self, request, *args, **kwargs):
         """
         Override the create method to implement booking logic with point validation
@@ -227,56 +346,209 @@ class TourBookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        total_cost = float(package.price) * num_travelers
+        try:
+            check_booking_open(package, timezone.now())
+            booking = book_package(user, package, num_travelers)
+        except BookingError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-        if package.last_booking_date and timezone.now().date() > package.last_booking_date.date():
-            return Response(
-                {'error': 'Booking for this tour package is closed.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return Response({
+            'message': 'Booking successful!',
+            'total_cost': float(booking.total_cost),
+            'remaining_points': user.point,
+            'tour_name': package.name,
+            'tour_location': package.destination,
+            'tour_start_date': package.start_date,
+            'tour_end_date': package.end_date,
+            'tour_booking_tracking_id': str(booking.tracking_id),
+            'total_booked_seats_history': package.booked_seats, # Include current booking in history
+        }, status=status.HTTP_201_CREATED)
 
-        if user.point < total_cost:
-            return Response(
-                {'error': 'Insufficient points to book this tour'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        Book several packages in one transaction. With atomic=true (the default)
+        either every item is booked or none is; otherwise items succeed or fail on their own.
+        """
+        serializer = BulkTourBookingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        atomic = serializer.validated_data['atomic']
 
-        # Check if tour has available capacity
-        already_booked = package.bookings.aggregate(total_booked=models.Sum('num_travelers'))['total_booked'] or 0
-        available_seats = package.capacity - already_booked
-        if available_seats < num_travelers:
-            return Response(
-                {'error': 'This tour is fully booked. Please select another tour.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        try:
+            results = book_packages(request.user, serializer.validated_data['bookings'], atomic=atomic)
+        except BookingFailed as e:
+            return Response({'error': e.message, 'results': e.results}, status=status.HTTP_400_BAD_REQUEST)
+
+        booked = [result for result in results if result['status'] == 'booked']
+        return Response({
+            'message': f'{len(booked)} of {len(results)} bookings successful',
+            'atomic': atomic,
+            'total_cost': sum(result['total_cost'] for result in booked),
+            'remaining_points': request.user.point,
+            'results': results,
+        }, status=status.HTTP_201_CREATED if booked else status.HTTP_400_BAD_REQUEST)
+    
 
-        # Deduct points from user account
-        user.point -= total_cost
-        user.save()
+class SeatHoldViewSet(viewsets.GenericViewSet):
+    """
+    Short-lived seat holds for busy tour packages. A hold takes seats through
+    the package's admission queue and is then confirmed into a booking,
+    released, or expired by the release_expired_holds sweeper.
+    """
+    serializer_class = SeatHoldSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'tracking_id'
 
-        # Create the booking
-        import uuid
-        booking = TourBooking.objects.create(user=user, package=package, num_travelers=num_travelers)
-        booking.tracking_id = uuid.uuid4() # Assign a tracking ID to the booking
-        booking.total_cost = total_cost # Save the calculated total_cost to the booking
-        booking.save()
+    def get_queryset(self):
+        return SeatHold.objects.filter(user=self.request.user).select_related('package')
+
+    def hold_data(self, hold):
+        return {
+            'hold_tracking_id': str(hold.tracking_id),
+            'package_tracking_id': str(hold.package.tracking_id),
+            'tour_name': hold.package.name,
+            'num_seats': hold.num_seats,
+            'status': hold.status,
+            'expires_at': hold.expires_at,
+        }
+
+    def create(self, request):
+        """Hold seats on a package until the hold expires"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            package = TourPackage.objects.get(tracking_id=serializer.validated_data['package_tracking_id'])
+        except TourPackage.DoesNotExist:
+            return Response(
+                {'error': 'Tour package not found with the provided tracking ID.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
+        try:
+            hold = hold_seats(request.user, package, serializer.validated_data['num_seats'])
+        except BookingError as e:
+            return Response({'error': e.message}, status=e.status_code)
+
+        return Response(self.hold_data(hold), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, tracking_id=None):
+        return Response(self.hold_data(self.get_object()))
+
+    def destroy(self, request, tracking_id=None):
+        """Release a hold before it expires"""
+        hold = self.get_object()
+        if not release_hold(hold):
+            return Response({'error': 'This seat hold is no longer active.'}, status=status.HTTP_409_CONFLICT)
+        return Response(self.hold_data(hold))
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, tracking_id=None):
+        """Turn the hold into a booking, charging the points"""
+        hold = self.get_object()
+        try:
+            booking = convert_hold(hold)
+        except BookingError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
+        request.user.refresh_from_db(fields=['point'])
+        package = hold.package
         return Response({
             'message': 'Booking successful!',
-            'total_cost': total_cost,
-            'remaining_points': user.point,
+            'total_cost': float(booking.total_cost),
+            'remaining_points': request.user.point,
             'tour_name': package.name,
             'tour_location': package.destination,
             'tour_start_date': package.start_date,
             'tour_end_date': package.end_date,
             'tour_booking_tracking_id': str(booking.tracking_id),
-            'total_booked_seats_history': already_booked + num_travelers, # Include current booking in history
+            'hold_tracking_id': str(hold.tracking_id),
         }, status=status.HTTP_201_CREATED)
-    
+
+
+class UploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads, see api/uploads.py. POST opens a session,
+    each PUT sends the raw bytes of one chunk at its ``Upload-Offset``, GET
+    or HEAD reports how far the upload got, and ``complete`` checks the
+    SHA-256 of the whole file.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'tracking_id'
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def upload_response(self, session, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(session).data, status=status_code)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+    def error_response(self, e):
+        body = {'error': e.message}
+        if e.offset is not None:
+            body['offset'] = e.offset
+        response = Response(body, status=e.status_code)
+        if e.offset is not None:
+            response['Upload-Offset'] = str(e.offset)
+        return response
+
+    def create(self, request):
+        """Open an upload session for a file of the given size"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = start_upload(request.user, **serializer.validated_data)
+        except UploadError as e:
+            return self.error_response(e)
+        return self.upload_response(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, tracking_id=None):
+        return self.upload_response(self.get_object())
+
+    def update(self, request, tracking_id=None):
+        """Write the request body at ``Upload-Offset``; the body is streamed, never parsed"""
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'A chunk needs an integer Upload-Offset header and a Content-Length.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset < 0 or length < 0:
+            return Response({'error': 'Offsets and lengths cannot be negative.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            write_chunk(session, offset, request.stream, length)
+        except UploadError as e:
+            return self.error_response(e)
+        return self.upload_response(session)
+
+    def destroy(self, request, tracking_id=None):
+        """Abandon an upload and delete what was sent"""
+        abort_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'], serializer_class=UploadCompleteSerializer)
+    def complete(self, request, tracking_id=None):
+        """Check the finished file against the client's SHA-256 checksum"""
+        session = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            complete_upload(session, serializer.validated_data['checksum'])
+        except UploadError as e:
+            return self.error_response(e)
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('cancel-booking')
 def cancel_booking(request):
     """
     View for canceling a tour booking using tracking IDs in the request body.
@@ -303,33 +575,27 @@ def cancel_booking(request):
         return Response({'message': 'Booking already cancelled'})
 
     now = timezone.now()
-    time_difference = booking.booking_date - now
     
     # Check if cancellation is allowed based on last_booking_date
     if booking.package.last_booking_date and now.date() > booking.package.last_booking_date.date():
         return Response({'error': 'Cancellation not allowed after last booking date.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    refund_percentage = 0
-    
     # Calculate refund based on cancellation time
-    if time_difference <= timezone.timedelta(minutes=20):
-        refund_percentage = 1.0  # 100% refund
-    elif time_difference <= timezone.timedelta(days=1):
-        refund_percentage = 0.9  # 90% refund
-    elif (booking.package.start_date - now.date()).days > 5:
-        refund_percentage = 0.7  # 70% refund
-    elif now.date() == booking.package.start_date:
-        refund_percentage = 0.4  # 40% refund
-    else:
-        refund_percentage = 0  # No refund
-
-    # Refund points
-    refund_amount = booking.total_cost * Decimal(str(refund_percentage))
-    booking.user.point += float(refund_amount)
-    booking.user.save()
+    percentage = refund_percentage(booking, now)
+
+    # Refund points, release the seats and flip the status together. The
+    # conditional update makes sure a booking is only ever refunded once.
+    refund_amount = booking.total_cost * Decimal(str(percentage))
+    with transaction.atomic():
+        cancelled = TourBooking.objects.filter(pk=booking.pk).exclude(status='Cancelled').update(status='Cancelled')
+        if not cancelled:
+            return Response({'message': 'Booking already cancelled'})
+        User.objects.filter(pk=booking.user_id).update(point=F('point') + float(refund_amount))
+        release_seats(booking.package_id, booking.num_travelers)
+        record_cancellations(booking.user_id, 1, booking.total_cost)
 
     booking.status = 'Cancelled'
-    booking.save()
+    booking.user.refresh_from_db(fields=['point'])
     cancel_booking_time = timezone.now()
 
 
@@ -343,104 +609,103 @@ def cancel_booking(request):
     })
 
 # User booking history view
+def booking_history_item(booking, today):
+    """Row of the booking history, read from a booking loaded with its package"""
+    package = booking.package
+    return {
+        'package': package.id,
+        'package_tracking_id': str(package.tracking_id),
+        'package_name': package.name,
+        'package_destination': package.destination,
+        'package_start_date': package.start_date,
+        'package_end_date': package.end_date,
+        'num_travelers': booking.num_travelers,
+        'is_active': today <= package.end_date,
+        'booking_date': booking.booking_date,
+        'remaining_days_to_start': (package.start_date - today).days,
+        'tour_booking_tracking_id': str(booking.tracking_id),
+        'status': booking.status,
+    }
+
 class UserBookingHistoryView(generics.ListAPIView):
     """
     View for retrieving booking history of the logged-in user
     """
     serializer_class = TourBookingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BookingHistoryPagination
 
     def get_queryset(self):
         """
         Return all tour bookings for the current user
         """
         user = self.request.user
-        return TourBooking.objects.filter(user=user)
+        return TourBooking.objects.filter(user=user).select_related('package')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        today = timezone.now().date()
 
-        active_bookings_count = queryset.filter(status='Pending', package__end_date__gte=timezone.now().date()).count()
-        cancelled_bookings_count = queryset.filter(status='Cancelled').count()
+        # Every status counter in one conditional aggregation
+        counters = queryset.aggregate(
+            count=Count('pk'),
+            active_booking=Count('pk', filter=Q(status='Pending', package__end_date__gte=today)),
+            cancel_booking=Count('pk', filter=Q(status='Cancelled')),
+        )
 
         # Filter for tours that ended within the last 7 days
-        seven_days_ago = timezone.now().date() - timezone.timedelta(days=1)
+        seven_days_ago = today - timezone.timedelta(days=1)
         recent_ended_tours = queryset.filter(
             package__end_date__gte=seven_days_ago,
-            package__end_date__lt=timezone.now().date() # Ended before today
+            package__end_date__lt=today # Ended before today
         ).order_by('-package__end_date') # Order by end date descending
 
-        recent_ended_tours_data = [{
-            'package': booking.package.id,
-            'package_tracking_id': str(booking.package.tracking_id),
-            'package_name': booking.package.name,
-            'package_destination': booking.package.destination,
-            'package_start_date': booking.package.start_date,
-            'package_end_date': booking.package.end_date,
-            'num_travelers': booking.num_travelers,
-            'is_active': timezone.now().date() <= booking.package.end_date,
-            'booking_date': booking.booking_date,
-            'remaining_days_to_start': (booking.package.start_date - timezone.now().date()).days,
-            'tour_booking_tracking_id': str(booking.tracking_id),
-            'status': booking.status,
-        } for booking in recent_ended_tours]
-
-        # Find the nearest upcoming tour booking
+        # Find the nearest upcoming tour booking, with the travelers the user
+        # booked on its package across all bookings
         nearest_upcoming_tour = queryset.filter(
-            package__start_date__gte=timezone.now().date()
+            package__start_date__gte=today
+        ).annotate(
+            total_num_travelers=Subquery(
+                TourBooking.objects.filter(user=request.user, package=OuterRef('package'))
+                .values('package').annotate(total=models.Sum('num_travelers')).values('total')
+            )
         ).order_by('package__start_date').first()
 
         nearest_upcoming_tour_data = None
         if nearest_upcoming_tour:
-            # Calculate total travelers for this package across all bookings by the user
-            total_num_travelers = queryset.filter(
-                package=nearest_upcoming_tour.package
-            ).aggregate(total_travelers=models.Sum('num_travelers'))['total_travelers'] or 0
-
+            package = nearest_upcoming_tour.package
             nearest_upcoming_tour_data = {
-                'package': nearest_upcoming_tour.package.id,
-                'is_active': timezone.now().date() <= nearest_upcoming_tour.package.end_date,
-                'remaining_days_to_start': (nearest_upcoming_tour.package.start_date - timezone.now().date()).days,
-                'package_name': nearest_upcoming_tour.package.name,
-                'package_destination': nearest_upcoming_tour.package.destination,
-                'total_num_travelers': total_num_travelers,
+                'package': package.id,
+                'is_active': today <= package.end_date,
+                'remaining_days_to_start': (package.start_date - today).days,
+                'package_name': package.name,
+                'package_destination': package.destination,
+                'total_num_travelers': nearest_upcoming_tour.total_num_travelers or 0,
                 'traking_field': {
-                    'package_tracking_id': str(nearest_upcoming_tour.package.tracking_id),
+                    'package_tracking_id': str(package.tracking_id),
                     'tour_booking_tracking_id': str(nearest_upcoming_tour.tracking_id)
                 },
                 'time_status': {
-                    'package_start_date': nearest_upcoming_tour.package.start_date,
-                    'package_end_date': nearest_upcoming_tour.package.end_date,
+                    'package_start_date': package.start_date,
+                    'package_end_date': package.end_date,
                     'booking_date': nearest_upcoming_tour.booking_date
                 },
                 'current_status': nearest_upcoming_tour.status
             }
 
+        page = self.paginate_queryset(queryset)
 
         return Response({
-            'count': queryset.count(),
-            'next': None,
-            'previous': None,
+            'count': counters['count'],
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'status': {
-                'active_booking': active_bookings_count,
-                'cancel_booking': cancelled_bookings_count,
+                'active_booking': counters['active_booking'],
+                'cancel_booking': counters['cancel_booking'],
             },
-            'resent_tour_status': recent_ended_tours_data,
+            'resent_tour_status': [booking_history_item(booking, today) for booking in recent_ended_tours],
             'nearest_upcoming_tour': nearest_upcoming_tour_data,
-            'results': [{
-                'package': booking.package.id,
-                'package_tracking_id': str(booking.package.tracking_id),
-                'package_name': booking.package.name,
-                'package_destination': booking.package.destination,
-                'package_start_date': booking.package.start_date,
-                'package_end_date': booking.package.end_date,
-                'num_travelers': booking.num_travelers,
-                'is_active': timezone.now().date() <= booking.package.end_date,
-                'booking_date': booking.booking_date,
-                'remaining_days_to_start': (booking.package.start_date - timezone.now().date()).days,
-                'tour_booking_tracking_id': str(booking.tracking_id),
-                'status': booking.status,
-            } for booking in queryset]
+            'results': [booking_history_item(booking, today) for booking in page],
         })
 
 @api_view(['GET'])
@@ -450,7 +715,7 @@ def tour_detail_admin(request, tracking_id):
     View for super admins to get tour details with booking information using tracking ID
     """
     try:
-        tour = TourPackage.objects.get(tracking_id=tracking_id)
+        tour = TourPackage.objects.with_availability().get(tracking_id=tracking_id)
     except TourPackage.DoesNotExist:
         return Response(
             {'error': 'Tour package not found'},
@@ -464,14 +729,68 @@ def tour_detail_admin(request, tracking_id):
 
 
 
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def update_tour_package_admin(request, tracking_id):
+    """
+    View for super admins to update tour package fields, e.g. attaching a
+    completed chunked upload as the tour image through ``images_upload``
+    """
+    try:
+        tour = TourPackage.objects.with_availability().get(tracking_id=tracking_id)
+    except TourPackage.DoesNotExist:
+        return Response(
+            {'error': 'Tour package not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    serializer = TourPackageSerializer(tour, data=request.data, partial=True, context={'request': request})
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data)
+    else:
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cancel_package_bookings_admin(request, tracking_id):
+    """
+    View for super admins to cancel every active booking of a tour package,
+    refunding each booking by the cancel_booking tiers.
+    """
+    try:
+        package = TourPackage.objects.get(tracking_id=tracking_id)
+    except TourPackage.DoesNotExist:
+        return Response(
+            {'error': 'Tour package not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    cancelled, refunds = cancel_package_bookings(package)
+    return Response({
+        'message': f'{cancelled} bookings cancelled',
+        'package_tracking_id': str(package.tracking_id),
+        'cancelled_bookings': cancelled,
+        'refunded_users': len(refunds),
+        'total_refund': sum(refunds.values()),
+        'booked_seats': package.booked_seats,
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def tour_detail_user(request, tracking_id):
     """
     View for users to get tour details using tracking ID (without user list)
     """
+    validators = tour_validators(request, tracking_id)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+
     try:
-        tour = TourPackage.objects.get(tracking_id=tracking_id)
+        tour = TourPackage.objects.with_availability().get(tracking_id=tracking_id)
     except TourPackage.DoesNotExist:
         return Response(
             {'error': 'Tour package not found'},
@@ -480,4 +799,4 @@ def tour_detail_user(request, tracking_id):
 
     # Use the existing TourDetailSerializer from serializers.py
     serializer = TourDetailSerializer(tour)
-    return Response(serializer.data)
+    return set_validators(Response(serializer.data), validators)
@@ -0,0 +1,78 @@
+"""
+Local load test of the sync and async stacks behind the ASGI handler.
+
+Drives hotel_api.asgi.application directly with many concurrent clients on
+one event loop, the way uvicorn would, once with the synchronous views and
+once with ASYNC_READ_VIEWS enabled. Each mode runs in its own process since
+the URLconf is chosen at import time.
+
+    python -m benchmarks.async_load [concurrency] [requests_per_client]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BASE_DIR, benchmark_database, bearer_for, create_user, percentile
+
+PATHS = ('/api/tourdetails/', '/api/tourpackages/all/', '/api/hotels/')
+
+
+async def run_clients(concurrency, per_client, token):
+    from django.test import AsyncClient
+
+    latencies = []
+
+    async def client_loop(index):
+        client = AsyncClient()
+        for i in range(per_client):
+            path = PATHS[(index + i) % len(PATHS)]
+            start = time.perf_counter()
+            response = await client.get(path, headers={'authorization': token})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, (path, response.status_code, response.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def run_mode(concurrency, per_client):
+    with benchmark_database():
+        from api.models import Hotel, TourBooking, TourPackage
+
+        user = create_user()
+        Hotel.objects.bulk_create(
+            Hotel(hotel_name=f'Hotel {i}', hotel_country='Bangladesh') for i in range(50)
+        )
+        packages = TourPackage.objects.bulk_create(
+            TourPackage(name=f'Tour {i}', destination='Sylhet', duration=3, price=10, itinerary='-', capacity=500)
+            for i in range(50)
+        )
+        for package in packages:
+            TourBooking.objects.create(user=user, package=package, num_travelers=2)
+
+        elapsed, latencies = asyncio.run(run_clients(concurrency, per_client, bearer_for(user)))
+        mode = 'async views' if os.environ.get('ASYNC_READ_VIEWS') == 'True' else 'sync views'
+        print(
+            f'{mode:<12} concurrency {concurrency:>4}  {len(latencies) / elapsed:>9.1f} req/s  '
+            f'p50 {percentile(latencies, 50) * 1000:>8.2f} ms  p99 {percentile(latencies, 99) * 1000:>8.2f} ms'
+        )
+
+
+def main(concurrency=50, per_client=20):
+    for enabled in ('False', 'True'):
+        env = dict(os.environ, ASYNC_READ_VIEWS=enabled, DEBUG='False')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.async_load', '--mode', str(concurrency), str(per_client)],
+            cwd=BASE_DIR, env=env, check=True,
+        )
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] == '--mode':
+        run_mode(*map(int, args[1:]))
+    else:
+        main(*map(int, args))
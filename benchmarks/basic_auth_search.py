@@ -0,0 +1,38 @@
+"""
+p50/p99 latency of POST /api/hotels/search/basic/ with and without the
+verified-credential cache.
+
+    python -m benchmarks.basic_auth_search [iterations]
+"""
+import base64
+import sys
+
+from benchmarks.common import benchmark_database, create_user, report, timed
+
+
+def main(iterations=200):
+    with benchmark_database():
+        from django.test import Client, override_settings
+        from api.credential_cache import get_credential_cache
+        from api.models import Hotel
+
+        create_user(username='basic')
+        Hotel.objects.bulk_create(
+            Hotel(hotel_name=f'Hotel {i}', hotel_country='Bangladesh') for i in range(20)
+        )
+        credentials = base64.b64encode(b'basic:bench-password-123').decode()
+        client = Client(HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+        def hit():
+            response = client.post('/api/hotels/search/basic/')
+            assert response.status_code == 200, response.content
+
+        with override_settings(BASIC_AUTH_CACHE_TTL=0):
+            report('no credential cache', timed(hit, iterations))
+
+        get_credential_cache().clear()
+        report('verified-credential cache', timed(hit, iterations))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
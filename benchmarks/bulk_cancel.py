@@ -0,0 +1,95 @@
+"""
+Cancelling every booking of one TourPackage.
+
+Cancels 10k bookings spread over a few hundred users, first one booking at
+a time the way an admin would through cancel_booking, then with
+cancel_package_bookings. Reports wall time, bookings/sec and the number of
+queries each approach runs.
+
+    python -m benchmarks.bulk_cancel [bookings] [users]
+"""
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+from benchmarks.common import benchmark_database, create_user
+
+
+def setup_package(label, bookings, users):
+    from api.models import TourBooking, TourPackage
+
+    package = TourPackage.objects.create(
+        name=label, destination='Benchmark', duration=1, price=10, itinerary='-',
+        capacity=bookings, booked_seats=bookings, start_date=date.today() + timedelta(days=30),
+    )
+    owners = [create_user(username=f'{label}-{i}', points=0) for i in range(users)]
+    TourBooking.objects.bulk_create([
+        TourBooking(
+            user=owners[i % users], package=package, num_travelers=1, total_cost=10, tracking_id=uuid.uuid4()
+        )
+        for i in range(bookings)
+    ], batch_size=1000)
+    return package
+
+
+def one_by_one(package):
+    """The per-booking flow of cancel_booking: load, compute the tier, refund, flip, release"""
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from django.db.models import F
+    from django.utils import timezone
+    from api.booking import refund_percentage, release_seats
+    from api.models import TourBooking
+
+    User = get_user_model()
+    for booking in TourBooking.objects.filter(package=package).exclude(status='Cancelled').select_related('package'):
+        now = timezone.now()
+        refund = float(booking.total_cost) * refund_percentage(booking, now)
+        with transaction.atomic():
+            TourBooking.objects.filter(pk=booking.pk).exclude(status='Cancelled').update(status='Cancelled')
+            User.objects.filter(pk=booking.user_id).update(point=F('point') + refund)
+            release_seats(booking.package_id, booking.num_travelers)
+
+
+def bulk(package):
+    from api.booking import cancel_package_bookings
+    cancel_package_bookings(package)
+
+
+def run(label, cancel, bookings, users):
+    from django.db import connection
+    from django.db.models import Sum
+    from django.contrib.auth import get_user_model
+    from api.models import TourBooking
+
+    package = setup_package(label, bookings, users)
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        cancel(package)
+        elapsed = time.perf_counter() - start
+
+    cancelled = TourBooking.objects.filter(package=package, status='Cancelled').count()
+    refunded = get_user_model().objects.filter(username__startswith=f'{label}-').aggregate(total=Sum('point'))['total']
+    print(
+        f'{label:<12} {elapsed:>8.3f} s  {cancelled / elapsed:>10.1f} bookings/s  '
+        f'queries {queries:>6}  cancelled {cancelled}  refunded {refunded:.0f}'
+    )
+
+
+def main(bookings=10_000, users=500):
+    with benchmark_database():
+        print(f'Cancelling {bookings} bookings of one package held by {users} users')
+        run('one-by-one', one_by_one, bookings, users)
+        run('bulk', bulk, bookings, users)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,48 @@
+"""
+Latency of the public tour catalog (GET /api/tourdetails/) with the
+rendered-response cache off, on and cold (a booking between every request),
+and on and warm.
+
+    python -m benchmarks.catalog_cache [tours] [iterations]
+"""
+import sys
+
+from benchmarks.common import bearer_for, benchmark_database, create_user, report, timed
+
+
+def main(tours=2_000, iterations=200):
+    with benchmark_database():
+        from django.test import Client, override_settings
+        from django.utils import timezone
+        from api.catalog_cache import bump_catalog_version
+        from api.models import TourPackage
+
+        user = create_user(username='browser')
+        end_date = timezone.now().date() + timezone.timedelta(days=30)
+        TourPackage.objects.bulk_create(
+            (TourPackage(name=f'Tour {i}', destination='Sylhet', duration=3, price=100 + i,
+                         itinerary='Day 1: arrive. ' * 20, capacity=40, end_date=end_date)
+             for i in range(tours)),
+            batch_size=1000,
+        )
+        client = Client(HTTP_AUTHORIZATION=bearer_for(user))
+
+        def get():
+            response = client.get('/api/tourdetails/', {'page_size': 50})
+            assert response.status_code == 200, response.content
+
+        def get_after_write():
+            bump_catalog_version()
+            get()
+
+        print(f'{tours} tours, 50 per page')
+        with override_settings(API_USAGE_ROLLUPS=False):
+            report('cache off', timed(get, iterations))
+            with override_settings(CATALOG_RESPONSE_CACHE=True):
+                report('cache on, invalidated every request', timed(get_after_write, iterations))
+                get()
+                report('cache on, warm', timed(get, iterations))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
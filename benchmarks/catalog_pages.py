@@ -0,0 +1,59 @@
+"""
+Latency of GET /api/hotels/ at page 1 and page 10,000, with page numbers
+and with keyset cursors.
+
+Page numbers run a COUNT(*) and an OFFSET scan, so deep pages slow down as
+the catalog grows; a cursor seeks on the (created_at, hotel_id) index and
+should cost the same at any depth.
+
+    python -m benchmarks.catalog_pages [hotels] [iterations]
+"""
+import base64
+import json
+import sys
+
+from benchmarks.common import bearer_for, benchmark_database, create_user, report, timed
+
+PAGE_SIZE = 10
+
+
+def cursor_at(offset):
+    """The cursor a client would hold after walking ``offset`` rows"""
+    from api.models import Hotel
+    hotel = Hotel.objects.order_by('-created_at', '-pk')[offset - 1]
+    position = json.dumps([str(hotel.created_at), hotel.pk, 0])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def main(hotels=100_000, iterations=50):
+    with benchmark_database():
+        from django.test import Client, override_settings
+        from api.models import Hotel
+
+        user = create_user(username='catalog')
+        Hotel.objects.bulk_create(
+            (Hotel(hotel_name=f'Hotel {i}', hotel_country='Bangladesh', rating=i % 50 / 10)
+             for i in range(hotels)),
+            batch_size=5000,
+        )
+        client = Client(HTTP_AUTHORIZATION=bearer_for(user))
+        last_page = min(10_000, hotels // PAGE_SIZE)
+
+        def hit(params):
+            def get():
+                response = client.get('/api/hotels/', params)
+                assert response.status_code == 200, response.content
+                assert len(response.json()['results']) == PAGE_SIZE
+            return get
+
+        print(f'{hotels} hotels, {PAGE_SIZE} per page')
+        with override_settings(API_USAGE_ROLLUPS=False):
+            report('page number, page 1', timed(hit({'page': 1}), iterations))
+            report(f'page number, page {last_page}', timed(hit({'page': last_page}), iterations))
+            report('cursor, page 1', timed(hit({'pagination': 'cursor'}), iterations))
+            deep_cursor = cursor_at((last_page - 1) * PAGE_SIZE)
+            report(f'cursor, page {last_page}', timed(hit({'cursor': deep_cursor}), iterations))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,57 @@
+"""
+Throughput and peak Python memory of writing a large file through the
+chunked upload path, per chunk size, and the bytes a client re-sends when
+the connection drops 90% of the way through.
+
+    python -m benchmarks.chunked_uploads [megabytes]
+"""
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import benchmark_database, create_user
+
+
+def main(megabytes=64):
+    with benchmark_database(), tempfile.TemporaryDirectory() as media_root:
+        from django.test import override_settings
+        from api.uploads import complete_upload, start_upload, write_chunk
+
+        data = os.urandom(megabytes * 1024 * 1024)
+        checksum = hashlib.sha256(data).hexdigest()
+        user = create_user()
+        with override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_MAX_SIZE=len(data)):
+            for chunk_size in (1, 8, 32):
+                chunk = chunk_size * 1024 * 1024
+                session = start_upload(user, 'bench.bin', len(data))
+                tracemalloc.start()
+                peak = 0
+                start = time.perf_counter()
+                for offset in range(0, len(data), chunk):
+                    body = io.BytesIO(data[offset:offset + chunk])
+                    length = len(body.getbuffer())
+                    tracemalloc.reset_peak()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    write_chunk(session, offset, body, length)
+                    # Allocated by the write itself, over the request body already in memory
+                    peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+                complete_upload(session, checksum)
+                elapsed = time.perf_counter() - start
+                tracemalloc.stop()
+                print(f'{chunk_size:>3} MiB chunks: {megabytes / elapsed:>7.1f} MiB/s incl. checksum  '
+                      f'peak {peak / 1024:>6.1f} KiB per chunk write')
+
+            resent = {'multipart': len(data) * 0.9}
+            for chunk_size in (1, 8, 32):
+                # Only the chunk in flight is lost
+                resent[f'{chunk_size} MiB chunks'] = min(chunk_size * 1024 * 1024, len(data) * 0.9)
+            for label, amount in resent.items():
+                print(f'resent after a drop at 90%, {label:<14} {amount / 1024 / 1024:>6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,95 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each benchmark runs against a throwaway test database so it never touches
+db.sqlite3. Run them from the project root, e.g.::
+
+    python -m benchmarks.point_buffer
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hotel_api.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-not-for-production-use')
+
+
+@contextmanager
+def benchmark_database(file_backed=False):
+    """
+    Set up Django and a disposable test database for the duration of a run.
+    Threaded benchmarks need ``file_backed=True`` so every thread gets its
+    own SQLite connection to the same database.
+    """
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    if file_backed and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = str(BASE_DIR / 'benchmark.sqlite3')
+        connection.settings_dict['OPTIONS'].update({'timeout': 60, 'transaction_mode': 'IMMEDIATE'})
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        from api.point_buffer import shutdown_point_buffer
+        from api.usage import shutdown_usage_buffer
+
+        # Flush into the test database now, not into db.sqlite3 at exit
+        shutdown_usage_buffer()
+        shutdown_point_buffer()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def create_user(username='bench', points=1_000_000, **extra):
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='bench-password-123',
+        point=points,
+        **extra
+    )
+
+
+def bearer_for(user):
+    from rest_framework_simplejwt.tokens import AccessToken
+    return f'Bearer {AccessToken.for_user(user)}'
+
+
+def timed(func, iterations):
+    """Call func ``iterations`` times and return per-call latencies in seconds"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label, latencies):
+    total = sum(latencies)
+    print(
+        f'{label:<32} {len(latencies) / total:>10.1f} req/s  '
+        f'p50 {percentile(latencies, 50) * 1000:>8.2f} ms  '
+        f'p99 {percentile(latencies, 99) * 1000:>8.2f} ms  '
+        f'mean {statistics.mean(latencies) * 1000:>8.2f} ms'
+    )
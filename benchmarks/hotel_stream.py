@@ -0,0 +1,69 @@
+"""
+Peak memory and time to first byte of POST /api/hotels/search/basic/ with
+100k hotels, buffered and streamed as a JSON array or NDJSON.
+
+Peak memory is measured with tracemalloc around each request while the
+body is consumed chunk by chunk and discarded, the way a proxy would.
+
+    python -m benchmarks.hotel_stream [hotels]
+"""
+import base64
+import gc
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import benchmark_database, create_user
+
+
+def measure(client, path):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.post(path)
+    assert response.status_code == 200, response.status_code
+    size = 0
+    first_byte = None
+    chunks = response.streaming_content if response.streaming else [response.content]
+    for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    del response, chunks
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, first_byte, elapsed, peak
+
+
+def main(hotels=100_000):
+    with benchmark_database():
+        from django.test import Client, override_settings
+        from api.models import Hotel
+
+        create_user(username='streamer')
+        Hotel.objects.bulk_create(
+            (Hotel(hotel_name=f'Hotel {i}', hotel_country='Bangladesh', rating=i % 50 / 10,
+                   description='A quiet place near the river. ' * 8, address=f'{i} Lake Road')
+             for i in range(hotels)),
+            batch_size=5000,
+        )
+        credentials = base64.b64encode(b'streamer:bench-password-123').decode()
+        client = Client(HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+        print(f'{hotels} hotels')
+        with override_settings(API_USAGE_ROLLUPS=False):
+            for label, path in (
+                ('buffered', '/api/hotels/search/basic/'),
+                ('stream=json', '/api/hotels/search/basic/?stream=json'),
+                ('stream=ndjson', '/api/hotels/search/basic/?stream=ndjson'),
+            ):
+                size, first_byte, elapsed, peak = measure(client, path)
+                print(
+                    f'{label:<16} {size / 2**20:>8.1f} MiB body  first byte {first_byte * 1000:>9.1f} ms  '
+                    f'total {elapsed:>7.2f} s  peak memory {peak / 2**20:>8.1f} MiB'
+                )
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
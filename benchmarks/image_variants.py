@@ -0,0 +1,38 @@
+"""
+Cost of rendering the image variants of the sample phone photo in the
+repository root (2590x3236 JPEG, ~1 MB), per image and across the worker
+pool, and the bytes a client downloads per variant.
+
+    python -m benchmarks.image_variants [images]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BASE_DIR, benchmark_database
+
+SAMPLE = BASE_DIR / '20240827_185556.jpg'
+
+
+def main(images=16):
+    with benchmark_database():
+        import io
+        from api.images import render_variants
+
+        data = SAMPLE.read_bytes()
+        rendered = render_variants(io.BytesIO(data))
+        print(f'original {len(data) / 1024:>8.1f} KiB')
+        for name, (width, height, files) in rendered.items():
+            sizes = '  '.join(f'{fmt} {len(body) / 1024:>7.1f} KiB' for fmt, body in files.items())
+            print(f'{name:<8} {width:>4}x{height:<4} {sizes}')
+
+        for workers in (1, 2, 4):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                start = time.perf_counter()
+                list(pool.map(lambda _: render_variants(io.BytesIO(data)), range(images)))
+                elapsed = time.perf_counter() - start
+            print(f'{workers} worker(s): {images / elapsed:>6.2f} images/s  {elapsed / images * 1000:>7.1f} ms/image')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
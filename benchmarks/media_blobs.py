@@ -0,0 +1,72 @@
+"""
+Disk used by the plain and the content-addressed media storage when many
+hotels share a few images (the sample photo in the repository root and
+re-encodings of it), and the cost of serving a blob whole, as a byte range
+and as a revalidation.
+
+    python -m benchmarks.media_blobs [hotels] [distinct images]
+"""
+import io
+import os
+import sys
+import tempfile
+
+from benchmarks.common import BASE_DIR, benchmark_database, report, timed
+
+SAMPLE = BASE_DIR / '20240827_185556.jpg'
+
+STORAGES = {
+    name: {
+        'default': {'BACKEND': backend},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }
+    for name, backend in (
+        ('plain', 'django.core.files.storage.FileSystemStorage'),
+        ('content-addressed', 'api.blobstore.ContentAddressedStorage'),
+    )
+}
+
+
+def disk_usage(root):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def main(hotels=60, distinct=3):
+    with benchmark_database():
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import Client, override_settings
+        from PIL import Image
+        from api.models import Hotel
+
+        images = []
+        with Image.open(SAMPLE) as sample:
+            for quality in range(distinct):
+                buffer = io.BytesIO()
+                sample.save(buffer, 'JPEG', quality=90 - quality * 5)
+                images.append(buffer.getvalue())
+
+        for label, storages in STORAGES.items():
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, STORAGES=storages, IMAGE_VARIANTS_BACKGROUND=False):
+                for i in range(hotels):
+                    Hotel.objects.create(
+                        hotel_name=f'Hotel {i}', hotel_country='Nepal',
+                        primary_picture=SimpleUploadedFile(f'hotel-{i}.jpg', images[i % distinct]),
+                    )
+                print(f'{label:<18} {hotels} hotels, {distinct} distinct images: '
+                      f'{disk_usage(media_root) / 1024 / 1024:>7.1f} MiB on disk')
+
+                if label == 'content-addressed':
+                    client = Client()
+                    url = Hotel.objects.first().primary_picture.url
+                    etag = client.get(url)['ETag']
+                    report('GET whole blob', timed(lambda: b''.join(client.get(url).streaming_content), 200))
+                    report('GET 64 KiB range', timed(
+                        lambda: b''.join(client.get(url, HTTP_RANGE='bytes=0-65535').streaming_content), 200
+                    ))
+                    report('GET If-None-Match (304)', timed(lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), 200))
+                Hotel.objects.all().delete()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
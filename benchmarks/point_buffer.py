@@ -0,0 +1,38 @@
+"""
+Requests/sec through PointDeductionMiddleware with and without the
+write-behind point deduction buffer.
+
+    python -m benchmarks.point_buffer [iterations]
+"""
+import sys
+from unittest import mock
+
+from benchmarks.common import benchmark_database, bearer_for, create_user, report, timed
+
+
+def main(iterations=2000):
+    with benchmark_database():
+        from django.test import Client
+        from api.point_buffer import PointDeductionBuffer
+
+        user = create_user()
+        client = Client(HTTP_AUTHORIZATION=bearer_for(user))
+
+        def hit():
+            client.get('/api/tourdetails/')
+
+        with mock.patch('api.middleware.get_point_buffer', return_value=None):
+            report('direct save()', timed(hit, iterations))
+
+        point_buffer = PointDeductionBuffer(flush_size=500, flush_interval=5.0, background=False)
+        with mock.patch('api.middleware.get_point_buffer', return_value=point_buffer):
+            latencies = timed(hit, iterations)
+            point_buffer.flush()
+        report('write-behind buffer', latencies)
+
+        user.refresh_from_db()
+        print(f'final balance: {user.point:.3f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""
+Rows per second serialized by TourDetailSerializer / TourPackageSerializer
+and by their .values() projections (api/projection.py), for 100-row pages
+of with_availability() packages, with and without the query.
+
+    python -m benchmarks.projection_rows [tours] [iterations]
+"""
+import sys
+import time
+
+from benchmarks.common import benchmark_database
+
+PAGE_SIZE = 100
+
+
+def rows_per_second(func, iterations):
+    func()  # warm up the plan and the query cache
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return PAGE_SIZE * iterations / (time.perf_counter() - start)
+
+
+def main(tours=5_000, iterations=200):
+    with benchmark_database():
+        from django.test import RequestFactory
+        from django.utils import timezone
+        from api.models import TourPackage
+        from api.serializers import (TourDetailSerializer, TourPackageSerializer, tour_detail_projection,
+                                     tour_package_projection)
+
+        end_date = timezone.now().date() + timezone.timedelta(days=30)
+        TourPackage.objects.bulk_create(
+            (TourPackage(name=f'Tour {i}', destination='Sylhet', duration=3, price=100 + i,
+                         itinerary='Day 1: arrive. ' * 20, capacity=40, end_date=end_date,
+                         images=f'tour_images/{i}.jpg', last_booking_date=timezone.now())
+             for i in range(tours)),
+            batch_size=1000,
+        )
+        context = {'request': RequestFactory().get('/api/tourdetails/')}
+        queryset = TourPackage.objects.with_availability().order_by('pk')
+
+        print(f'{PAGE_SIZE} rows per page, {iterations} pages')
+        for serializer_class, projection in (
+            (TourDetailSerializer, tour_detail_projection), (TourPackageSerializer, tour_package_projection),
+        ):
+            instances = list(queryset[:PAGE_SIZE])
+            rows = list(projection.values(queryset)[:PAGE_SIZE])
+            cases = (
+                ('serialize only', lambda: serializer_class(instances, many=True, context=context).data,
+                 lambda: projection.serialize(rows, context)),
+                ('query + serialize',
+                 lambda: serializer_class(list(queryset[:PAGE_SIZE]), many=True, context=context).data,
+                 lambda: projection.serialize(list(projection.values(queryset)[:PAGE_SIZE]), context)),
+            )
+            for label, serializer, projected in cases:
+                slow = rows_per_second(serializer, iterations)
+                fast = rows_per_second(projected, iterations)
+                print(f'{serializer_class.__name__:<22} {label:<18} serializer {slow:>9.0f} rows/s  '
+                      f'projection {fast:>9.0f} rows/s  x{fast / slow:.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
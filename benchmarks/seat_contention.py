@@ -0,0 +1,87 @@
+"""
+Multi-threaded booking contention on a single TourPackage.
+
+Many threads book one seat at a time until the package is full, first with
+the old read-aggregate-then-write flow and then with the atomic
+booked_seats counter. Reports bookings/sec and how many seats were sold
+beyond capacity.
+
+    python -m benchmarks.seat_contention [threads] [capacity]
+"""
+import sys
+import threading
+import time
+
+from benchmarks.common import benchmark_database, create_user
+
+
+def legacy_book(user, package):
+    """The pre-counter flow: aggregate, compare, then write without a transaction"""
+    from django.db.models import Sum
+    from api.models import TourBooking
+
+    booked = package.bookings.aggregate(total=Sum('num_travelers'))['total'] or 0
+    if package.capacity - booked < 1:
+        return False
+    TourBooking.objects.create(user=user, package=package, num_travelers=1)
+    return True
+
+
+def counter_book(user, package):
+    from api.booking import BookingError, book_package
+    try:
+        book_package(user, package, 1)
+        return True
+    except BookingError:
+        return False
+
+
+def run(label, book, threads, capacity):
+    from django.db import close_old_connections, connection
+    from api.models import TourBooking, TourPackage
+
+    package = TourPackage.objects.create(
+        name=label, destination='Benchmark', duration=1, price=1, itinerary='-', capacity=capacity,
+    )
+    users = [create_user(username=f'{label}-{i}'.replace(' ', '-')) for i in range(threads)]
+    start_barrier = threading.Barrier(threads)
+    attempts = []
+
+    def worker(user):
+        from api.models import TourPackage
+        start_barrier.wait()
+        done = 0
+        local_package = TourPackage.objects.get(pk=package.pk)
+        while True:
+            done += 1
+            if not book(user, local_package):
+                break
+        attempts.append(done)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(user,)) for user in users]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    close_old_connections()
+    sold = TourBooking.objects.filter(package=package).count()
+    print(
+        f'{label:<20} threads {threads:>3}  {sold / elapsed:>8.1f} bookings/s  '
+        f'sold {sold:>4} of {capacity}  oversold {max(0, sold - capacity):>3}  attempts {sum(attempts)}'
+    )
+    return sold
+
+
+def main(threads=16, capacity=300):
+    with benchmark_database(file_backed=True):
+        run('legacy aggregate', legacy_book, threads, capacity)
+        sold = run('atomic counter', counter_book, threads, capacity)
+        assert sold <= capacity, 'atomic counter oversold the package'
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,43 @@
+"""
+Payload size and latency of 100-item tour catalog pages (GET
+/api/tourdetails/) with every field, with the lean list default, and with a
+four-field ?fields=, for packages carrying multi-kilobyte text columns.
+
+    python -m benchmarks.sparse_fields [tours] [iterations]
+"""
+import sys
+
+from benchmarks.common import benchmark_database, report, timed
+
+
+def main(tours=5_000, iterations=100):
+    with benchmark_database():
+        from django.test import Client, override_settings
+        from django.utils import timezone
+        from api.models import TourPackage
+
+        end_date = timezone.now().date() + timezone.timedelta(days=30)
+        TourPackage.objects.bulk_create(
+            (TourPackage(name=f'Tour {i}', destination='Sylhet', duration=3, price=100 + i, capacity=40,
+                         end_date=end_date, itinerary='Day 1: tea gardens and a boat ride. ' * 100,
+                         included_items='Meals, guide, transport. ' * 20, highlights='Waterfalls. ' * 40)
+             for i in range(tours)),
+            batch_size=1000,
+        )
+        client = Client()
+        base = '/api/tourdetails/?pagination=cursor&page_size=100'
+
+        print(f'{tours} tours, 100 per page')
+        with override_settings(API_USAGE_ROLLUPS=False):
+            for label, params in (
+                ('every field (?fields=)', '&fields='),
+                ('lean list default', ''),
+                ('?fields=name,price,dates', '&fields=name,price,start_date,end_date'),
+            ):
+                size = len(client.get(base + params).content)
+                latencies = timed(lambda: client.get(base + params), iterations)
+                report(f'{label:<26}{size / 1024:>7.1f} KiB', latencies)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
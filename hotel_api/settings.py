@@ -15,6 +15,7 @@ import os
 from datetime import timedelta
 from dotenv import load_dotenv
 import sys
+from corsheaders.defaults import default_headers
 
 
 # Load environment variables from .env file
@@ -60,7 +61,7 @@ INSTALLED_APPS = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.RequestScopedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -100,6 +101,8 @@ MIDDLEWARE = [
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'upload-offset')
+CORS_EXPOSE_HEADERS = ['X-Points-Charged', 'Idempotent-Replayed', 'X-Catalog-Cache', 'Upload-Offset']
 
 ROOT_URLCONF = 'hotel_api.urls'
 
@@ -132,6 +135,9 @@ DATABASES = {
     }
 }
 
+# Keeps the usage and point write-behind buffers off db.sqlite3 during test runs
+TEST_RUNNER = 'hotel_api.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -174,6 +180,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Store uploaded media once per distinct content under its SHA-256 (api/blobstore.py), reference
+# counted and served from MEDIA_URL/blobs/ with immutable caching. Off keeps the upload_to layout.
+MEDIA_CONTENT_ADDRESSED = os.getenv('MEDIA_CONTENT_ADDRESSED', 'False') == 'True'
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.blobstore.ContentAddressedStorage' if MEDIA_CONTENT_ADDRESSED
+        else 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+MEDIA_BLOB_GC_GRACE = 24 * 60 * 60  # seconds an unreferenced blob is kept before gc_media_blobs removes it
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -187,3 +205,87 @@ DEFAULT_USER_POINTS = 100
 
 # Point deduction per API request
 POINT_DEDUCTION_PER_REQUEST = 0.001
+
+# Points charged per API request, keyed by URL name or full route pattern.
+# Anything not listed costs POINT_DEDUCTION_PER_REQUEST.
+POINT_PRICES = {
+    'hotel-list': 5.0,
+    'hotel-detail': 5.0,
+    'hotel-list-async': 5.0,
+    'hotel-search-basic': 5.0,
+    # Chunk PUTs and offset checks are free so retries on flaky links cost nothing; opening an upload is charged
+    'upload-detail': 0.0,
+}
+
+# Buffer point deductions in memory and write them back in batches
+POINT_DEDUCTION_WRITE_BEHIND = os.getenv('POINT_DEDUCTION_WRITE_BEHIND', 'False') == 'True'
+POINT_DEDUCTION_FLUSH_SIZE = 100
+POINT_DEDUCTION_FLUSH_INTERVAL = 1.0  # seconds
+
+# Rows serialized per chunk when hotel_search_basic_auth streams its response
+HOTEL_STREAM_CHUNK_SIZE = 500
+
+# Verified-credential cache for HTTP Basic authentication (0 disables it)
+BASIC_AUTH_CACHE_TTL = 300  # seconds
+BASIC_AUTH_CACHE_SIZE = 1024
+
+# Serve the read-heavy endpoints with async views (enable when running under ASGI)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# In-memory JWT revocation index, refreshed from the blacklist tables
+TOKEN_REVOCATION_CHECK_INTERVAL = 1.0  # seconds
+TOKEN_REVOCATION_BACKGROUND_WRITES = True
+
+# Per-user, per-route API usage rollups
+API_USAGE_ROLLUPS = True
+USAGE_FLUSH_SIZE = 1000
+USAGE_FLUSH_INTERVAL = 10.0  # seconds
+USAGE_MINUTE_RETENTION_HOURS = 24  # then compacted into hour buckets
+USAGE_HOUR_RETENTION_DAYS = 30  # then compacted into day buckets
+
+# Seat holds for flash sales, granted through a per-package admission queue
+SEAT_HOLD_TTL = 300  # seconds a hold keeps its seats
+SEAT_HOLD_ADMISSION_QUEUE = True
+SEAT_HOLD_QUEUE_TIMEOUT = 10.0  # seconds a request may wait in the queue
+SEAT_HOLD_SOLD_OUT_TTL = 1.0  # seconds a full package is rejected without queueing
+
+# Resized copies of uploaded hotel and tour images (api/images.py), generated on a worker pool
+IMAGE_VARIANT_SIZES = {'thumb': 160, 'small': 480, 'medium': 1024, 'large': 1920}  # longest edge, px
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_BACKGROUND = True
+IMAGE_MAX_PIXELS = 40_000_000  # uploads above this are rejected
+
+# Serve tour package list pages through the .values() projections of their serializers
+# (api/projection.py), which produce the same JSON without building model instances.
+FAST_LIST_SERIALIZERS = os.getenv('FAST_LIST_SERIALIZERS', 'True') == 'True'
+
+# Rendered-response cache for the public tour catalog (tourdetails/, tourpackages/all/).
+# Local memory is per process; set CATALOG_CACHE_DIR to share one file-based cache between workers.
+CATALOG_RESPONSE_CACHE = os.getenv('CATALOG_RESPONSE_CACHE', 'False') == 'True'
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 300  # seconds, bounds staleness in workers that missed an invalidation
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CATALOG_CACHE_DIR'),
+    } if os.getenv('CATALOG_CACHE_DIR') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+}
+
+# Idempotency-Key support for booking and cancellation
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds a stored response is replayed
+IDEMPOTENCY_WAIT_TIMEOUT = 10.0  # seconds a duplicate waits for the first request
+IDEMPOTENCY_LOCK_TIMEOUT = 60.0  # seconds before an unfinished first request is presumed dead
+
+# Resumable chunked uploads (api/uploads.py). Partial files live under MEDIA_ROOT/CHUNKED_UPLOAD_DIR.
+CHUNKED_UPLOAD_DIR = 'uploads/partial'
+CHUNKED_UPLOAD_MAX_SIZE = 200 * 1024 * 1024  # bytes
+CHUNKED_UPLOAD_TTL = 24 * 60 * 60  # seconds since the last chunk before a session is purged
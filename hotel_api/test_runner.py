@@ -0,0 +1,28 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that keeps the process-wide write-behind buffers away
+    from the real database. Usage rollups and buffered point deductions are
+    off unless a test patches in its own buffer, and any buffer that was
+    started anyway is flushed and stopped before the test databases are
+    destroyed, so the exit-time flush has nothing left to write.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._buffer_settings = override_settings(API_USAGE_ROLLUPS=False, POINT_DEDUCTION_WRITE_BEHIND=False)
+        self._buffer_settings.enable()
+
+    def teardown_databases(self, old_config, **kwargs):
+        from api.point_buffer import shutdown_point_buffer
+        from api.usage import shutdown_usage_buffer
+
+        shutdown_usage_buffer()
+        shutdown_point_buffer()
+        super().teardown_databases(old_config, **kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self._buffer_settings.disable()
+        super().teardown_test_environment(**kwargs)
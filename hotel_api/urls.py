@@ -14,10 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+
+from api.blobstore import BLOB_DIR
+from api.media_views import serve_blob
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    # Content-addressed media blobs, see api/blobstore.py
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<name>{BLOB_DIR}/[^/]+/[^/]+)$', serve_blob, name='media-blob'),
 ]